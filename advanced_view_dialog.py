@@ -3,11 +3,20 @@ from PySide6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QPushButton,
     QComboBox, QLineEdit, QTextEdit, QTableWidget, QTableWidgetItem,
     QMessageBox, QLabel, QCheckBox, QTabWidget, QWidget, QGroupBox,
-    QScrollArea
+    QScrollArea, QSpinBox, QDoubleSpinBox
 )
 from PySide6.QtCore import QDate, Qt
 from PySide6.QtWidgets import QDateEdit
-from db import execute_custom_query, get_table_columns, get_connection
+from db import execute_custom_query, get_table_columns, get_read_connection, get_enum_labels, get_last_error
+from estimates import get_table_estimates, estimate_rows, count_exact, format_count
+from estimate_thread import EstimateThread
+from config import PREVIEW_METHOD, PREVIEW_PERCENT, PREVIEW_ROW_LIMIT, PREVIEW_SEED
+
+# Методы TABLESAMPLE для предпросмотра: подпись -> метод
+PREVIEW_METHODS = {
+    "SYSTEM (случайные страницы, быстрее)": "SYSTEM",
+    "BERNOULLI (случайные строки, равномернее)": "BERNOULLI",
+}
 
 
 def quote_ident(name: str) -> str:
@@ -16,13 +25,22 @@ def quote_ident(name: str) -> str:
 
 
 class AdvancedViewDialog(QDialog):
-    """Расширенное окно для работы с данными"""
+    """
+    Расширенное окно для работы с данными
+
+    Вкладки строк и условий (CASE, COALESCE/NULLIF) по умолчанию работают в
+    режиме предпросмотра: выражение считается по TABLESAMPLE с повторяемым
+    зерном и не больше чем на заданном числе строк, чтобы проверить его, не
+    проходя всю таблицу. Запуск по всей таблице - только со снятой галочкой.
+    """
     
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Мастер создания запросов (Advanced View)")
         self.setModal(True)
         self.setMinimumSize(1000, 750)
+        self.table_estimates = get_table_estimates()
+        self.count_thread = None
         
         layout = QVBoxLayout()
         
@@ -54,10 +72,22 @@ class AdvancedViewDialog(QDialog):
         tabs.addTab(tab_logic, "Логика и Условия")
         self.setup_logic_tab(tab_logic)
         
+        # Вкладка 6: Статистика (NumPy)
+        tab_stats = QWidget()
+        tabs.addTab(tab_stats, "Статистика")
+        self.setup_stats_tab(tab_stats)
+        
         layout.addWidget(tabs)
         
+        # Предпросмотр на выборке - для вкладок строк и условий
+        self.preview_tabs = (tab_strings, tab_logic)
+        self.setup_preview_group(layout)
+        tabs.currentChanged.connect(lambda index: self.preview_group.setVisible(tabs.widget(index) in self.preview_tabs))
+        self.preview_group.setVisible(tabs.currentWidget() in self.preview_tabs)
+        
         # Таблица для результатов
-        layout.addWidget(QLabel("<b>Результат выполнения:</b>"))
+        self.result_label = QLabel("<b>Результат выполнения:</b>")
+        layout.addWidget(self.result_label)
         self.table = QTableWidget()
         layout.addWidget(self.table)
         
@@ -191,6 +221,17 @@ class AdvancedViewDialog(QDialog):
         btn_execute.clicked.connect(self.execute_select)
         layout.addWidget(btn_execute)
         
+        # Сколько строк вернет запрос - до его выполнения
+        count_layout = QHBoxLayout()
+        btn_estimate = QPushButton("Оценить число строк")
+        btn_estimate.setToolTip("Оценка планировщика (EXPLAIN), запрос не выполняется")
+        btn_estimate.clicked.connect(self.estimate_select)
+        count_layout.addWidget(btn_estimate)
+        self.btn_count_select = QPushButton("Точное число строк (в фоне)")
+        self.btn_count_select.clicked.connect(self.count_select)
+        count_layout.addWidget(self.btn_count_select)
+        layout.addLayout(count_layout)
+        
         layout.addStretch()
     
     def setup_search_tab(self, tab):
@@ -325,12 +366,12 @@ class AdvancedViewDialog(QDialog):
         
         self.join_table1 = QComboBox()
         for table in tables:
-            self.join_table1.addItem(table, table)
+            self.join_table1.addItem(self.table_label(table), table)
         form.addRow("Левая таблица:", self.join_table1)
         
         self.join_table2 = QComboBox()
         for table in tables:
-            self.join_table2.addItem(table, table)
+            self.join_table2.addItem(self.table_label(table), table)
         form.addRow("Правая таблица:", self.join_table2)
         
         # Поля
@@ -421,9 +462,113 @@ class AdvancedViewDialog(QDialog):
         
         layout.addStretch()
     
+    def setup_preview_group(self, layout):
+        """Настройки предпросмотра выражений на выборке (TABLESAMPLE)"""
+        self.preview_group = QGroupBox("Предпросмотр")
+        preview_layout = QHBoxLayout()
+        
+        self.preview_check = QCheckBox("Только выборка из таблицы")
+        self.preview_check.setChecked(True)
+        self.preview_check.setToolTip("Снимите, чтобы выполнить выражение по всей таблице")
+        preview_layout.addWidget(self.preview_check)
+        
+        self.preview_method = QComboBox()
+        for label, method in PREVIEW_METHODS.items():
+            self.preview_method.addItem(label, method)
+        self.preview_method.setCurrentIndex(self.preview_method.findData(PREVIEW_METHOD))
+        preview_layout.addWidget(self.preview_method)
+        
+        self.preview_percent = QDoubleSpinBox()
+        self.preview_percent.setRange(0.01, 100)
+        self.preview_percent.setDecimals(2)
+        self.preview_percent.setValue(PREVIEW_PERCENT)
+        self.preview_percent.setSuffix(" %")
+        preview_layout.addWidget(QLabel("Доля:"))
+        preview_layout.addWidget(self.preview_percent)
+        
+        self.preview_limit = QSpinBox()
+        self.preview_limit.setRange(1, 100000)
+        self.preview_limit.setValue(PREVIEW_ROW_LIMIT)
+        preview_layout.addWidget(QLabel("Не больше строк:"))
+        preview_layout.addWidget(self.preview_limit)
+        
+        self.preview_seed = QSpinBox()
+        self.preview_seed.setRange(0, 2147483647)
+        self.preview_seed.setValue(PREVIEW_SEED)
+        self.preview_seed.setToolTip("С тем же зерном выборка повторяется, пока таблица не изменилась")
+        preview_layout.addWidget(QLabel("Зерно:"))
+        preview_layout.addWidget(self.preview_seed)
+        
+        self.preview_check.toggled.connect(
+            lambda on: [w.setEnabled(on) for w in (self.preview_method, self.preview_percent,
+                                                   self.preview_limit, self.preview_seed)]
+        )
+        preview_layout.addStretch()
+        self.preview_group.setLayout(preview_layout)
+        layout.addWidget(self.preview_group)
+    
+    def setup_stats_tab(self, tab):
+        """Настройка вкладки статистики по экспериментам"""
+        from analytics import METRICS
+
+        layout = QVBoxLayout()
+        tab.setLayout(layout)
+        
+        layout.addWidget(QLabel(
+            "<i>Сводка по таблице experiments: данные выгружаются колонками (бинарный COPY) "
+            "и считаются в NumPy на клиенте.</i>"
+        ))
+        
+        form_group = QGroupBox("Параметры")
+        form = QFormLayout()
+        
+        self.stats_attack_filter = QComboBox()
+        self.stats_attack_filter.addItem("Все типы", None)
+        for label in get_enum_labels("attack_type"):
+            self.stats_attack_filter.addItem(label, label)
+        form.addRow("Тип атаки:", self.stats_attack_filter)
+        
+        self.stats_group_by = QComboBox()
+        self.stats_group_by.addItem("Тип атаки", "attack_type")
+        self.stats_group_by.addItem("Цель (вспомогательная)", "auxiliary_id")
+        form.addRow("Группировать по:", self.stats_group_by)
+        
+        self.stats_metric = QComboBox()
+        for key, label in METRICS.items():
+            self.stats_metric.addItem(label, key)
+        form.addRow("Показатель:", self.stats_metric)
+        
+        self.stats_bins = QSpinBox()
+        self.stats_bins.setRange(2, 200)
+        self.stats_bins.setValue(20)
+        form.addRow("Интервалов гистограммы:", self.stats_bins)
+        
+        self.stats_window = QSpinBox()
+        self.stats_window.setRange(1, 90)
+        self.stats_window.setValue(7)
+        self.stats_window.setSuffix(" дн.")
+        form.addRow("Окно скользящего среднего:", self.stats_window)
+        
+        form_group.setLayout(form)
+        layout.addWidget(form_group)
+        
+        buttons = QHBoxLayout()
+        btn_summary = QPushButton("Сводка по группам")
+        btn_summary.clicked.connect(lambda: self.execute_stats("summary"))
+        buttons.addWidget(btn_summary)
+        btn_hist = QPushButton("Гистограмма")
+        btn_hist.clicked.connect(lambda: self.execute_stats("histogram"))
+        buttons.addWidget(btn_hist)
+        btn_rolling = QPushButton("Интенсивность по дням")
+        btn_rolling.clicked.connect(lambda: self.execute_stats("rolling"))
+        buttons.addWidget(btn_rolling)
+        layout.addLayout(buttons)
+        
+        layout.addStretch()
+    
     def get_schema_tables(self):
         """Получить список таблиц схемы ddos."""
-        conn = get_connection()
+        conn = get_read_connection()
         if not conn:
             return []
         try:
@@ -440,13 +585,18 @@ class AdvancedViewDialog(QDialog):
         except Exception:
             return []
     
+    def table_label(self, table):
+        """Имя таблицы в списке с оценкой числа строк (pg_class.reltuples)."""
+        estimate = self.table_estimates.get(table)
+        return f"{table} ({format_count(estimate)} строк)" if estimate is not None else table
+
     def populate_table_combo(self, combo):
         tables = self.get_schema_tables()
         if not tables:
             tables = ["experiments"]
         combo.clear()
         for table in tables:
-            combo.addItem(table, table)
+            combo.addItem(self.table_label(table), table)
         combo.setCurrentIndex(0)
 
     def populate_column_combo(self, combo, table_name, include_empty=False):
@@ -541,6 +691,44 @@ class AdvancedViewDialog(QDialog):
         else:
             QMessageBox.critical(self, "Ошибка", f"Ошибка выполнения запроса:\n{data}")
     
+    def estimate_select(self):
+        """Оценка планировщика для запроса вкладки SELECT, без выполнения"""
+        estimate = estimate_rows(self.build_select_query())
+        if estimate is None:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось оценить запрос:\n{get_last_error()}")
+            return
+        self.result_label.setText(
+            f"<b>Результат выполнения:</b> запрос вернет {format_count(estimate)} строк (оценка планировщика)"
+        )
+
+    def count_select(self):
+        """Точный count(*) по запросу вкладки SELECT в фоне"""
+        self.btn_count_select.setEnabled(False)
+        self.result_label.setText("<b>Результат выполнения:</b> считаем строки запроса...")
+        self.count_thread = EstimateThread(count_exact, self.build_select_query(), parent=self)
+        self.count_thread.done.connect(self.on_select_counted)
+        self.count_thread.start()
+
+    def done(self, result):
+        # Подсчет идет на своих соединениях и мог бы пережить окно - прерываем его
+        if self.count_thread is not None:
+            self.count_thread.stop()
+            self.count_thread = None
+        super().done(result)
+
+    def on_select_counted(self, count, error, ms):
+        self.count_thread.wait()
+        self.count_thread = None
+        self.btn_count_select.setEnabled(True)
+        if error:
+            self.result_label.setText("<b>Результат выполнения:</b>")
+            QMessageBox.critical(self, "Ошибка", f"Ошибка подсчета:\n{error}")
+            return
+        self.result_label.setText(
+            f"<b>Результат выполнения:</b> запрос вернет {format_count(count, approximate=False)} строк "
+            f"(точно, count(*) за {ms:.0f} мс)"
+        )
+
     def execute_search(self):
         """Выполнить поиск по тексту"""
         column = self.search_column.currentData()
@@ -626,14 +814,48 @@ class AdvancedViewDialog(QDialog):
             expr = f"CONCAT({', '.join(parts)})"
         
         table = self.strings_table_combo.currentData() or "experiments"
-        query = f"SELECT {quote_ident(column)}, {expr} AS result FROM ddos.{quote_ident(table)}"
-        success, data, columns = execute_custom_query(query)
-        
-        if success:
-            self.display_results(data, columns if columns else [])
-        else:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка выполнения:\n{data}")
+        self.execute_preview(f"{quote_ident(column)}, {expr} AS result", table, "Ошибка выполнения")
     
+    def build_preview_query(self, select_list, table):
+        """
+        SELECT выражений по таблице: целиком или, в режиме предпросмотра, по TABLESAMPLE.
+
+        Returns:
+            (запрос, описание предпросмотра или None для запуска по всей таблице)
+        """
+        source = f"ddos.{quote_ident(table)}"
+        if not self.preview_check.isChecked():
+            return f"SELECT {select_list} FROM {source}", None
+        limit = self.preview_limit.value()
+        estimate = self.table_estimates.get(table)
+        if estimate is not None and estimate <= limit:
+            # В маленькой таблице выборка по доле может оказаться пустой
+            return f"SELECT {select_list} FROM {source} LIMIT {limit}", f"первые {limit} строк небольшой таблицы"
+        method = self.preview_method.currentData()
+        percent = self.preview_percent.value()
+        seed = self.preview_seed.value()
+        query = (f"SELECT {select_list} FROM {source} "
+                 f"TABLESAMPLE {method} ({percent:g}) REPEATABLE ({seed}) LIMIT {limit}")
+        return query, f"выборка {method} {percent:g}%, зерно {seed}, не больше {limit} строк"
+
+    def execute_preview(self, select_list, table, error_title):
+        """Выполнить запрос вкладок строк и условий с учетом режима предпросмотра"""
+        query, preview = self.build_preview_query(select_list, table)
+        success, data, cols = execute_custom_query(query)
+        if not success:
+            # При ошибке execute_custom_query возвращает текст ошибки третьим элементом
+            QMessageBox.critical(self, "Ошибка", f"{error_title}:\n{cols}")
+            return
+        if preview and len(data) > self.preview_limit.value():
+            # При шардировании LIMIT действует на каждом узле
+            data = data[:self.preview_limit.value()]
+        self.display_results(data, cols if cols else [])
+        if preview:
+            self.result_label.setText(
+                f"<b>Результат выполнения:</b> {len(data)} строк - предпросмотр ({preview}). "
+                f"Для всей таблицы снимите галочку «Только выборка из таблицы»."
+            )
+
     def execute_join(self):
         """Выполнить JOIN"""
         # Извлекаем тип JOIN из текста (например "INNER JOIN (Только...)")
@@ -691,13 +913,24 @@ class AdvancedViewDialog(QDialog):
         
         case_sql = "CASE " + " ".join(cases) + else_part + " END"
         
-        query = f"SELECT *, {case_sql} AS case_result FROM ddos.{quote_ident(table)}"
-        success, data, cols = execute_custom_query(query)
-        
-        if success:
-            self.display_results(data, cols)
+        self.execute_preview(f"*, {case_sql} AS case_result", table, "Ошибка CASE")
+
+    def execute_stats(self, kind):
+        """Посчитать статистику по experiments и показать в таблице результатов"""
+        import analytics
+
+        data = analytics.fetch_experiment_arrays(self.stats_attack_filter.currentData())
+        if data is None:
+            QMessageBox.critical(self, "Ошибка", get_last_error() or "Нет подключения к БД")
+            return
+        metric = self.stats_metric.currentData()
+        if kind == "summary":
+            rows, cols = analytics.summary_table(data, metric, self.stats_group_by.currentData())
+        elif kind == "histogram":
+            rows, cols = analytics.histogram_table(data, metric, self.stats_bins.value())
         else:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка CASE:\n{data}")
+            rows, cols = analytics.rolling_table(data, self.stats_window.value())
+        self.display_results(rows, cols)
 
     def execute_null_func(self):
         """Выполнить COALESCE или NULLIF"""
@@ -723,16 +956,11 @@ class AdvancedViewDialog(QDialog):
                  return
             expr = f"NULLIF({arg1}, {arg2})"
             
-        query = f"SELECT *, {expr} AS func_result FROM ddos.{quote_ident(table)}"
-        success, data, cols = execute_custom_query(query)
-        
-        if success:
-            self.display_results(data, cols)
-        else:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка выполнения:\n{data}")
+        self.execute_preview(f"*, {expr} AS func_result", table, "Ошибка выполнения")
     
     def display_results(self, data, columns):
         """Отобразить результаты в таблице"""
+        self.result_label.setText(f"<b>Результат выполнения:</b> {len(data) if data else 0} строк")
         if not data:
             self.table.setRowCount(0)
             self.table.setColumnCount(1)
@@ -4,26 +4,18 @@
 import re
 from PySide6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QPushButton,
-    QComboBox, QLineEdit, QTextEdit, QMessageBox, QLabel, QCheckBox
+    QComboBox, QLineEdit, QTextEdit, QMessageBox, QLabel, QCheckBox,
+    QGroupBox, QSpinBox, QTableWidget, QTableWidgetItem, QHeaderView
 )
-from db import execute_alter_table, get_table_columns, get_connection
+from PySide6.QtCore import QThread, QTimer, Signal
+from db import (
+    get_table_columns, get_connection, get_table_locks, get_last_error, release_read_locks, DDLSession
+)
+from config import COLUMN_LABELS, DDL_MAX_BLOCKED, DDL_MONITOR_INTERVAL_MS
 
 #trash...
-# Словарь сопоставления: отображаемое имя ↔ SQL-имя (двустороннее)
-COLUMN_LABELS = {
-    'id': 'ID',
-    'name': 'Название',
-    'attack_type': 'Тип атаки',
-    'packets': 'Пакетов',
-    'duration': 'Длительность',
-    'created_at': 'Дата',
-    'auxiliary_id': 'Инфраструктура',
-    'segment_code': 'Код сегмента',
-    'label': 'Название сегмента',
-    'location': 'Расположение',
-    'purpose': 'Назначение',
-    'criticality': 'Критичность',
-}
+# Отображаемые имена колонок живут в config (нужны и формам ввода/просмотра);
+# здесь - обратное сопоставление для разбора пользовательского ввода
 REVERSE_COLUMN_LABELS = {v.lower(): k for k, v in COLUMN_LABELS.items()}
 
 def resolve_column_name(user_text):
@@ -48,8 +40,44 @@ def normalize_expression(expr: str) -> str:
         expr = pattern.sub(sql_name, expr)
     return expr
 
+LOCK_HEADERS = ["Узел", "PID", "Приложение", "Состояние", "Режим", "Получена", "Транзакция, с", "Ждет PID", "Запрос"]
+
+
+def blocked_by_ddl(locks, ddl_pids):
+    """Сессии, которые стоят в очереди за нашим DDL (на том же узле)."""
+    return [lock for lock in locks
+            if not lock['granted'] and ddl_pids.get(lock['node']) in (lock['blocked_by'] or [])]
+
+
+def ddl_waiting(locks, ddl_pids):
+    """Ждет ли наш DDL блокировку хотя бы на одном узле."""
+    return any(not lock['granted'] and ddl_pids.get(lock['node']) == lock['pid'] for lock in locks)
+
+
+class DDLThread(QThread):
+    """Выполнение DDL в фоне, чтобы окно могло следить за блокировками и отменить его."""
+    done = Signal(bool, str)
+
+    def __init__(self, session, sql, parent=None):
+        super().__init__(parent)
+        self.session = session
+        self.sql = sql
+
+    def run(self):
+        self.done.emit(*self.session.run(self.sql))
+
+
 class AlterTableDialog(QDialog):
-    """Окно для изменения структуры таблицы"""
+    """
+    Окно для изменения структуры таблицы
+
+    ALTER TABLE берет ACCESS EXCLUSIVE: пока таблицу читает долгий отчет,
+    команда ждет, а все новые запросы к таблице (в том числе вставки
+    сервиса приема) встают в очередь уже за ней. Поэтому окно показывает
+    блокировки выбранной таблицы до запуска и пока команда ждет, а если
+    за ожидающей командой скопилось больше заданного числа сессий,
+    отменяет ее.
+    """
     
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -94,24 +122,62 @@ class AlterTableDialog(QDialog):
         self.sql_preview.setMaximumHeight(100)
         self.sql_preview.setReadOnly(True)
         layout.addWidget(self.sql_preview)
+
+        # Блокировки таблицы: кто держит, кто ждет и кого ждет
+        locks_group = QGroupBox("Блокировки таблицы")
+        locks_layout = QVBoxLayout()
+        limit_row = QHBoxLayout()
+        limit_row.addWidget(QLabel("Отменить команду, если за ней ждет сессий больше:"))
+        self.max_blocked_spin = QSpinBox()
+        self.max_blocked_spin.setRange(0, 1000)
+        self.max_blocked_spin.setValue(DDL_MAX_BLOCKED)
+        limit_row.addWidget(self.max_blocked_spin)
+        limit_row.addStretch()
+        locks_layout.addLayout(limit_row)
+        self.locks_status = QLabel()
+        self.locks_status.setWordWrap(True)
+        locks_layout.addWidget(self.locks_status)
+        self.locks_table = QTableWidget()
+        self.locks_table.setColumnCount(len(LOCK_HEADERS))
+        self.locks_table.setHorizontalHeaderLabels(LOCK_HEADERS)
+        self.locks_table.horizontalHeader().setSectionResizeMode(len(LOCK_HEADERS) - 1, QHeaderView.Stretch)
+        self.locks_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        locks_layout.addWidget(self.locks_table)
+        locks_group.setLayout(locks_layout)
+        layout.addWidget(locks_group)
         
         # Кнопки
         buttons = QHBoxLayout()
         btn_preview = QPushButton("Предпросмотр SQL")
         btn_preview.clicked.connect(self.preview_sql)
-        btn_execute = QPushButton("Выполнить")
-        btn_execute.clicked.connect(self.execute)
+        self.btn_execute = QPushButton("Выполнить")
+        self.btn_execute.clicked.connect(self.execute)
+        self.btn_abort = QPushButton("Прервать")
+        self.btn_abort.setEnabled(False)
+        self.btn_abort.clicked.connect(lambda: self.abort("остановлено пользователем"))
         btn_cancel = QPushButton("Отмена")
         btn_cancel.clicked.connect(self.reject)
         
         buttons.addWidget(btn_preview)
-        buttons.addWidget(btn_execute)
+        buttons.addWidget(self.btn_execute)
+        buttons.addWidget(self.btn_abort)
         buttons.addWidget(btn_cancel)
         layout.addLayout(buttons)
         
         self.setLayout(layout)
+        self.ddl_session = None   # DDLSession выполняющейся команды
+        self.ddl_thread = None
+        self.abort_reason = None
         self.update_form()
 
+        # Блокировки опрашиваются все время, пока окно открыто
+        self.locks_timer = QTimer(self)
+        self.locks_timer.setInterval(DDL_MONITOR_INTERVAL_MS)
+        self.locks_timer.timeout.connect(self.refresh_locks)
+        self.locks_timer.start()
+        self.table_combo.currentTextChanged.connect(self.refresh_locks)
+        self.refresh_locks()
+
     def populate_tables(self):
         """Заполнить список таблиц"""
         tables = self.get_existing_tables()
@@ -451,16 +517,130 @@ class AlterTableDialog(QDialog):
         else:
             QMessageBox.warning(self, "Ошибка", "Заполните все поля")
     
+    def refresh_locks(self):
+        """Перечитать блокировки таблицы; если наш DDL ждет и за ним очередь больше лимита - отменить."""
+        if self.ddl_session is not None and self.abort_reason is not None:
+            # Отмена теряется, если пришла до начала команды на сервере, - повторяем
+            self.ddl_session.cancel()
+        table = self.get_effective_table()
+        if not table:
+            return
+        locks = get_table_locks(table)
+        error = get_last_error()
+        ddl_pids = self.ddl_session.pids() if self.ddl_session else {}
+        self.render_locks(locks, ddl_pids)
+        if error:
+            # Без связи с БД каждый опрос ждал бы повторов подключения - до смены таблицы не опрашиваем
+            if not self.ddl_session:
+                self.locks_timer.stop()
+            self.locks_status.setText(f"Блокировки не прочитаны: {error}")
+            return
+        self.locks_timer.start()
+
+        if not self.ddl_session:
+            holders = [lock for lock in locks if lock['granted']]
+            if holders:
+                longest = max(lock['xact_seconds'] or 0 for lock in holders)
+                self.locks_status.setText(
+                    f"Таблицу сейчас используют сессий: {len({(l['node'], l['pid']) for l in holders})} "
+                    f"(самая долгая транзакция {longest:.0f} с). ALTER будет ждать их завершения, "
+                    f"а новые запросы к таблице - ждать ALTER."
+                )
+            else:
+                self.locks_status.setText("Таблица свободна: ALTER получит блокировку сразу.")
+            return
+
+        blocked = blocked_by_ddl(locks, ddl_pids)
+        waiting = ddl_waiting(locks, ddl_pids)
+        limit = self.max_blocked_spin.value()
+        state = "ждет блокировку" if waiting else "выполняется"
+        self.locks_status.setText(f"Команда {state}; за ней в очереди сессий: {len(blocked)} (лимит {limit}).")
+        if waiting and len(blocked) > limit:
+            self.abort(f"за ожидающей командой скопилось сессий: {len(blocked)} (лимит {limit})")
+
+    def render_locks(self, locks, ddl_pids):
+        own = {(node, pid) for node, pid in ddl_pids.items()}
+        self.locks_table.setRowCount(len(locks))
+        for row, lock in enumerate(locks):
+            application = lock['application'] or ""
+            if (lock['node'], lock['pid']) in own:
+                application = "этот ALTER"
+            values = [
+                str(lock['node']),
+                str(lock['pid']),
+                application,
+                lock['state'] or "",
+                lock['mode'],
+                "да" if lock['granted'] else "ждет",
+                f"{lock['xact_seconds']:.1f}" if lock['xact_seconds'] is not None else "",
+                ", ".join(str(pid) for pid in lock['blocked_by'] or []),
+                " ".join((lock['query'] or "").split()),
+            ]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col == len(values) - 1:
+                    item.setToolTip(lock['query'] or "")
+                self.locks_table.setItem(row, col, item)
+
+    def abort(self, reason):
+        """Отменить выполняющийся DDL (результат придет в on_ddl_done)."""
+        if self.ddl_session is None or self.abort_reason is not None:
+            return
+        self.abort_reason = reason
+        self.locks_status.setText(f"Отмена команды: {reason}")
+        self.ddl_session.cancel()
+
     def execute(self):
-        """Выполнить команду ALTER TABLE"""
+        """Выполнить команду ALTER TABLE в фоне, следя за блокировками"""
         sql = self.build_sql()
         if not sql:
             QMessageBox.warning(self, "Ошибка", "Заполните все поля")
             return
-        
-        success, msg = execute_alter_table(sql)
+        if self.ddl_session is not None:
+            return
+
+        holders = [lock for lock in get_table_locks(self.get_effective_table()) if lock['granted']]
+        if holders:
+            reply = QMessageBox.question(
+                self, "Таблица занята",
+                f"Таблицу сейчас используют сессий: {len({(l['node'], l['pid']) for l in holders})}.\n"
+                "ALTER встанет в очередь за ними, а новые запросы к таблице - за ALTER.\n"
+                f"Команда будет отменена, если за ней соберется больше {self.max_blocked_spin.value()} сессий.\n\n"
+                "Выполнить?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+
+        # Свои транзакции чтения закрываем, иначе ALTER ждал бы само приложение
+        release_read_locks()
+        self.abort_reason = None
+        self.ddl_session = DDLSession()
+        self.ddl_thread = DDLThread(self.ddl_session, sql, self)
+        self.ddl_thread.done.connect(self.on_ddl_done)
+        self.btn_execute.setEnabled(False)
+        self.btn_abort.setEnabled(True)
+        self.ddl_thread.start()
+
+    def on_ddl_done(self, success, msg):
+        reason = self.abort_reason
+        self.ddl_thread.wait()
+        self.ddl_session = None
+        self.ddl_thread = None
+        self.btn_execute.setEnabled(True)
+        self.btn_abort.setEnabled(False)
+        self.refresh_locks()
         if success:
             QMessageBox.information(self, "Успех", msg)
             self.accept()
+        elif reason:
+            QMessageBox.warning(self, "Команда отменена", f"ALTER TABLE отменен: {reason}")
         else:
             QMessageBox.critical(self, "Ошибка", f"Ошибка выполнения:\n{msg}")
+
+    def reject(self):
+        # Закрыть окно, пока DDL ждет, можно только отменив его
+        if self.ddl_session is not None:
+            self.abort("окно закрыто")
+            return
+        super().reject()
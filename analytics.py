@@ -0,0 +1,330 @@
+"""
+Векторная аналитика по ddos.experiments (NumPy)
+
+Данные забираются из PostgreSQL через COPY ... TO STDOUT (FORMAT binary)
+и разбираются сразу в массивы NumPy (np.frombuffer со структурным dtype),
+без создания кортежа и Python-объекта на каждую ячейку. Все расчеты
+(сводка по группам, перцентили, гистограммы, скользящая интенсивность)
+выполняются над массивами целиком.
+"""
+import io
+import logging
+
+import numpy as np
+import psycopg2.extensions
+
+from db import (
+    get_read_connection, get_all_shard_connections, is_sharded, retry_read,
+    is_connection_error, read_failed, rollback_quietly, get_enum_labels,
+    get_auxiliary_items
+)
+
+# Сигнатура заголовка бинарного COPY и размер фиксированной части заголовка
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+COPY_HEADER_SIZE = 19
+
+# Колонки выгрузки: имя, тип в бинарном формате PostgreSQL (big-endian) и SQL-выражение.
+# Все значения фиксированной ширины и без NULL, поэтому каждая строка COPY
+# имеет одинаковый размер и весь поток читается одним np.frombuffer.
+# NULL заменяется значением, которого не бывает в данных (NaN или -1 при CHECK > 0),
+# и такие строки не попадают в расчеты.
+EXPERIMENT_FIELDS = [
+    ("attack_type", ">i4",
+     "coalesce(array_position(enum_range(NULL::ddos.attack_type), e.attack_type) - 1, -1)::int4"),
+    ("packets", ">i4", "coalesce(e.packets, -1)::int4"),
+    ("duration", ">f8", "coalesce(e.duration::float8, 'NaN')"),
+    ("created_at", ">f8", "coalesce(extract(epoch FROM e.created_at), 'NaN')::float8"),
+    ("auxiliary_id", ">i4", "coalesce(e.auxiliary_id, -1)::int4"),
+]
+
+# Метрики, доступные для сводки и гистограммы: ключ -> подпись
+METRICS = {
+    "packets": "Пакеты",
+    "duration": "Длительность, с",
+    "rate": "Пакетов в секунду",
+}
+
+SECONDS_PER_DAY = 86400
+
+
+class ExperimentArrays:
+    """
+    Эксперименты в виде колонок NumPy.
+
+    attack_type: коды ENUM (индекс в attack_labels, -1 - нет значения)
+    packets, duration: пакеты (-1 - нет значения) и длительность (NaN - нет значения)
+    created_at: время создания в секундах Unix (NaN - нет даты)
+    auxiliary_id: id цели (-1 - не указана), подписи в auxiliary_labels
+    """
+
+    def __init__(self, columns, attack_labels, auxiliary_labels):
+        self.attack_type = columns["attack_type"]
+        self.packets = columns["packets"]
+        self.duration = columns["duration"]
+        self.created_at = columns["created_at"]
+        self.auxiliary_id = columns["auxiliary_id"]
+        self.attack_labels = attack_labels
+        self.auxiliary_labels = auxiliary_labels
+
+    def __len__(self):
+        return len(self.packets)
+
+    def rate(self):
+        """Пакетов в секунду для каждого эксперимента (NaN, если нет пакетов или длительности)."""
+        rate = np.full(len(self), np.nan)
+        np.divide(self.packets, self.duration, out=rate, where=(self.packets >= 0) & (self.duration > 0))
+        return rate
+
+    def metric(self, name):
+        """Значения метрики в float64; отсутствующие - NaN."""
+        if name == "rate":
+            return self.rate()
+        values = getattr(self, name).astype(np.float64)
+        if name == "packets":
+            values[self.packets < 0] = np.nan
+        return values
+
+    def groups(self, by):
+        """Коды групп и функция подписи для группировки by ('attack_type' или 'auxiliary_id')."""
+        if by == "attack_type":
+            labels = self.attack_labels
+            return self.attack_type, lambda code: labels[code] if 0 <= code < len(labels) else "—"
+        labels = self.auxiliary_labels
+        return self.auxiliary_id, lambda code: labels.get(int(code), str(code)) if code >= 0 else "—"
+
+
+def parse_binary_copy(payload, fields):
+    """
+    Разобрать поток COPY (FORMAT binary) со столбцами фиксированной ширины.
+
+    fields: [(имя, dtype big-endian), ...] в порядке столбцов.
+    Returns: {имя: массив в родном порядке байт}
+    """
+    if payload[:len(COPY_SIGNATURE)] != COPY_SIGNATURE:
+        raise ValueError("Неверная сигнатура бинарного COPY")
+    extension = int.from_bytes(payload[15:COPY_HEADER_SIZE], "big")
+    start = COPY_HEADER_SIZE + extension
+    end = len(payload) - 2  # завершающее поле -1 (int16)
+
+    record = [("_count", ">i2")]
+    for name, kind in fields:
+        record += [(f"_len_{name}", ">i4"), (name, kind)]
+    dtype = np.dtype(record)
+    if (end - start) % dtype.itemsize:
+        raise ValueError("Поток COPY содержит строки переменной длины (NULL?)")
+
+    records = np.frombuffer(payload, dtype=dtype, count=(end - start) // dtype.itemsize, offset=start)
+    if len(records) and (records["_count"] != len(fields)).any():
+        raise ValueError("Неожиданное число полей в потоке COPY")
+    result = {}
+    for name, kind in fields:
+        if len(records) and (records[f"_len_{name}"] != np.dtype(kind).itemsize).any():
+            raise ValueError(f"Столбец {name}: NULL или неожиданная ширина значения")
+        result[name] = records[name].astype(np.dtype(kind).newbyteorder("="))
+    return result
+
+
+def copy_binary(connection, query):
+    """Выполнить COPY (query) TO STDOUT в бинарном формате и вернуть байты."""
+    buffer = io.BytesIO()
+    cur = connection.cursor()
+    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buffer)
+    cur.close()
+    return buffer.getvalue()
+
+
+@retry_read(default=lambda: None, connect=get_read_connection)
+def fetch_experiment_arrays(attack_type_filter=None, date_from=None, date_to=None):
+    """
+    Загрузить experiments колонками NumPy через бинарный COPY.
+
+    Фильтры те же, что у get_data. При шардировании выгрузка идет с каждого
+    узла, массивы склеиваются.
+    Returns: ExperimentArrays или None (причина в db.get_last_error()).
+    """
+    conn = get_read_connection()
+    if not conn:
+        return None
+    connections = get_all_shard_connections() if is_sharded() else [conn]
+    try:
+        cur = conn.cursor()
+        conditions = ["TRUE"]
+        params = []
+        if attack_type_filter is not None:
+            conditions.append("e.attack_type = %s")
+            params.append(attack_type_filter)
+        if date_from:
+            conditions.append("e.created_at >= %s::timestamp")
+            params.append(f"{date_from} 00:00:00")
+        if date_to:
+            conditions.append("e.created_at <= %s::timestamp")
+            params.append(f"{date_to} 23:59:59")
+        # COPY не принимает параметры - подставляем их на стороне клиента через mogrify
+        query = cur.mogrify(
+            f"SELECT {', '.join(sql for _, _, sql in EXPERIMENT_FIELDS)} "
+            f"FROM ddos.experiments e WHERE {' AND '.join(conditions)}",
+            params,
+        ).decode(psycopg2.extensions.encodings[conn.encoding])
+        cur.close()
+
+        fields = [(name, kind) for name, kind, _ in EXPERIMENT_FIELDS]
+        parts = [parse_binary_copy(copy_binary(connection, query), fields) for connection in connections]
+        columns = {name: np.concatenate([part[name] for part in parts]) for name, _ in fields}
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        for connection in connections[1:]:
+            rollback_quietly(connection)
+        read_failed("Ошибка выгрузки экспериментов", e, conn)
+        return None
+
+    attack_labels = get_enum_labels("attack_type")
+    auxiliary_labels = {
+        item["id"]: f"{item['label']} · {item['segment_code']}" for item in get_auxiliary_items()
+    }
+    logging.info(f"Выгружено экспериментов для аналитики: {len(columns['packets'])}")
+    return ExperimentArrays(columns, attack_labels, auxiliary_labels)
+
+
+def grouped_stats(codes, values, percentiles=(50, 90, 99)):
+    """
+    Сводка по группам без цикла по строкам.
+
+    Значения сортируются один раз по (группа, значение); минимум, максимум
+    и перцентили берутся по позициям внутри отсортированных отрезков групп
+    (линейная интерполяция, как np.percentile). NaN в values пропускаются.
+
+    Returns:
+        (коды групп, {'count', 'sum', 'mean', 'min', 'max', 'p50', ...: массивы})
+    """
+    valid = ~np.isnan(values)
+    codes = codes[valid]
+    values = values[valid]
+    if not len(values):
+        return np.array([], dtype=codes.dtype), {}
+
+    group_codes, inverse = np.unique(codes, return_inverse=True)
+    counts = np.bincount(inverse)
+    sums = np.bincount(inverse, weights=values)
+
+    sorted_values = values[np.lexsort((values, inverse))]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    stats = {
+        "count": counts,
+        "sum": sums,
+        "mean": sums / counts,
+        "min": sorted_values[starts],
+        "max": sorted_values[starts + counts - 1],
+    }
+    for q in percentiles:
+        position = starts + (counts - 1) * (q / 100.0)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        fraction = position - low
+        stats[f"p{q}"] = sorted_values[low] * (1 - fraction) + sorted_values[high] * fraction
+    return group_codes, stats
+
+
+def histogram_rows(values, bins=20):
+    """Гистограмма значений. Returns: [(интервал, количество, доля %), ...]"""
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return []
+    counts, edges = np.histogram(values, bins=bins)
+    shares = counts / counts.sum() * 100
+    return [
+        (f"{edges[i]:.2f} – {edges[i + 1]:.2f}", int(counts[i]), round(float(shares[i]), 1))
+        for i in range(len(counts))
+    ]
+
+
+def rolling_rates(created_at, packets, duration, window_days=7):
+    """
+    Дневная и скользящая интенсивность атак.
+
+    Эксперименты раскладываются по дням (np.bincount), скользящие суммы
+    за window_days считаются сверткой. Интенсивность - суммарные пакеты,
+    деленные на суммарную длительность за период, по экспериментам, где
+    известны оба значения (NaN в packets или duration пропускаются).
+
+    Returns:
+        (дни datetime64[D], {'experiments', 'packets', 'rate', 'rolling_experiments', 'rolling_rate': массивы})
+    """
+    valid = ~np.isnan(created_at)
+    if not valid.any():
+        return np.array([], dtype="datetime64[D]"), {}
+    days = np.floor(created_at[valid] / SECONDS_PER_DAY).astype(np.int64)
+    first = days.min()
+    index = days - first
+    size = int(index.max()) + 1
+
+    packets = packets[valid]
+    duration = duration[valid]
+    known = ~np.isnan(packets) & ~np.isnan(duration)
+
+    experiments = np.bincount(index, minlength=size).astype(np.float64)
+    packets_per_day = np.bincount(index, weights=np.nan_to_num(packets), minlength=size)
+    rate_packets = np.bincount(index, weights=np.where(known, packets, 0), minlength=size)
+    seconds_per_day = np.bincount(index, weights=np.where(known, duration, 0), minlength=size)
+
+    kernel = np.ones(window_days)
+    rolling_packets = np.convolve(rate_packets, kernel)[:size]
+    rolling_seconds = np.convolve(seconds_per_day, kernel)[:size]
+    # В первые дни окно еще неполное - делим на фактическое число дней
+    window_len = np.minimum(np.arange(1, size + 1), window_days)
+
+    def safe_divide(a, b):
+        out = np.full(size, np.nan)
+        np.divide(a, b, out=out, where=b > 0)
+        return out
+
+    series = {
+        "experiments": experiments,
+        "packets": packets_per_day,
+        "rate": safe_divide(rate_packets, seconds_per_day),
+        "rolling_experiments": np.convolve(experiments, kernel)[:size] / window_len,
+        "rolling_rate": safe_divide(rolling_packets, rolling_seconds),
+    }
+    dates = (first + np.arange(size)).astype("datetime64[D]")
+    return dates, series
+
+
+def format_number(value):
+    """Число для таблицы: целые без дробной части, NaN - пусто."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
+
+
+def summary_table(data, metric="packets", by="attack_type", percentiles=(50, 90, 99)):
+    """Сводка по группам в виде строк для таблицы результатов. Returns: (rows, columns)"""
+    codes, label = data.groups(by)
+    group_codes, stats = grouped_stats(codes, data.metric(metric), percentiles)
+    keys = ["count", "sum", "mean", "min", "max"] + [f"p{q}" for q in percentiles]
+    columns = ["Группа", "Количество", "Сумма", "Среднее", "Мин", "Макс"] + [f"P{q}" for q in percentiles]
+    rows = [
+        tuple([label(code)] + [format_number(stats[key][i]) for key in keys])
+        for i, code in enumerate(group_codes)
+    ]
+    return rows, columns
+
+
+def histogram_table(data, metric="packets", bins=20):
+    """Гистограмма метрики в виде строк для таблицы результатов. Returns: (rows, columns)"""
+    return histogram_rows(data.metric(metric), bins), ["Интервал", "Количество", "Доля, %"]
+
+
+def rolling_table(data, window_days=7):
+    """Дневная и скользящая интенсивность в виде строк для таблицы результатов. Returns: (rows, columns)"""
+    dates, series = rolling_rates(data.created_at, data.metric("packets"), data.metric("duration"), window_days)
+    columns = [
+        "День", "Экспериментов", "Пакетов", "Пакетов/с за день",
+        f"Экспериментов в день ({window_days} дн.)", f"Пакетов/с ({window_days} дн.)",
+    ]
+    keys = ["experiments", "packets", "rate", "rolling_experiments", "rolling_rate"]
+    rows = [
+        tuple([str(day)] + [format_number(series[key][i]) for key in keys])
+        for i, day in enumerate(dates)
+    ]
+    return rows, columns
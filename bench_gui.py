@@ -0,0 +1,214 @@
+"""
+Бенчмарк отрисовки таблиц результатов (без реальной БД)
+
+Запускает окна ViewDialog и AdvancedViewDialog в offscreen-режиме Qt
+и подает в них синтетические наборы данных разного размера.
+Для каждого случая измеряется:
+- время до первой отрисовки таблицы (time-to-first-paint);
+- время заполнения таблицы (load_data / display_results);
+- пиковое потребление памяти процесса (peak RSS).
+
+Каждый случай выполняется в отдельном процессе, чтобы пиковый RSS
+относился только к нему.
+
+Примеры:
+    python bench_gui.py
+    python bench_gui.py --rows 1000 10000 --dialogs view --repeat 5
+    python bench_gui.py --json bench_gui.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import statistics
+import subprocess
+from decimal import Decimal
+from datetime import datetime, timedelta
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from config import ATTACK_TYPES
+
+DEFAULT_ROWS = [100, 1000, 10000, 50000]
+DIALOGS = ["view", "advanced"]
+COLUMNS = ["id", "name", "attack_type", "packets", "duration", "created_at", "auxiliary_id"]
+PAINT_TIMEOUT = 30.0
+
+
+def make_rows(count, seed=42, auxiliary_labels=False):
+    """
+    Сгенерировать синтетические строки в формате ddos.experiments.
+
+    auxiliary_labels: подставить в auxiliary_id готовую подпись цели,
+        как ее возвращает get_data(..., auxiliary_labels=True)
+    """
+    rnd = random.Random(seed)
+    now = datetime(2025, 1, 1)
+    if auxiliary_labels:
+        aux = [f"{item['label']} · {item['segment_code']} ({item['criticality']})" for item in make_aux_items()]
+        aux.append(None)
+    else:
+        aux = [1, 2, 3, None]
+    rows = []
+    for i in range(count):
+        rows.append((
+            i + 1,
+            f"Bench_{i}_{rnd.randint(1000, 9999)}",
+            rnd.choice(ATTACK_TYPES),
+            rnd.randint(100, 50000),
+            Decimal(f"{rnd.uniform(1.0, 60.0):.2f}"),
+            now - timedelta(minutes=rnd.randint(0, 60 * 24 * 30)),
+            rnd.choice(aux),
+        ))
+    return rows
+
+
+def make_aux_items():
+    return [
+        {"id": i, "segment_code": f"SEG-{i}", "label": f"Сегмент {i}",
+         "location": "Bench", "purpose": "Bench", "criticality": "LOW"}
+        for i in (1, 2, 3)
+    ]
+
+
+def peak_rss_mb():
+    """Пиковый RSS процесса в мегабайтах (ru_maxrss в КБ на Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def wait_for_paint(app, widget):
+    """Прокрутить цикл событий до первой отрисовки виджета, вернуть момент отрисовки."""
+    from PySide6.QtCore import QObject, QEvent
+
+    class PaintWatcher(QObject):
+        painted_at = None
+
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and self.painted_at is None:
+                self.painted_at = time.perf_counter()
+            return False
+
+    watcher = PaintWatcher()
+    widget.installEventFilter(watcher)
+    deadline = time.perf_counter() + PAINT_TIMEOUT
+    while watcher.painted_at is None and time.perf_counter() < deadline:
+        app.processEvents()
+    widget.removeEventFilter(watcher)
+    return watcher.painted_at
+
+
+def patch_data_layer(rows):
+    """Подменить функции доступа к БД в модулях окон синтетическими данными."""
+    import view_dialog
+    import input_dialog
+    import advanced_view_dialog
+
+    columns_info = [(col, "text", "YES", None, "text") for col in COLUMNS]
+    view_dialog.get_read_connection = lambda: None
+    view_dialog.get_data = lambda *args, **kwargs: rows
+    view_dialog.get_table_columns = lambda *args, **kwargs: columns_info
+    input_dialog.get_auxiliary_items = make_aux_items
+    advanced_view_dialog.get_read_connection = lambda: None
+    advanced_view_dialog.get_table_columns = lambda *args, **kwargs: columns_info
+
+
+def run_case(dialog_name, row_count, repeat):
+    """Выполнить один случай в текущем процессе и вернуть словарь метрик."""
+    from PySide6.QtWidgets import QApplication
+
+    from resultset import ColumnarResult
+
+    # Данные в том же виде, в каком их отдают get_data и execute_custom_query
+    rows = ColumnarResult.from_rows(make_rows(row_count, auxiliary_labels=(dialog_name == "view")), COLUMNS)
+    app = QApplication.instance() or QApplication(sys.argv)
+    patch_data_layer(rows)
+
+    if dialog_name == "view":
+        from view_dialog import ViewDialog
+        start = time.perf_counter()
+        dialog = ViewDialog()
+        dialog.show()
+        painted_at = wait_for_paint(app, dialog.table.viewport())
+        # Мимо кэша окна: измеряется полная загрузка и заполнение таблицы
+        fill = lambda: dialog.refresh_data()
+    else:
+        from advanced_view_dialog import AdvancedViewDialog
+        dialog = AdvancedViewDialog()
+        dialog.show()
+        app.processEvents()
+        start = time.perf_counter()
+        dialog.display_results(rows, COLUMNS)
+        painted_at = wait_for_paint(app, dialog.table.viewport())
+        fill = lambda: dialog.display_results(rows, COLUMNS)
+
+    fill_times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fill()
+        fill_times.append((time.perf_counter() - t0) * 1000)
+        app.processEvents()
+
+    dialog.close()
+    return {
+        "dialog": dialog_name,
+        "rows": row_count,
+        "first_paint_ms": round((painted_at - start) * 1000, 2) if painted_at else None,
+        "fill_ms_median": round(statistics.median(fill_times), 2),
+        "fill_ms_min": round(min(fill_times), 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_isolated(dialog_name, row_count, repeat):
+    """Запустить случай в отдельном процессе (чтобы peak RSS не смешивался)."""
+    cmd = [
+        sys.executable, os.path.abspath(__file__),
+        "--case", dialog_name, "--rows", str(row_count), "--repeat", str(repeat),
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Случай {dialog_name}/{row_count} завершился с ошибкой:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def print_table(results):
+    header = f"{'Окно':<10} {'Строк':>8} {'Первая отрисовка, мс':>22} {'Заполнение, мс':>16} {'Peak RSS, МБ':>14}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        first_paint = r["first_paint_ms"] if r["first_paint_ms"] is not None else "—"
+        print(f"{r['dialog']:<10} {r['rows']:>8} {first_paint:>22} {r['fill_ms_median']:>16} {r['peak_rss_mb']:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк отрисовки таблиц результатов")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS,
+                        help="Размеры синтетических наборов данных")
+    parser.add_argument("--dialogs", nargs="+", choices=DIALOGS, default=DIALOGS,
+                        help="Какие окна измерять")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Количество повторных заполнений для медианы")
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON-файл")
+    parser.add_argument("--case", choices=DIALOGS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        # Внутренний режим: один случай в текущем процессе
+        print(json.dumps(run_case(args.case, args.rows[0], args.repeat)))
+        return
+
+    results = []
+    for dialog_name in args.dialogs:
+        for row_count in args.rows:
+            results.append(run_isolated(dialog_name, row_count, args.repeat))
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Нагрузочный генератор для сервиса приема (ingest_service.py)
+
+Несколько асинхронных клиентов по постоянным (keep-alive) соединениям
+отправляют пачки случайных записей в POST /experiments. На 503 клиент
+ждет Retry-After и повторяет ту же пачку. После отправки генератор ждет,
+пока очередь сервиса опустеет, и считает:
+- пропускную способность приема (строк/с на стороне HTTP);
+- задержку POST (медиана, p95, максимум);
+- сквозную пропускную способность до записи в БД;
+- число отказов 503 (сработало обратное давление).
+
+Примеры:
+    python bench_ingest.py --spawn
+    python bench_ingest.py --clients 16 --batch 1000 --requests 50
+    python bench_ingest.py --port 8085 --json bench_ingest.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+
+from config import ATTACK_TYPES, INGEST_HOST, INGEST_PORT
+
+DRAIN_TIMEOUT = 120.0
+
+
+async def http_request(reader, writer, method, path, payload=None):
+    """Отправить запрос по открытому соединению, вернуть (статус, заголовки, JSON-ответ)."""
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    data = await reader.readexactly(int(headers.get("content-length") or 0))
+    return status, headers, json.loads(data) if data else None
+
+
+def make_records(prefix, count, rnd):
+    now = datetime.now()
+    return [{
+        "name": f"{prefix}_{i}",
+        "attack_type": rnd.choice(ATTACK_TYPES),
+        "packets": rnd.randint(100, 50000),
+        "duration": round(rnd.uniform(1.0, 60.0), 2),
+        "created_at": (now - timedelta(minutes=rnd.randint(0, 60 * 24 * 30))).isoformat(timespec="seconds"),
+    } for i in range(count)]
+
+
+async def client(host, port, client_id, run_id, requests, batch, latencies, counters):
+    rnd = random.Random(client_id)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for seq in range(requests):
+            records = make_records(f"Load_{run_id}_{client_id}_{seq}", batch, rnd)
+            while True:
+                t0 = time.perf_counter()
+                status, headers, _ = await http_request(reader, writer, "POST", "/experiments", records)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                if status != 503:
+                    break
+                counters["busy"] += 1
+                await asyncio.sleep(float(headers.get("retry-after", 1)))
+            if status == 202:
+                counters["sent"] += batch
+            else:
+                counters["errors"] += 1
+    finally:
+        writer.close()
+
+
+async def wait_drained(host, port):
+    """Дождаться, пока очередь сервиса опустеет; вернуть его счетчики."""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        deadline = time.perf_counter() + DRAIN_TIMEOUT
+        while True:
+            _, _, stats = await http_request(reader, writer, "GET", "/stats")
+            if stats["queued"] == 0 or time.perf_counter() > deadline:
+                return stats
+            await asyncio.sleep(0.05)
+    finally:
+        writer.close()
+
+
+async def run(args):
+    run_id = f"{os.getpid()}{int(time.time()) % 100000}"
+    latencies = []
+    counters = {"sent": 0, "busy": 0, "errors": 0}
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    _, _, before = await http_request(reader, writer, "GET", "/stats")
+    writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(args.host, args.port, i, run_id, args.requests, args.batch, latencies, counters)
+        for i in range(args.clients)
+    ))
+    sent_at = time.perf_counter()
+    after = await wait_drained(args.host, args.port)
+    drained_at = time.perf_counter()
+
+    written = after["written"] - before["written"]
+    latencies.sort()
+    return {
+        "clients": args.clients,
+        "batch": args.batch,
+        "rows_sent": counters["sent"],
+        "accept_rows_per_s": round(counters["sent"] / (sent_at - start)),
+        "post_ms_median": round(statistics.median(latencies), 2),
+        "post_ms_p95": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "post_ms_max": round(latencies[-1], 2),
+        "busy_503": counters["busy"],
+        "errors": counters["errors"],
+        "rows_written": written,
+        "rows_failed": after["failed"] - before["failed"],
+        "end_to_end_rows_per_s": round(written / (drained_at - start)),
+        "flushes": after["flushes"] - before["flushes"],
+    }
+
+
+async def wait_listening(host, port, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def print_result(result):
+    labels = {
+        "rows_sent": "Отправлено строк",
+        "accept_rows_per_s": "Прием, строк/с",
+        "post_ms_median": "POST медиана, мс",
+        "post_ms_p95": "POST p95, мс",
+        "post_ms_max": "POST максимум, мс",
+        "busy_503": "Отказов 503",
+        "errors": "Других ошибок",
+        "rows_written": "Записано в БД",
+        "rows_failed": "Не записано",
+        "end_to_end_rows_per_s": "До БД, строк/с",
+        "flushes": "Пачек COPY",
+    }
+    print(f"Клиентов: {result['clients']}, записей в POST: {result['batch']}")
+    for key, label in labels.items():
+        print(f"{label:<20} {result[key]:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сервиса приема результатов")
+    parser.add_argument("--host", default=INGEST_HOST)
+    parser.add_argument("--port", type=int, default=INGEST_PORT)
+    parser.add_argument("--clients", type=int, default=8, help="Одновременных клиентов")
+    parser.add_argument("--batch", type=int, default=500, help="Записей в одном POST")
+    parser.add_argument("--requests", type=int, default=20, help="POST-запросов от каждого клиента")
+    parser.add_argument("--spawn", action="store_true", help="Запустить сервис в отдельном процессе на время теста")
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON-файл")
+    args = parser.parse_args()
+
+    service = None
+    if args.spawn:
+        service = subprocess.Popen(
+            [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_service.py"),
+             "--host", args.host, "--port", str(args.port)],
+        )
+    try:
+        if service:
+            asyncio.run(wait_listening(args.host, args.port))
+        result = asyncio.run(run(args))
+    finally:
+        if service:
+            service.terminate()
+            service.wait()
+    print_result(result)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
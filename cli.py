@@ -0,0 +1,271 @@
+"""
+Командная строка для пакетных операций с БД (без Qt)
+
+Работает через те же функции db.py, что и окна, но не импортирует PySide6:
+запускается быстро и на серверах без графики.
+
+Примеры:
+    python cli.py create
+    python cli.py align-ids
+    python cli.py generate 10000
+    python cli.py export experiments experiments.csv
+    python cli.py import experiments experiments.csv
+    python cli.py query "SELECT attack_type, count(*) FROM ddos.experiments GROUP BY 1" -o stats.csv
+    python cli.py query --file cleanup.sql
+    python cli.py bench --rows 5000 --repeat 5 --json bench_db.json
+    python cli.py archive --dry-run
+    python cli.py archive-query --from 2023-01-01 --to 2023-06-30 -o old.csv
+    python cli.py restore --from 2023-01-01 --to 2023-01-31 --attack-type SYN_FLOOD
+    python cli.py drop --yes
+
+Файл "-" означает stdin/stdout; сообщения печатаются в stderr.
+Код возврата 0 - успех, 1 - ошибка.
+"""
+import io
+import sys
+import csv
+import json
+import time
+import logging
+import argparse
+import statistics
+from contextlib import contextmanager
+from datetime import datetime
+
+import db
+import retention
+from config import ARCHIVE_DIR
+
+
+def report(success, msg):
+    print(msg, file=sys.stderr)
+    return 0 if success else 1
+
+
+@contextmanager
+def open_text(path, mode):
+    """Открыть файл в текстовом режиме UTF-8; "-" - stdin/stdout."""
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+        return
+    with open(path, mode, encoding="utf-8", newline="") as f:
+        yield f
+
+
+def cmd_create(args):
+    return report(*db.create_schema())
+
+
+def cmd_align_ids(args):
+    return report(*db.align_ids())
+
+
+def cmd_drop(args):
+    if not args.yes:
+        return report(False, "Удаление схемы 'ddos' со всеми данными: повторите с --yes")
+    return report(*db.drop_schema())
+
+
+def cmd_generate(args):
+    return report(*db.generate_test_data(args.count))
+
+
+def cmd_import(args):
+    with open_text(args.file, "r") as f:
+        return report(*db.import_csv(f, args.table))
+
+
+def cmd_export(args):
+    with open_text(args.file, "w") as f:
+        return report(*db.export_csv(f, table_name=args.table))
+
+
+def cmd_query(args):
+    if args.file:
+        with open_text(args.file, "r") as f:
+            query = f.read()
+    elif args.sql:
+        query = args.sql
+    else:
+        return report(False, "Нужен текст запроса или --file")
+    if db.is_select_query(query):
+        with open_text(args.output, "w") as out:
+            return report(*db.export_csv(out, query=query))
+    success, _, msg = db.execute_custom_query(query)
+    return report(success, msg)
+
+
+def timed(func, *args, **kwargs):
+    """Выполнить func и вернуть (результат, мс)."""
+    t0 = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - t0) * 1000
+
+
+def cmd_bench(args):
+    """Замеры записи (generate), чтения (get_data) и выгрузки (COPY TO) на текущей БД."""
+    if not db.schema_exists():
+        return report(False, "Схема не создана: сначала python cli.py create")
+    results = []
+
+    if args.rows:
+        (success, msg), ms = timed(db.generate_test_data, args.rows)
+        if not success:
+            return report(False, msg)
+        results.append({"case": "generate", "rows": args.rows, "ms": round(ms, 2),
+                        "rows_per_s": round(args.rows / ms * 1000)})
+
+    read_times = []
+    rows = []
+    for _ in range(args.repeat):
+        rows, ms = timed(db.get_data)
+        read_times.append(ms)
+    results.append({"case": "get_data", "rows": len(rows), "ms": round(statistics.median(read_times), 2),
+                    "rows_per_s": round(len(rows) / statistics.median(read_times) * 1000)})
+
+    export_times = []
+    for _ in range(args.repeat):
+        (success, msg), ms = timed(db.export_csv, io.StringIO(), table_name="experiments")
+        if not success:
+            return report(False, msg)
+        export_times.append(ms)
+    results.append({"case": "export_csv", "rows": len(rows), "ms": round(statistics.median(export_times), 2),
+                    "rows_per_s": round(len(rows) / statistics.median(export_times) * 1000)})
+
+    header = f"{'Операция':<12} {'Строк':>8} {'Медиана, мс':>12} {'Строк/с':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['case']:<12} {r['rows']:>8} {r['ms']:>12} {r['rows_per_s']:>10}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+def cmd_archive(args):
+    return report(*retention.archive_expired(directory=args.dir, dry_run=args.dry_run))
+
+
+def cmd_archives(args):
+    archives = retention.list_archives(args.dir)
+    for path, info in archives:
+        print(f"{info['created_from'][:19]}  {info['created_to'][:19]}  {info['attack_type']:<11} "
+              f"узел {info['node']}  {info['rows']:>8} строк  {path}")
+    return report(True, f"Файлов в архиве: {len(archives)}")
+
+
+def cmd_archive_query(args):
+    result = retention.query_archive(args.date_from, args.date_to, args.attack_type, args.dir)
+    if args.output.endswith(".npz"):
+        result.save(args.output, source="archive-query")
+    else:
+        with open_text(args.output, "w") as out:
+            writer = csv.writer(out)
+            writer.writerow(result.columns)
+            writer.writerows(result)
+    return report(True, f"Строк из архива: {len(result)}")
+
+
+def cmd_restore(args):
+    return report(*retention.restore(args.date_from, args.date_to, args.attack_type, args.dir))
+
+
+def positive_int(text):
+    """Тип аргумента argparse: целое не меньше 1."""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"нужно целое не меньше 1: {text}")
+    return value
+
+
+def add_archive_range(p):
+    """Общие аргументы команд чтения и возврата архива."""
+    p.add_argument("--from", dest="date_from", type=datetime.fromisoformat,
+                   help="Начало периода created_at (дата или дата и время, включительно)")
+    p.add_argument("--to", dest="date_to", type=retention.period_end,
+                   help="Конец периода created_at (включительно; дата без времени - весь этот день)")
+    p.add_argument("--attack-type", help="Только этот тип атаки")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Пакетные операции с БД экспериментов без графического интерфейса")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Подробный лог в stderr")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("create", help="Создать схему и таблицы").set_defaults(func=cmd_create)
+
+    p = sub.add_parser("align-ids", help="Сделать id experiments уникальными на всех узлах (DB_SHARDS)")
+    p.set_defaults(func=cmd_align_ids)
+
+    p = sub.add_parser("drop", help="Удалить схему со всеми данными")
+    p.add_argument("--yes", action="store_true", help="Подтвердить удаление")
+    p.set_defaults(func=cmd_drop)
+
+    p = sub.add_parser("generate", help="Сгенерировать случайные эксперименты")
+    p.add_argument("count", type=int, help="Число записей")
+    p.set_defaults(func=cmd_generate)
+
+    p = sub.add_parser("import", help="Загрузить CSV с заголовком в таблицу (COPY)")
+    p.add_argument("table", help="Таблица схемы ddos")
+    p.add_argument("file", help="CSV-файл или - для stdin")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="Выгрузить таблицу в CSV (COPY)")
+    p.add_argument("table", help="Таблица схемы ddos")
+    p.add_argument("file", help="CSV-файл или - для stdout")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("query", help="Выполнить запрос; результат SELECT - в CSV")
+    p.add_argument("sql", nargs="?", help="Текст запроса")
+    p.add_argument("--file", help="Прочитать запрос из файла")
+    p.add_argument("-o", "--output", default="-", help="Куда записать результат SELECT (по умолчанию stdout)")
+    p.set_defaults(func=cmd_query)
+
+    p = sub.add_parser("bench", help="Замерить запись, чтение и выгрузку")
+    p.add_argument("--rows", type=int, default=1000, help="Сколько записей сгенерировать (0 - без записи)")
+    p.add_argument("--repeat", type=positive_int, default=3, help="Повторов чтения и выгрузки для медианы")
+    p.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON-файл")
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("archive", help="Выгрузить строки старше срока хранения (RETENTION_DAYS) в архив и удалить")
+    p.add_argument("--dry-run", action="store_true", help="Только посчитать строки")
+    p.add_argument("--dir", default=ARCHIVE_DIR, help="Каталог архива")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("archives", help="Список файлов архива")
+    p.add_argument("--dir", default=ARCHIVE_DIR, help="Каталог архива")
+    p.set_defaults(func=cmd_archives)
+
+    p = sub.add_parser("archive-query", help="Строки архива за период - в CSV (или .npz)")
+    add_archive_range(p)
+    p.add_argument("-o", "--output", default="-", help="Файл результата (по умолчанию CSV в stdout)")
+    p.add_argument("--dir", default=ARCHIVE_DIR, help="Каталог архива")
+    p.set_defaults(func=cmd_archive_query)
+
+    p = sub.add_parser("restore", help="Вернуть в таблицу архивные файлы за период")
+    add_archive_range(p)
+    p.add_argument("--dir", default=ARCHIVE_DIR, help="Каталог архива")
+    p.set_defaults(func=cmd_restore)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        stream=sys.stderr,
+    )
+    try:
+        code = args.func(args)
+    except OSError as e:
+        return report(False, f"Ошибка файла: {e}")
+    # ANALYZE после больших записей идет в фоне - процесс не должен выйти раньше
+    from maintenance import scheduler
+    scheduler.wait_idle()
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,15 +2,147 @@
 Конфигурация приложения
 """
 #sdifjldskfj
+# Имя приложения в pg_stat_activity; им же помечаются (комментарием) все запросы,
+# чтобы окно статистики отбирало в pg_stat_statements только наши
+APPLICATION_NAME = 'ddos_experiments'
+
 # Параметры подключения к базе данных PostgreSQL
 DB_CONFIG = {
     'host': 'localhost',
     'port': 5432,
     'database': 'postgres',
     'user': 'postgres',
-    'password': 'klim'
+    'password': 'klim',
+    'application_name': APPLICATION_NAME,
+    # Обрыв TCP-сессии замечаем по keepalive, а не только по следующему запросу
+    'connect_timeout': 5,
+    'keepalives': 1,
+    'keepalives_idle': 30,
+    'keepalives_interval': 10,
+    'keepalives_count': 3,
+}
+
+# Переподключение и повторы читающих запросов при обрыве соединения
+DB_RETRY = {
+    'attempts': 3,               # сколько раз пробовать чтение
+    'backoff': 0.5,              # первая пауза между попытками, с (дальше удваивается)
+    'max_backoff': 5.0,          # максимальная пауза, с
+    'healthcheck_interval': 30,  # как часто проверять простаивающее соединение, с
 }
 
+# Реплики только для чтения (потоковая репликация основного сервера DB_CONFIG).
+# На них уходят get_data, SELECT из execute_custom_query и запросы к каталогу.
+# Пустой список - все запросы идут на основной сервер.
+# Пример для локальной проверки: реплика, поднятая через
+#   pg_basebackup -h localhost -p 5432 -U postgres -D replica -R -X stream
+# и запущенная на порту 5433:
+#   DB_REPLICAS = [{**DB_CONFIG, 'port': 5433}]
+DB_REPLICAS = []
+
+# Реплика, отстающая больше чем на столько секунд, не используется (чтение идет с основного)
+REPLICA_MAX_LAG = 5.0
+
+# Как часто перепроверять доступность и отставание реплики, с
+REPLICA_CHECK_INTERVAL = 10
+
+# Реплика, не получавшая от основного сервера ничего дольше стольких секунд,
+# считается отключенной. Основной сервер присылает keepalive не реже
+# wal_sender_timeout / 2 (по умолчанию 30 с), поэтому порог больше этого
+REPLICA_RECEIVER_TIMEOUT = 60
+
+# Шардирование ddos.experiments по нескольким независимым серверам PostgreSQL.
+# Узел 0 - основной сервер DB_CONFIG, здесь перечисляются дополнительные узлы.
+# Строка experiments попадает на узел crc32(SHARD_KEY) % число узлов;
+# DDL и остальные таблицы схемы ("вспомогательная") дублируются на все узлы.
+# Число узлов после наполнения менять нельзя без перераскладки строк.
+# Пустой список - одна база, как раньше.
+# Пример для локальной проверки (три независимых экземпляра):
+#   DB_SHARDS = [{**DB_CONFIG, 'port': 5434}, {**DB_CONFIG, 'port': 5435}]
+DB_SHARDS = []
+
+# Колонка experiments, по хешу которой выбирается узел ('name' или 'auxiliary_id')
+SHARD_KEY = 'name'
+
+# Сколько секунд окно просмотра фильтрует загруженные данные локально,
+# прежде чем снова пойти на сервер (кнопка "Обновить с сервера" - сразу)
+VIEW_CACHE_TTL = 60
+
+# Предпросмотр выражений во вкладках строк и условий мастера запросов:
+# запрос идет по TABLESAMPLE (SYSTEM - случайные страницы, BERNOULLI -
+# случайные строки) с повторяемым зерном и ограничением числа строк
+PREVIEW_METHOD = 'SYSTEM'
+PREVIEW_PERCENT = 1.0
+PREVIEW_ROW_LIMIT = 1000
+PREVIEW_SEED = 42
+
+# Сколько секунд хранится описание схемы (таблицы, колонки, типы) для форм ввода.
+# После DDL из самого приложения кэш сбрасывается сразу
+CATALOG_CACHE_TTL = 300
+
+# Сервис приема результатов по HTTP (ingest_service.py)
+INGEST_HOST = '127.0.0.1'
+INGEST_PORT = 8085
+INGEST_QUEUE_MAX = 50000        # сколько строк может ждать записи; дальше POST получает 503
+INGEST_FLUSH_ROWS = 5000        # COPY запускается, как только набралось столько строк
+INGEST_FLUSH_INTERVAL = 0.5     # ... или не реже чем раз в столько секунд
+INGEST_MAX_BODY = 16 * 1024 * 1024  # предельный размер тела запроса, байт
+
+# Метрики Prometheus (metrics.py): None - HTTP-точка /metrics не поднимается
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = None
+
+# Профиль медленных действий в окнах (profiler.py, python main.py --profile)
+PROFILE_THRESHOLD_MS = 100   # обработка события дольше этого попадает в профиль
+PROFILE_INTERVAL_MS = 5      # как часто снимать стек главного потока
+PROFILE_DIR = 'profiles'     # куда писать .folded и .txt
+
+# Сторож главного потока (stall_watchdog.py): зависание дольше порога
+# пишется в лог со стеком. None - сторож не запускается
+WATCHDOG_THRESHOLD_MS = 200
+WATCHDOG_INTERVAL_MS = 50    # как часто главный поток отмечает пульс
+
+# ALTER TABLE из окна структуры (alter_dialog.py): команда отменяется, если
+# пока она ждет блокировку, за ней в очереди больше DDL_MAX_BLOCKED сессий
+DDL_MAX_BLOCKED = 3
+DDL_MONITOR_INTERVAL_MS = 500
+
+# Обслуживание таблиц (maintenance.py)
+MAINTENANCE_ANALYZE_ROWS = 10000         # ANALYZE, когда записано (приложением) или изменено (по pg_stat, любыми
+MAINTENANCE_ANALYZE_FRACTION = 0.1       # клиентами) строк не меньше max(ROWS, FRACTION * строк таблицы)
+MAINTENANCE_VACUUM_MIN_DEAD = 1000       # VACUUM, если мертвых строк не меньше этого
+MAINTENANCE_VACUUM_DEAD_FRACTION = 0.2   # ... и их доля не меньше этой
+MAINTENANCE_CHECK_INTERVAL = 300         # как часто проверять pg_stat_user_tables, с (None - только по записям)
+
+# Хранение experiments (retention.py, python cli.py archive): сколько дней
+# держать строки в таблице по типу атаки ('*' - для остальных, None - всегда).
+# Более старые выгружаются в сжатые файлы ARCHIVE_DIR и удаляются из таблицы
+RETENTION_DAYS = {'*': 365}
+ARCHIVE_DIR = 'archive'
+ARCHIVE_FILE_ROWS = 100000      # строк в одном файле архива
+RETENTION_DELETE_BATCH = 5000   # строк в одном DELETE (каждый фиксируется сразу)
+
+# Оценка числа уникальных значений (estimates.approx_distinct, HyperLogLog):
+# 2^HLL_PRECISION регистров, погрешность ~1.04 / sqrt(2^HLL_PRECISION) (0.8% при 14)
+HLL_PRECISION = 14
+
 # Список типов DDoS атак (должен совпадать с ENUM в БД)
 ATTACK_TYPES = ['SYN_FLOOD', 'UDP_FLOOD', 'HTTP_FLOOD']
 
+# Уровни критичности целей (CHECK в таблице "вспомогательная")
+CRITICALITY_LEVELS = ['LOW', 'MEDIUM', 'HIGH']
+
+# Отображаемые имена колонок: SQL-имя -> подпись в интерфейсе
+COLUMN_LABELS = {
+    'id': 'ID',
+    'name': 'Название',
+    'attack_type': 'Тип атаки',
+    'packets': 'Пакетов',
+    'duration': 'Длительность',
+    'created_at': 'Дата',
+    'auxiliary_id': 'Инфраструктура',
+    'segment_code': 'Код сегмента',
+    'label': 'Название сегмента',
+    'location': 'Расположение',
+    'purpose': 'Назначение',
+    'criticality': 'Критичность',
+}
@@ -1,36 +1,615 @@
 """
 Функции для работы с базой данных PostgreSQL
 """
+import io
+import csv
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2.extras import execute_values
+import time
+import re
+import zlib
+import heapq
 import logging
 import random
+import functools
+import threading
 from datetime import datetime, timedelta
-from config import DB_CONFIG, ATTACK_TYPES
+from decimal import Decimal, InvalidOperation
+import metrics
+from resultset import ColumnarResult
+from config import (
+    DB_CONFIG, DB_RETRY, DB_REPLICAS, REPLICA_MAX_LAG, REPLICA_CHECK_INTERVAL, REPLICA_RECEIVER_TIMEOUT,
+    DB_SHARDS, SHARD_KEY, CATALOG_CACHE_TTL, ATTACK_TYPES, CRITICALITY_LEVELS, APPLICATION_NAME
+)
 #f;sgjdlkfgjkdfkg;l
 # Глобальная переменная для хранения подключения
 conn = None
 
+# Когда последний раз проверяли, что соединение живо (time.monotonic)
+_last_healthcheck = 0.0
+
+# Соединения с репликами: индекс в DB_REPLICAS -> connection
+replica_conns = {}
+
+# Последняя проверка реплик: индекс -> (time.monotonic проверки, годна ли для чтения)
+_replica_state = {}
+
+# С какой реплики начинать следующий выбор (простая ротация)
+_next_replica = 0
+
+# Соединение для чтения, выбранное retry_read на время одного вызова читающей
+# функции (в своем потоке): get_read_connection внутри нее вернет его же,
+# не сдвигая ротацию реплик
+_read_pin = threading.local()
+
+# Соединения с дополнительными узлами шардирования: номер узла (1..) -> connection
+shard_conns = {}
+
+# Открытие соединений под замком: прогрев в фоновом потоке (warm_up) и окна
+# в потоке интерфейса не должны открыть два соединения на одно место
+_connect_lock = threading.RLock()
+
+# Текст последней ошибки чтения (None - последний запрос прошел успешно)
+last_error = None
+
+# Вспомогательная таблица (цели/сегменты), на которую ссылается auxiliary_id
+AUXILIARY_TABLE = "вспомогательная"
+
+# Кэш get_catalog(): (момент загрузки, каталог) или None
+_catalog_cache = None
+# Каталог сброшен после DDL: следующая загрузка идет с основного сервера
+_catalog_invalidated = False
+
+# Единственная таблица, строки которой распределяются по узлам (DB_SHARDS)
+SHARDED_TABLE = "experiments"
+SHARDED_TABLE_RE = re.compile(r'\bexperiments\b', re.IGNORECASE)
+
+# Метка в начале каждого запроса приложения: по ней окно статистики
+# находит наши запросы в pg_stat_statements (application_name там не хранится)
+STATEMENT_TAG = f"/* {APPLICATION_NAME} */ "
+
+
+class TaggedCursor(psycopg2.extensions.cursor):
+    """Курсор, который ставит STATEMENT_TAG перед текстом каждого запроса."""
+
+    @staticmethod
+    def tag(query):
+        if isinstance(query, str):
+            return STATEMENT_TAG + query
+        if isinstance(query, bytes):
+            return STATEMENT_TAG.encode() + query
+        return query
+
+    def execute(self, query, vars=None):
+        return super().execute(self.tag(query), vars)
+
+    def executemany(self, query, vars_list):
+        return super().executemany(self.tag(query), vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return super().copy_expert(self.tag(sql), file, size)
+
+
+# SQLSTATE, означающие потерю соединения: класс 08 и остановка сервера
+_DISCONNECT_SQLSTATES = ('57P01', '57P02', '57P03')
+
 
 def quote_ident(name: str) -> str:
     """Экранировать идентификатор для корректной работы с кириллицей и пробелами."""
     return f"\"{name.replace('\"', '\"\"')}\""
 
 
-def get_connection():
+def is_connection_error(e):
+    """Ошибка означает обрыв соединения (а не ошибку в самом запросе)?"""
+    if isinstance(e, psycopg2.InterfaceError):
+        return True
+    if isinstance(e, psycopg2.OperationalError):
+        code = getattr(e, 'pgcode', None)
+        return code is None or code.startswith('08') or code in _DISCONNECT_SQLSTATES
+    return False
+
+
+def connection_alive(connection):
+    """
+    Проверить соединение запросом SELECT 1.
+
+    Обрыв TCP или перезапуск сервера не видны по conn.closed до первой ошибки,
+    поэтому простаивающее соединение проверяем явно. Вызывать только из потока,
+    который работает с этим соединением: откат своей проверочной транзакции
+    в чужом потоке мог бы отменить транзакцию, начатую между проверкой
+    статуса и откатом (поэтому warm_up общие соединения не проверяет, а
+    открывает свои и передает их через adopt_connection).
+    """
+    if connection is None or connection.closed:
+        return False
+    status = connection.info.transaction_status
+    if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+        # Транзакция ждет отката - сервер на связи
+        return True
+    try:
+        cur = connection.cursor()
+        cur.execute("SELECT 1")
+        cur.close()
+        # Открытую транзакцию вызывающего кода не трогаем, свою - закрываем
+        if status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            connection.rollback()
+        return True
+    except psycopg2.Error as e:
+        return not is_connection_error(e)
+
+
+def close_quietly(connection):
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def reset_connection():
+    """Закрыть основное соединение, чтобы следующий вызов get_connection открыл новое."""
     global conn
+    close_quietly(conn)
+    conn = None
+
+
+def drop_broken_connections():
+    """
+    Забыть соединения, которые psycopg2 уже пометил закрытыми после обрыва.
+
+    Живые соединения не трогаем: в них может быть открытая транзакция вызывающего кода.
+    """
+    if conn is not None and conn.closed:
+        reset_connection()
+    for index, connection in list(replica_conns.items()):
+        if connection.closed:
+            del replica_conns[index]
+            _replica_state.pop(index, None)
+    for index, connection in list(shard_conns.items()):
+        if connection.closed:
+            del shard_conns[index]
+
+
+def rollback_quietly(connection):
+    """Откатить транзакцию, не падая на уже оборванном соединении."""
+    if connection is None or connection.closed:
+        return
+    try:
+        connection.rollback()
+    except psycopg2.Error as e:
+        if is_connection_error(e):
+            reset_connection()
+
+
+def open_connection(target, params, started):
+    """
+    psycopg2.connect с учетом в метриках.
+
+    started - time.perf_counter() до ожидания _connect_lock: в
+    ddos_db_connect_wait_seconds попадает и ожидание замка, и само подключение.
+    """
+    try:
+        connection = psycopg2.connect(cursor_factory=TaggedCursor, **params)
+    except Exception:
+        metrics.CONNECTS.inc(target=target, result="error")
+        raise
+    finally:
+        metrics.CONNECT_WAIT_SECONDS.observe(time.perf_counter() - started, target=target)
+    metrics.CONNECTS.inc(target=target, result="ok")
+    return connection
+
+
+def open_connection_counts():
+    """Число открытых соединений по видам (для метрики ddos_db_open_connections)."""
+    counts = {("primary",): int(conn is not None and not conn.closed)}
+    counts[("replica",)] = sum(1 for c in list(replica_conns.values()) if not c.closed)
+    counts[("shard",)] = sum(1 for c in list(shard_conns.values()) if not c.closed)
+    return counts
+
+
+OPEN_CONNECTIONS = metrics.Gauge(
+    "ddos_db_open_connections", "Открытые соединения с БД", ("target",), callback=open_connection_counts)
+
+
+def get_connection():
+    global conn, _last_healthcheck
+    
+    # Простаивающее соединение время от времени проверяем на живость
+    now = time.monotonic()
+    if conn is not None and not conn.closed and now - _last_healthcheck > DB_RETRY['healthcheck_interval']:
+        _last_healthcheck = now
+        if not connection_alive(conn):
+            logging.warning("Соединение с БД потеряно, переподключаемся")
+            reset_connection()
     
     # Если подключения нет или оно закрыто - создаем новое
     if conn is None or conn.closed:
-        try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            logging.info("Подключение к БД установлено")
-        except Exception as e:
-            logging.error(f"Ошибка подключения: {e}")
-            return None
+        started = time.perf_counter()
+        with _connect_lock:
+            # Пока ждали замок, соединение мог открыть другой поток
+            if conn is not None and not conn.closed:
+                return conn
+            try:
+                conn = open_connection("primary", DB_CONFIG, started)
+                _last_healthcheck = time.monotonic()
+                logging.info("Подключение к БД установлено")
+            except Exception as e:
+                logging.error(f"Ошибка подключения: {e}")
+                return None
     
     return conn
 
 
+def replica_lag(connection):
+    """
+    Отставание реплики в секундах; None, если реплика не получает WAL.
+
+    Если все полученное WAL уже применено, реплика актуальна (0), даже когда
+    на основном сервере давно не было записей - но только пока работает
+    WAL receiver: без него receive_lsn просто замирает и тоже совпадает с
+    replay_lsn. Поэтому реплика без receiver в состоянии streaming или
+    не получавшая сообщений дольше REPLICA_RECEIVER_TIMEOUT не используется.
+    Поля pg_stat_wal_receiver видны суперпользователю и членам pg_read_all_stats
+    (pg_monitor); остальным реплика всегда кажется отключенной.
+    """
+    cur = connection.cursor()
+    cur.execute("""
+        SELECT pg_is_in_recovery(),
+               (SELECT status = 'streaming'
+                       AND now() - last_msg_receipt_time <= make_interval(secs => %s)
+                FROM pg_stat_wal_receiver),
+               CASE
+                   WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                   ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+               END
+    """, (REPLICA_RECEIVER_TIMEOUT,))
+    in_recovery, streaming, lag = cur.fetchone()
+    cur.close()
+    if not in_recovery:
+        return 0.0
+    if not streaming:
+        return None
+    return float(lag)
+
+
+def get_replica_connection(index):
+    """
+    Соединение с репликой DB_REPLICAS[index], если она доступна и отстает
+    не больше REPLICA_MAX_LAG. Иначе None.
+    """
+    now = time.monotonic()
+    checked_at, usable = _replica_state.get(index, (None, False))
+    if checked_at is not None and now - checked_at < REPLICA_CHECK_INTERVAL:
+        return replica_conns.get(index) if usable else None
+
+    started = time.perf_counter()
+    with _connect_lock:
+        # Другой поток мог уже перепроверить реплику, пока мы ждали замок
+        checked_at, usable = _replica_state.get(index, (None, False))
+        if checked_at is not None and time.monotonic() - checked_at < REPLICA_CHECK_INTERVAL:
+            return replica_conns.get(index) if usable else None
+
+        # Пора перепроверить: заодно это и проверка живости соединения
+        usable = False
+        connection = replica_conns.get(index)
+        try:
+            if connection is None or connection.closed:
+                connection = open_connection("replica", DB_REPLICAS[index], started)
+                # Реплика только читает; без открытых транзакций она не держит снимок
+                connection.set_session(readonly=True, autocommit=True)
+                replica_conns[index] = connection
+            lag = replica_lag(connection)
+            usable = lag is not None and lag <= REPLICA_MAX_LAG
+            if lag is None:
+                logging.warning(f"Реплика {index} не получает WAL с основного сервера, чтение идет с основного")
+            elif not usable:
+                logging.warning(f"Реплика {index} отстает на {lag:.1f} с, чтение идет с основного сервера")
+        except psycopg2.Error as e:
+            logging.warning(f"Реплика {index} недоступна: {e}")
+            replica_conns.pop(index, None)
+        _replica_state[index] = (now, usable)
+        return replica_conns.get(index) if usable else None
+
+
+def get_read_connection():
+    """
+    Соединение для запросов только на чтение.
+
+    Берется следующая по кругу актуальная реплика из DB_REPLICAS;
+    если реплик нет, все недоступны или отстают - основное соединение.
+    Внутри функции с retry_read(connect=get_read_connection) - то соединение,
+    которое выбрал и проверил декоратор.
+    """
+    global _next_replica
+    pinned = getattr(_read_pin, 'connection', None)
+    if pinned is not None and not pinned.closed:
+        return pinned
+    for offset in range(len(DB_REPLICAS)):
+        index = (_next_replica + offset) % len(DB_REPLICAS)
+        connection = get_replica_connection(index)
+        if connection is not None:
+            _next_replica = index + 1
+            return connection
+    return get_connection()
+
+
+def shard_count():
+    """Число узлов: основной сервер DB_CONFIG (узел 0) плюс DB_SHARDS."""
+    return 1 + len(DB_SHARDS)
+
+
+def is_sharded(table_name=SHARDED_TABLE):
+    """Распределена ли таблица по нескольким узлам."""
+    return bool(DB_SHARDS) and table_name == SHARDED_TABLE
+
+
+def shard_for(data_dict):
+    """Номер узла для строки experiments: crc32 от значения SHARD_KEY по модулю числа узлов."""
+    key = data_dict.get(SHARD_KEY)
+    if key is None:
+        return 0
+    return zlib.crc32(str(key).encode("utf-8")) % shard_count()
+
+
+def get_shard_connection(index):
+    """Соединение с узлом index (0 - основной сервер). None, если узел недоступен."""
+    if index == 0:
+        return get_connection()
+    connection = shard_conns.get(index)
+    if connection is None or connection.closed:
+        started = time.perf_counter()
+        with _connect_lock:
+            connection = shard_conns.get(index)
+            if connection is not None and not connection.closed:
+                return connection
+            try:
+                connection = open_connection("shard", DB_SHARDS[index - 1], started)
+                shard_conns[index] = connection
+                logging.info(f"Подключение к узлу {index} установлено")
+            except Exception as e:
+                logging.error(f"Ошибка подключения к узлу {index}: {e}")
+                return None
+    return connection
+
+
+def get_all_shard_connections():
+    """Соединения со всеми узлами по порядку. Если какой-то узел недоступен - OperationalError."""
+    connections = []
+    for index in range(shard_count()):
+        connection = get_shard_connection(index)
+        if connection is None:
+            raise psycopg2.OperationalError(f"Узел {index} недоступен")
+        connections.append(connection)
+    return connections
+
+
+def run_on_node_cursors(work):
+    """
+    Выполнить work(cursors) с курсорами всех узлов (по порядку, первый - узел 0)
+    и зафиксировать, только если везде прошло. Returns: результат work.
+
+    Фиксация идет по узлам по очереди, распределенной транзакции нет.
+    """
+    connections = get_all_shard_connections()
+    try:
+        cursors = [connection.cursor() for connection in connections]
+        result = work(cursors)
+        for cur in cursors:
+            cur.close()
+        for connection in connections:
+            connection.commit()
+        return result
+    except Exception:
+        for connection in connections:
+            rollback_quietly(connection)
+        raise
+
+
+def run_on_all_shards(work):
+    """
+    Выполнить work(cursor) на каждом узле и зафиксировать, только если везде прошло.
+
+    Используется для DDL и изменений справочных таблиц, которые должны
+    совпадать на всех узлах. Без DB_SHARDS это просто основной сервер.
+    """
+    run_on_node_cursors(lambda cursors: [work(cur) for cur in cursors])
+
+
+def align_id_sequences(cursors):
+    """
+    Сделать id experiments уникальными на всех узлах: узел i выдает только
+    id, равные i + 1 по модулю числа узлов, начиная после наибольшего id
+    среди всех узлов. Повторный вызов (например, после добавления узла
+    в DB_SHARDS) занятых id не выдаст. cursors - курсоры узлов по порядку.
+    """
+    nodes = len(cursors)
+    table = f"ddos.{quote_ident(SHARDED_TABLE)}"
+    top = 0
+    for cur in cursors:
+        cur.execute(f"SELECT max(id) FROM {table}")
+        top = max(top, cur.fetchone()[0] or 0)
+    for node, cur in enumerate(cursors):
+        cur.execute("SELECT pg_get_serial_sequence(%s, 'id')", (table,))
+        sequence = cur.fetchone()[0]
+        cur.execute(f"ALTER SEQUENCE {sequence} INCREMENT BY {nodes}")
+        # Наименьший id больше top, который относится к узлу node
+        cur.execute("SELECT setval(%s, %s, false)", (sequence, top + 1 + (node - top) % nodes))
+
+
+@metrics.instrumented
+def align_ids():
+    """
+    Выровнять последовательности id experiments по узлам (align_id_sequences)
+    для схемы, созданной до шардирования или до добавления узла. Запускать,
+    пока в experiments никто не пишет.
+
+    Returns:
+        (success, msg)
+    """
+    if not DB_SHARDS:
+        return True, "Шардирование не включено (DB_SHARDS пуст) - выравнивать нечего"
+    try:
+        run_on_node_cursors(align_id_sequences)
+    except psycopg2.Error as e:
+        logging.error(f"Ошибка выравнивания id: {e}")
+        return False, f"Ошибка выравнивания id: {describe_write_error(e)}"
+    logging.info(f"Последовательности id experiments выровнены на {shard_count()} узлах")
+    return True, f"id experiments выровнены: шаг {shard_count()}, у каждого узла свой остаток"
+
+
+def fetch_from_all_shards(query, params=None):
+    """
+    Выполнить SELECT на каждом узле.
+
+    Returns:
+        Кортеж (результаты по узлам: [[row, ...], ...], колонки)
+    """
+    parts = []
+    columns = []
+    for connection in get_all_shard_connections():
+        try:
+            cur = connection.cursor()
+            cur.execute(query, params)
+            parts.append(cur.fetchall())
+            columns = [desc[0] for desc in cur.description] if cur.description else []
+            cur.close()
+        except psycopg2.Error as e:
+            if not is_connection_error(e):
+                rollback_quietly(connection)
+            raise
+    return parts, columns
+
+
+def merge_by_created_at(parts, index):
+    """Слить отсортированные на узлах результаты в порядке ORDER BY created_at DESC (NULL первыми)."""
+    key = lambda row: (row[index] is None, row[index] or datetime.min)
+    return list(heapq.merge(*parts, key=key, reverse=True))
+
+
+def insert_reference_rows(cursors, table_name, columns, rows, page_size=500):
+    """
+    Вставить строки справочной (не шардированной) таблицы на все узлы.
+
+    На узле 0 значения по умолчанию (id из SERIAL) вычисляет сервер,
+    на остальные узлы строки копируются целиком, чтобы id совпадали
+    и внешние ключи experiments работали на любом узле.
+    cursors: курсоры узлов по порядку, первый - узел 0.
+    """
+    query = build_insert_sql(table_name, columns, placeholder="%s")
+    if len(cursors) == 1:
+        execute_values(cursors[0], query, rows, page_size=page_size)
+        return
+    returned = execute_values(cursors[0], query + " RETURNING *", rows, page_size=page_size, fetch=True)
+    full_columns = [desc[0] for desc in cursors[0].description]
+    for cur in cursors[1:]:
+        execute_values(cur, build_insert_sql(table_name, full_columns, placeholder="%s"), returned,
+                       page_size=page_size)
+
+
+@metrics.instrumented
+def insert_reference_data(table_name, columns, rows):
+    """Вставить строки справочной таблицы на все узлы и зафиксировать (см. insert_reference_rows)."""
+    run_on_node_cursors(lambda cursors: insert_reference_rows(cursors, table_name, columns, rows))
+    rows_written(table_name, len(rows), "reference")
+
+
+def rows_written(table_name, count, method):
+    """Учесть записанные строки: метрика и счетчик для ANALYZE после больших записей (maintenance)."""
+    metrics.ROWS_INSERTED.inc(count, table=table_name, method=method)
+    if count:
+        from maintenance import scheduler
+        scheduler.note_write(table_name, count)
+
+
+def get_last_error():
+    """Причина, по которой последний читающий запрос вернул пустой результат (или None)."""
+    return last_error
+
+
+def read_failed(message, e, connection):
+    """Обработать ошибку читающего запроса: откат, лог и запоминание причины."""
+    global last_error
+    rollback_quietly(connection)
+    metrics.ERRORS.inc(operation="read", kind="query")
+    logging.error(f"{message}: {e}")
+    last_error = f"{message}: {e}"
+
+
+def describe_write_error(e):
+    """
+    Текст ошибки записи для пользователя.
+
+    Запись не повторяется автоматически (она не идемпотентна), поэтому
+    при обрыве соединения явно сообщаем, что результат не подтвержден.
+    """
+    if is_connection_error(e):
+        metrics.ERRORS.inc(operation="write", kind="connection")
+        reset_connection()
+        drop_broken_connections()
+        return f"Соединение с БД потеряно, запись не подтверждена. Проверьте данные и повторите: {e}"
+    metrics.ERRORS.inc(operation="write", kind="query")
+    return str(e)
+
+
+def retry_read(default, connect=None):
+    """
+    Декоратор для идемпотентных читающих функций.
+
+    При обрыве соединения переподключается и повторяет вызов с экспоненциальной
+    задержкой (DB_RETRY). Если попытки исчерпаны, возвращает default()
+    и оставляет причину в last_error.
+    connect: функция получения соединения (по умолчанию get_connection).
+    Соединение выбирается один раз на попытку: с connect=get_read_connection
+    повторный get_read_connection() в теле функции вернет ту же реплику.
+    Декорируемая функция должна пробрасывать ошибки соединения (is_connection_error).
+    Длительность вызовов и ошибки попадают в metrics.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            global last_error
+            delay = DB_RETRY['backoff']
+            attempts = DB_RETRY['attempts']
+            for attempt in range(1, attempts + 1):
+                pin = connect is get_read_connection
+                previous = getattr(_read_pin, 'connection', None)
+                try:
+                    connection = (connect or get_connection)()
+                    if connection is None:
+                        raise psycopg2.OperationalError("Нет подключения к БД")
+                    if pin:
+                        _read_pin.connection = connection
+                    last_error = None
+                    return func(*args, **kwargs)
+                except psycopg2.Error as e:
+                    if not is_connection_error(e):
+                        raise
+                    drop_broken_connections()
+                    metrics.ERRORS.inc(operation="read", kind="connection")
+                    last_error = f"Нет связи с БД: {e}".strip()
+                    if attempt == attempts:
+                        logging.error(f"{func.__name__}: БД недоступна после {attempts} попыток: {e}")
+                        break
+                    logging.warning(
+                        f"{func.__name__}: обрыв соединения (попытка {attempt}/{attempts}), "
+                        f"повтор через {delay:.1f} с"
+                    )
+                    time.sleep(delay)
+                    delay = min(delay * 2, DB_RETRY['max_backoff'])
+                finally:
+                    if pin:
+                        _read_pin.connection = previous
+            return default()
+        # Время в метриках - вместе с повторами, как его видит вызывающий
+        return metrics.instrumented(wrapper)
+    return decorator
+
+
+@retry_read(default=bool)
 def schema_exists():
     conn = get_connection()
     if not conn:
@@ -50,11 +629,62 @@ def schema_exists():
         cur.close()
         return exists
     except Exception as e:
-        conn.rollback()
-        logging.error(f"Ошибка проверки схемы: {e}")
+        if is_connection_error(e):
+            raise
+        read_failed("Ошибка проверки схемы", e, conn)
         return False
 
 
+def create_schema_objects(cur):
+    """Создать объекты схемы ddos через курсор (без фиксации транзакции)."""
+    # Создаем схему ddos (без IF NOT EXISTS, так как проверили выше)
+    cur.execute("CREATE SCHEMA ddos;")
+    
+    # Создаем ENUM тип для типов атак
+    attack_types_str = "', '".join(ATTACK_TYPES)
+    cur.execute(f"""
+        CREATE TYPE ddos.attack_type AS ENUM ('{attack_types_str}');
+    """)
+    
+    # Создаем вспомогательную таблицу (под внешние ключи)
+    cur.execute("""
+        CREATE TABLE ddos."вспомогательная" (
+            id SERIAL PRIMARY KEY,
+            segment_code VARCHAR(50) NOT NULL UNIQUE,
+            label VARCHAR(255) NOT NULL,
+            location VARCHAR(255),
+            purpose TEXT,
+            criticality VARCHAR(20) CHECK (criticality IN ({criticality_levels}))
+        );
+    """.format(criticality_levels=", ".join(f"'{level}'" for level in CRITICALITY_LEVELS)))
+    # Можно заранее наполнить базовыми значениями для удобства
+    cur.execute("""
+        INSERT INTO ddos."вспомогательная"(segment_code, label, location, purpose, criticality)
+        VALUES
+            ('EDGE-A', 'Крайняя зона защиты', 'ЦОД Москва-1', 'Фронтовые фильтрующие узлы перед интернетом', 'HIGH'),
+            ('CORE-B', 'Ядро обработки', 'ЦОД Санкт-Петербург', 'Корневые балансировщики и аналитика', 'MEDIUM'),
+            ('LAB-C', 'Лабораторный стенд', 'Тестовый контур', 'Испытания новых сценариев атак', 'LOW');
+    """)
+    # Создаем таблицу экспериментов (после вспомогательной, чтобы работал FK)
+    cur.execute("""
+        CREATE TABLE ddos.experiments (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL UNIQUE,
+            attack_type ddos.attack_type NOT NULL,
+            packets INTEGER NOT NULL CHECK (packets > 0),
+            duration DECIMAL(10,2) NOT NULL CHECK (duration > 0),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            auxiliary_id INTEGER,
+            CONSTRAINT fk_experiments_aux
+                FOREIGN KEY (auxiliary_id)
+                REFERENCES ddos."вспомогательная"(id)
+                ON UPDATE CASCADE
+                ON DELETE SET NULL
+            );
+    """)
+
+
+@metrics.instrumented
 def create_schema():
     """
     Создать схему базы данных с таблицами и типами
@@ -77,67 +707,27 @@ def create_schema():
         return False, "Схема 'ddos' уже существует. Можно создать только одну схему."
     
     try:
-        cur = conn.cursor()
-        
-        # Создаем схему ddos (без IF NOT EXISTS, так как проверили выше)
-        cur.execute("CREATE SCHEMA ddos;")
-        
-        # Создаем ENUM тип для типов атак
-        attack_types_str = "', '".join(ATTACK_TYPES)
-        cur.execute(f"""
-            CREATE TYPE ddos.attack_type AS ENUM ('{attack_types_str}');
-        """)
-        
-        # Создаем вспомогательную таблицу (под внешние ключи)
-        cur.execute("""
-            CREATE TABLE ddos."вспомогательная" (
-                id SERIAL PRIMARY KEY,
-                segment_code VARCHAR(50) NOT NULL UNIQUE,
-                label VARCHAR(255) NOT NULL,
-                location VARCHAR(255),
-                purpose TEXT,
-                criticality VARCHAR(20) CHECK (criticality IN ('LOW','MEDIUM','HIGH'))
-            );
-        """)
-        # Можно заранее наполнить базовыми значениями для удобства
-        cur.execute("""
-            INSERT INTO ddos."вспомогательная"(segment_code, label, location, purpose, criticality)
-            VALUES
-                ('EDGE-A', 'Крайняя зона защиты', 'ЦОД Москва-1', 'Фронтовые фильтрующие узлы перед интернетом', 'HIGH'),
-                ('CORE-B', 'Ядро обработки', 'ЦОД Санкт-Петербург', 'Корневые балансировщики и аналитика', 'MEDIUM'),
-                ('LAB-C', 'Лабораторный стенд', 'Тестовый контур', 'Испытания новых сценариев атак', 'LOW');
-        """)
-        # Создаем таблицу экспериментов (после вспомогательной, чтобы работал FK)
-        cur.execute("""
-            CREATE TABLE ddos.experiments (
-                id SERIAL PRIMARY KEY,
-                name VARCHAR(255) NOT NULL UNIQUE,
-                attack_type ddos.attack_type NOT NULL,
-                packets INTEGER NOT NULL CHECK (packets > 0),
-                duration DECIMAL(10,2) NOT NULL CHECK (duration > 0),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                auxiliary_id INTEGER,
-                CONSTRAINT fk_experiments_aux
-                    FOREIGN KEY (auxiliary_id)
-                    REFERENCES ddos."вспомогательная"(id)
-                    ON UPDATE CASCADE
-                    ON DELETE SET NULL
-                );
-        """)
-        
-        # Сохраняем изменения
-        conn.commit()
-        cur.close()
+        # На всех узлах схема одинаковая (без DB_SHARDS - только основной сервер),
+        # а id experiments у каждого узла свои (align_id_sequences)
+        def create_on_nodes(cursors):
+            for cur in cursors:
+                create_schema_objects(cur)
+            if len(cursors) > 1:
+                align_id_sequences(cursors)
+
+        run_on_node_cursors(create_on_nodes)
+        invalidate_catalog()
         logging.info("Схема БД создана")
         return True, "Схема успешно создана"
         
     except Exception as e:
         # Откатываем изменения при ошибке
-        conn.rollback()
+        rollback_quietly(conn)
         logging.error(f"Ошибка создания схемы: {e}")
-        return False, f"Ошибка создания схемы: {str(e)}"
+        return False, f"Ошибка создания схемы: {describe_write_error(e)}"
 
 
+@metrics.instrumented
 def drop_schema():
     """Удалить схему ddos со всеми объектами, даже если таблицы переименованы."""
     conn = get_connection()
@@ -146,20 +736,14 @@ def drop_schema():
     if not schema_exists():
         return False, "Схема 'ddos' не найдена"
     try:
-        cur = conn.cursor()
-        cur.execute("DROP SCHEMA ddos CASCADE;")
-        conn.commit()
-        cur.close()
+        run_on_all_shards(lambda cur: cur.execute("DROP SCHEMA ddos CASCADE;"))
+        invalidate_catalog()
         logging.info("Схема 'ddos' удалена")
         return True, "Все объекты схемы удалены"
     except Exception as e:
-        if conn and conn.status != 1:  # not READY
-            try:
-                conn.rollback()
-            except Exception:
-                pass
+        rollback_quietly(conn)
         logging.error(f"Ошибка удаления схемы: {e}")
-        return False, f"Ошибка удаления схемы: {str(e)}"
+        return False, f"Ошибка удаления схемы: {describe_write_error(e)}"
 
 
 def insert_data(name, attack_type, packets, duration, date=None, auxiliary_id=None):
@@ -176,6 +760,20 @@ def insert_data(name, attack_type, packets, duration, date=None, auxiliary_id=No
         "auxiliary_id": auxiliary_id
     })
 
+def build_insert_sql(table_name, columns, placeholder=None):
+    """
+    Собрать INSERT для таблицы схемы ddos.
+
+    placeholder: текст после VALUES; по умолчанию (%s, %s, ...) по числу колонок.
+    Для execute_values передается "%s".
+    """
+    col_str = ", ".join(quote_ident(col) for col in columns)
+    if placeholder is None:
+        placeholder = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    return f"INSERT INTO ddos.{quote_ident(table_name)} ({col_str}) VALUES {placeholder}"
+
+
+@metrics.instrumented
 def insert_dynamic_data(table_name, data_dict):
     """
     Динамическая вставка данных в любую таблицу.
@@ -183,46 +781,202 @@ def insert_dynamic_data(table_name, data_dict):
     Args:
         table_name: Имя таблицы (например, 'experiments')
         data_dict: Словарь {column_name: value}
+
+    При шардировании строка experiments уходит на узел shard_for(data_dict),
+    строка любой другой таблицы - на все узлы (insert_reference_rows).
     """
-    conn = get_connection()
+    if not data_dict:
+        return False, "Нет данных для вставки"
+    if is_sharded(table_name):
+        conn = get_shard_connection(shard_for(data_dict))
+    else:
+        conn = get_connection()
     if not conn:
         return False, "Нет подключения к БД"
         
     try:
-        cur = conn.cursor()
-        
         # Фильтруем None значения (пусть база ставит NULL или DEFAULT)
         # НО! Для некоторых колонок None может быть явным NULL. 
         # Оставим как есть, psycopg2 умеет конвертировать None в NULL.
+        if DB_SHARDS and not is_sharded(table_name):
+            insert_reference_data(table_name, list(data_dict.keys()), [tuple(data_dict.values())])
+            return True, "Данные успешно добавлены"
+
+        cur = conn.cursor()
+        query = build_insert_sql(table_name, list(data_dict.keys()))
         
-        cols = []
-        vals = []
-        placeholders = []
-        
-        for col, val in data_dict.items():
-            cols.append(quote_ident(col))
-            vals.append(val)
-            placeholders.append("%s")
-            
-        if not cols:
-            return False, "Нет данных для вставки"
-            
-        col_str = ", ".join(cols)
-        ph_str = ", ".join(placeholders)
-        
-        query = f"INSERT INTO ddos.{quote_ident(table_name)} ({col_str}) VALUES ({ph_str})"
-        
-        cur.execute(query, tuple(vals))
+        cur.execute(query, tuple(data_dict.values()))
         conn.commit()
         cur.close()
+        rows_written(table_name, 1, "insert")
         return True, "Данные успешно добавлены"
         
     except Exception as e:
-        conn.rollback()
+        rollback_quietly(conn)
         logging.error(f"Ошибка вставки в {table_name}: {e}")
-        return False, str(e)
+        return False, describe_write_error(e)
+
+
+class InsertBatch:
+    """
+    Пакет вставок (unit of work).
+
+    Накапливает строки для одной или нескольких таблиц и записывает их
+    одной транзакцией: подряд идущие строки одной таблицы с одинаковым
+    набором колонок уходят одним execute_values. Если такая группа падает,
+    она повторяется построчно, каждая строка под своей точкой сохранения
+    (SAVEPOINT), так что одна плохая строка не отменяет весь пакет.
+
+    При шардировании строки experiments раскладываются по узлам, строки
+    остальных таблиц пишутся на все узлы; транзакции узлов фиксируются
+    по очереди (атомарности между узлами нет).
+
+    Пример:
+        batch = InsertBatch()
+        batch.add("experiments", {"name": "T-1", ...})
+        batch.add("вспомогательная", {"segment_code": "X", ...})
+        success, msg, failed = batch.flush()
+    """
+
+    def __init__(self, page_size=500):
+        self.page_size = page_size
+        self.rows = []  # [(table_name, data_dict), ...] в порядке добавления
+        self.error = None  # исключение, из-за которого последний flush не записал пакет
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, table_name, data_dict):
+        """Поставить строку в очередь (в БД ничего не отправляется)."""
+        if not data_dict:
+            raise ValueError("Нет данных для вставки")
+        self.rows.append((table_name, dict(data_dict)))
+
+    def clear(self):
+        self.rows.clear()
+
+    def replace(self, index, table_name, data_dict):
+        """Заменить строку очереди исправленной (место в очереди сохраняется)."""
+        self.rows[index] = (table_name, dict(data_dict))
+
+    def groups(self):
+        """Разбить очередь на подряд идущие группы (таблица, колонки) с сохранением порядка."""
+        groups = []
+        for index, (table_name, data) in enumerate(self.rows):
+            key = (table_name, tuple(data.keys()))
+            if groups and groups[-1][0] == key:
+                groups[-1][1].append((index, data))
+            else:
+                groups.append((key, [(index, data)]))
+        return groups
+
+    @metrics.instrumented
+    def flush(self):
+        """
+        Записать очередь в БД одной транзакцией и убрать из нее записанные строки.
+
+        Строки, не прошедшие под точкой сохранения, остаются в очереди (в прежнем
+        порядке): их можно исправить (replace) и отправить снова. Если пакет не
+        записан целиком, очередь не меняется, а причина остается в self.error
+        (None - не было соединения).
+
+        Returns:
+            Кортеж (успех: bool, сообщение: str, ошибки: [(номер строки, таблица, текст ошибки), ...])
+        """
+        self.error = None
+        if not self.rows:
+            return True, "Очередь пуста", []
+        if not get_connection():
+            return False, "Нет подключения к БД", []
+
+        inserted = 0
+        written = {}  # таблица -> записано строк (для метрик)
+        failed = []
+        cursors = {}  # номер узла -> курсор открытой транзакции
+        try:
+            for (table_name, columns), items in self.groups():
+                if is_sharded(table_name):
+                    by_shard = {}
+                    for index, data in items:
+                        by_shard.setdefault(shard_for(data), []).append((index, data))
+                    parts = [([self.cursor(cursors, shard)], part) for shard, part in sorted(by_shard.items())]
+                else:
+                    nodes = range(shard_count()) if DB_SHARDS else [0]
+                    parts = [([self.cursor(cursors, node) for node in nodes], items)]
+                for node_cursors, part in parts:
+                    count = self.write_group(node_cursors, table_name, columns, part, failed)
+                    written[table_name] = written.get(table_name, 0) + count
+                    inserted += count
+            for cur in cursors.values():
+                cur.connection.commit()
+                cur.close()
+        except Exception as e:
+            self.error = e
+            for cur in cursors.values():
+                rollback_quietly(cur.connection)
+            logging.error(f"Ошибка пакетной вставки: {e}")
+            return False, f"Пакет не записан: {describe_write_error(e)}", []
+
+        failed_indexes = {index for index, _, _ in failed}
+        self.rows = [row for index, row in enumerate(self.rows) if index in failed_indexes]
+        for table_name, count in written.items():
+            rows_written(table_name, count, "insert_batch")
+        if failed:
+            logging.warning(f"Пакетная вставка: {inserted} записано, {len(failed)} с ошибками")
+            return inserted > 0, f"Записано строк: {inserted}, с ошибками: {len(failed)}", failed
+        return True, f"Записано строк: {inserted}", []
+
+    @staticmethod
+    def cursor(cursors, node):
+        """Курсор узла node, открывается при первом обращении."""
+        if node not in cursors:
+            connection = get_shard_connection(node)
+            if connection is None:
+                raise psycopg2.OperationalError(f"Узел {node} недоступен")
+            cursors[node] = connection.cursor()
+        return cursors[node]
+
+    def write_rows(self, cursors, table_name, columns, rows):
+        if len(cursors) == 1:
+            execute_values(cursors[0], build_insert_sql(table_name, columns, placeholder="%s"), rows,
+                           page_size=self.page_size)
+        else:
+            insert_reference_rows(cursors, table_name, columns, rows, page_size=self.page_size)
+
+    def write_group(self, cursors, table_name, columns, items, failed):
+        """
+        Записать группу строк одной таблицы на узлы cursors, при ошибке - построчно.
+
+        Точки сохранения ставятся на всех узлах сразу, чтобы откат строки
+        справочной таблицы убирал ее везде. Returns: число записанных строк.
+        """
+        def savepoint(command):
+            for cur in cursors:
+                cur.execute(command)
+
+        savepoint("SAVEPOINT batch_group")
+        try:
+            self.write_rows(cursors, table_name, columns, [tuple(data.values()) for _, data in items])
+            savepoint("RELEASE SAVEPOINT batch_group")
+            return len(items)
+        except psycopg2.Error:
+            savepoint("ROLLBACK TO SAVEPOINT batch_group")
+
+        # Группа не прошла целиком - повторяем построчно
+        written = 0
+        for index, data in items:
+            savepoint("SAVEPOINT batch_row")
+            try:
+                self.write_rows(cursors, table_name, columns, [tuple(data.values())])
+                savepoint("RELEASE SAVEPOINT batch_row")
+                written += 1
+            except psycopg2.Error as e:
+                savepoint("ROLLBACK TO SAVEPOINT batch_row")
+                failed.append((index, table_name, str(e).strip()))
+        return written
 
 
+@metrics.instrumented
 def insert_auxiliary_data(segment_code, label, location, purpose, criticality):
     """
     Вставить данные в таблицу 'вспомогательная'
@@ -232,22 +986,22 @@ def insert_auxiliary_data(segment_code, label, location, purpose, criticality):
         return False, "Нет подключения к БД"
     
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO ddos."вспомогательная" (segment_code, label, location, purpose, criticality)
-            VALUES (%s, %s, %s, %s, %s)
-        """, (segment_code, label, location, purpose, criticality))
-        conn.commit()
-        cur.close()
+        # Справочная таблица одинакова на всех узлах (без DB_SHARDS - только основной сервер)
+        insert_reference_data(
+            AUXILIARY_TABLE,
+            ["segment_code", "label", "location", "purpose", "criticality"],
+            [(segment_code, label, location, purpose, criticality)],
+        )
         return True, "Цель успешно добавлена"
     except Exception as e:
-        conn.rollback()
-        return False, str(e)
+        rollback_quietly(conn)
+        return False, describe_write_error(e)
 
 
+@retry_read(default=list, connect=get_read_connection)
 def get_auxiliary_items():
     """Получить список записей из вспомогательной таблицы."""
-    conn = get_connection()
+    conn = get_read_connection()
     if not conn:
         return []
     try:
@@ -271,66 +1025,625 @@ def get_auxiliary_items():
             for row in rows
         ]
     except Exception as e:
-        conn.rollback()
-        logging.error(f"Ошибка получения 'вспомогательная': {e}")
+        if is_connection_error(e):
+            raise
+        read_failed("Ошибка получения 'вспомогательная'", e, conn)
         return []
 
 
-def get_data(attack_type_filter=None, date_from=None, date_to=None, table_name=None, extra_conditions=None):
-    """
-    Получить данные из таблицы с фильтрами
-    table_name: имя таблицы (если None, использовать 'experiments')
-    """
-    conn = get_connection()
-    if not conn:
-        return []
-    if not table_name:
-        table_name = 'experiments'
+def auxiliary_label_sql(alias):
+    """SQL-выражение подписи цели из вспомогательной таблицы (как в выпадающих списках)."""
+    return (
+        f"concat({alias}.{quote_ident('label')}, ' · ', {alias}.{quote_ident('segment_code')}, "
+        f"' (', {alias}.{quote_ident('criticality')}, ')')"
+    )
+
+
+# Фильтры с подзапросом (build_subquery_filter)
+SUBQUERY_OPERATORS = ("=", "<>", ">", ">=", "<", "<=")
+SUBQUERY_CTE = "subquery_filter"
+
+# Типы колонок, для которых есть min/max: ANY/ALL с неравенством сводятся к одному агрегату
+MIN_MAX_TYPES = {
+    'smallint', 'integer', 'bigint', 'numeric', 'real', 'double precision',
+    'text', 'character varying', 'character', 'date', 'interval',
+    'timestamp without time zone', 'timestamp with time zone', 'time without time zone',
+}
+
+
+@retry_read(default=bool, connect=get_read_connection)
+def has_leading_index(table_name, column):
+    """Есть ли на ddos.table_name рабочий индекс, первая колонка которого - column."""
+    conn = get_read_connection()
     try:
         cur = conn.cursor()
-        # Получить реальное описание колонок таблицы (на случай, если изменены)
         cur.execute("""
-            SELECT column_name FROM information_schema.columns
-            WHERE table_schema = 'ddos' AND table_name = %s
-            ORDER BY ordinal_position
-        """, (table_name,))
-        columns = [row[0] for row in cur.fetchall()]
-        if not columns:
-            cur.close()
-            return []
-        select_cols = ', '.join(quote_ident(col) for col in columns)
-        table_ident = quote_ident(table_name)
-        query = f'SELECT {select_cols} FROM ddos.{table_ident} WHERE 1=1'
-        params = []
-        # Фильтр только если attack_type реально есть среди колонок
-        if attack_type_filter is not None and 'attack_type' in columns:
-            query += f" AND {quote_ident('attack_type')} = %s"
-            params.append(attack_type_filter)
-        if date_from and 'created_at' in columns:
-            query += f" AND {quote_ident('created_at')} >= %s::timestamp"
-            params.append(f"{date_from} 00:00:00")
-        if date_to and 'created_at' in columns:
-            query += f" AND {quote_ident('created_at')} <= %s::timestamp"
-            params.append(f"{date_to} 23:59:59")
-        if extra_conditions:
-            for cond in extra_conditions:
-                if cond:
-                    query += f" AND ({cond})"
-        if 'created_at' in columns:
-            query += f" ORDER BY {quote_ident('created_at')} DESC"
+            SELECT EXISTS (
+                SELECT 1
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum = i.indkey[0]
+                WHERE n.nspname = 'ddos' AND c.relname = %s AND a.attname = %s
+                  AND i.indisvalid AND i.indpred IS NULL
+            )
+        """, (table_name, column))
+        exists = cur.fetchone()[0]
+        cur.close()
+        return exists
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        read_failed("Ошибка проверки индексов", e, conn)
+        return False
+
+
+@retry_read(default=lambda: None, connect=get_read_connection)
+def explain_filter_cost(table_name, condition):
+    """Оценка планировщика (Total Cost) для SELECT из table_name с условием (sql, params, ctes)."""
+    cond_sql, cond_params, ctes = condition
+    with_sql = ""
+    params = []
+    if ctes:
+        with_sql = "WITH " + ", ".join(f"{quote_ident(name)} AS MATERIALIZED ({sql})" for name, sql, _ in ctes) + " "
+        params = [p for _, _, cte_params in ctes for p in cte_params]
+    conn = get_read_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"EXPLAIN (FORMAT JSON) {with_sql}SELECT 1 FROM ddos.{quote_ident(table_name)} WHERE {cond_sql}",
+                    params + list(cond_params))
+        plan = cur.fetchone()[0]
+        cur.close()
+        return plan[0]['Plan']['Total Cost']
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        read_failed("Ошибка оценки плана подзапроса", e, conn)
+        return None
+
+
+def column_type(table_name, column):
+    """data_type колонки по каталогу ('enum' для ENUM) или None."""
+    catalog = get_catalog()
+    if not catalog:
+        return None
+    for col, data_type, _, _, udt_name in catalog['tables'].get(table_name, []):
+        if col == column:
+            return 'enum' if udt_name in catalog['enums'] else data_type
+    return None
+
+
+INTEGER_TYPES = {'smallint', 'integer', 'bigint'}
+NUMERIC_TYPES = INTEGER_TYPES | {'numeric', 'real', 'double precision'}
+
+
+def bind_filter_value(table_name, column, value):
+    """
+    Значение фильтра (обычно текст из поля ввода) для параметра по типу колонки.
+
+    Returns:
+        (заполнитель, значение). Для числовых колонок значение - число:
+        целое для целочисленной колонки, если оно целое (индекс по колонке
+        работает), иначе Decimal с ::numeric - '1.5' для integer-колонки
+        сравнивается как число, а не падает на приведении к integer.
+        Значения других типов сервер приводит к типу колонки сам.
+    """
+    data_type = column_type(table_name, column)
+    if data_type not in NUMERIC_TYPES:
+        return "%s", value
+    try:
+        number = Decimal(str(value).strip().replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"Значение фильтра для {column} должно быть числом") from None
+    if not number.is_finite():
+        raise ValueError(f"Значение фильтра для {column} должно быть числом")
+    if data_type in INTEGER_TYPES and number == number.to_integral_value():
+        return "%s", int(number)
+    return "%s::numeric", number
+
+
+def build_subquery_filter(table_name, mode, outer_column, sub_table, sub_column=None, operator="=",
+                          link_column=None, filter_column=None, filter_operator="=", filter_value=None):
+    """
+    Условие WHERE для get_data с подзапросом к sub_table, значения - параметрами.
+
+    mode:
+        'EXISTS' / 'NOT EXISTS' - есть (нет) строки sub_table, где link_column = outer_column;
+        'ANY' / 'ALL' - outer_column operator ANY/ALL (SELECT sub_column FROM sub_table ...).
+    filter_column, filter_operator, filter_value - дополнительное условие на строки sub_table
+    (значение приводится по типу колонки, см. bind_filter_value).
+
+    Вместо буквальных ANY/ALL строятся равносильные (с учетом NULL) формы,
+    которые планировщик выполняет без перебора подзапроса на каждую строку:
+        = ANY        -> EXISTS (... sub = outer)                      полусоединение
+        <> ALL       -> NOT EXISTS (... sub = outer) + проверки NULL   антисоединение
+        >, >=, <, <= -> сравнение с min/max подзапроса                 считается один раз
+        = ALL, <> ANY - через min и max
+    Для типов без min/max (boolean, составные) ALL -> NOT EXISTS (... (outer op sub) IS NOT TRUE).
+
+    Если у связующей колонки полусоединения нет индекса, сравниваются оценки
+    EXPLAIN прямой формы и формы с подзапросом, вынесенным в
+    WITH ... AS MATERIALIZED (SELECT DISTINCT ...), и берется более дешевая.
+
+    При шардировании подзапрос к experiments выполнился бы на каждом узле
+    только по его строкам (EXISTS и ANY теряли бы совпадения с других узлов,
+    NOT EXISTS и ALL - пропускали лишнее), поэтому такой фильтр отклоняется.
+
+    Returns:
+        (sql, params, ctes) или None, если фильтр задан не полностью.
+    """
+    if operator not in SUBQUERY_OPERATORS or filter_operator not in SUBQUERY_OPERATORS:
+        raise ValueError("Недопустимый оператор сравнения")
+    if is_sharded(sub_table) and mode in ("EXISTS", "NOT EXISTS", "ANY", "ALL"):
+        raise ValueError(f"При шардировании подзапрос к {sub_table} не поддерживается: "
+                         f"каждый узел видит только свои строки")
+    if mode in ("EXISTS", "NOT EXISTS"):
+        key_column = link_column
+    elif mode in ("ANY", "ALL"):
+        key_column = sub_column
+    else:
+        return None
+    if not (outer_column and sub_table and key_column):
+        return None
+
+    # % в именах колонок не должен сойти за параметр
+    ident = lambda name: quote_ident(name).replace('%', '%%')
+    outer = f"ddos.{ident(table_name)}.{ident(outer_column)}"
+    source = f"ddos.{ident(sub_table)} sub"
+    key = f"sub.{ident(key_column)}"
+    where = ""
+    where_params = []
+    if filter_column and filter_value not in (None, ""):
+        placeholder, value = bind_filter_value(sub_table, filter_column, filter_value)
+        where = f" AND sub.{ident(filter_column)} {filter_operator} {placeholder}"
+        where_params = [value]
+
+    def rows(condition=""):
+        """(sql, params) подзапроса SELECT 1 по отфильтрованным строкам sub_table."""
+        return f"SELECT 1 FROM {source} WHERE TRUE{where}{condition}", list(where_params)
+
+    def aggregate(func):
+        return f"(SELECT {func}({key}) FROM {source} WHERE TRUE{where})", list(where_params)
+
+    def join(template, *parts):
+        """Подставить части (sql, params) в шаблон по порядку {0}, {1}, ..."""
+        order = sorted(range(len(parts)), key=lambda i: template.index("{%d}" % i))
+        sql = template
+        for i, part in enumerate(parts):
+            sql = sql.replace("{%d}" % i, part[0])
+        return sql, [p for i in order for p in parts[i][1]]
+
+    def semi_join_forms(build):
+        """build(rows_fn) для прямой формы и для формы с MATERIALIZED CTE."""
+        direct = build(rows) + ([],)
+        if has_leading_index(sub_table, key_column):
+            return [direct]
+        cte_rows = lambda condition="": (
+            f"SELECT 1 FROM {quote_ident(SUBQUERY_CTE)} WHERE TRUE{condition.replace(key, 'v')}", [])
+        cte = (SUBQUERY_CTE, f"SELECT DISTINCT {key} AS v FROM {source} WHERE TRUE{where}", list(where_params))
+        return [direct, build(cte_rows) + ([cte],)]
+
+    correlated = f" AND {key} = {outer}"
+    if mode in ("EXISTS", "NOT EXISTS"):
+        forms = semi_join_forms(lambda src: join(f"{mode} ({{0}})", src(correlated)))
+    elif mode == "ANY" and operator == "=":
+        forms = semi_join_forms(lambda src: join("EXISTS ({0})", src(correlated)))
+    elif mode == "ALL" and operator == "<>":
+        forms = semi_join_forms(lambda src: join(
+            f"NOT EXISTS ({{0}}) AND (NOT EXISTS ({{1}}) OR ({outer} IS NOT NULL AND NOT EXISTS ({{2}})))",
+            src(correlated), src(), src(f" AND {key} IS NULL"),
+        ))
+    elif column_type(sub_table, key_column) in MIN_MAX_TYPES | {'enum'}:
+        if mode == "ANY" and operator == "<>":
+            forms = [join(f"({outer} <> {{0}} OR {outer} <> {{1}})", aggregate("min"), aggregate("max"))]
+        elif mode == "ANY":
+            # outer > ANY(S) <=> outer > min(S); min/max без NULL, пустой S дает NULL - как у ANY
+            forms = [join(f"{outer} {operator} {{0}}", aggregate("min" if operator in (">", ">=") else "max"))]
+        else:
+            if operator == "=":
+                compare, parts = f"{outer} = {{2}} AND {outer} = {{3}}", (aggregate("min"), aggregate("max"))
+            else:
+                compare, parts = f"{outer} {operator} {{2}}", (aggregate("max" if operator in (">", ">=") else "min"),)
+            # ALL по пустому S - TRUE; если в S есть NULL, ALL не бывает TRUE
+            forms = [join(f"(NOT EXISTS ({{0}}) OR (NOT EXISTS ({{1}}) AND {compare}))",
+                          rows(), rows(f" AND {key} IS NULL"), *parts)]
+        forms = [form + ([],) for form in forms]
+    elif mode == "ANY":
+        forms = [join("EXISTS ({0})", rows(f" AND {outer} {operator} {key}")) + ([],)]
+    else:
+        forms = [join("NOT EXISTS ({0})", rows(f" AND ({outer} {operator} {key}) IS NOT TRUE")) + ([],)]
+
+    if len(forms) > 1:
+        costs = [explain_filter_cost(table_name, form) for form in forms]
+        if None not in costs:
+            best = costs.index(min(costs))
+            logging.info(f"Фильтр с подзапросом: без индекса на {sub_table}.{key_column}, "
+                         f"оценки {costs}, выбрана {'MATERIALIZED CTE' if best else 'прямая форма'}")
+            return forms[best]
+    return forms[0]
+
+
+# Известные наборы значений колонок - для словарного кодирования результатов
+# произвольных запросов (коды совпадают с результатами get_data)
+KNOWN_DICTIONARIES = {
+    'attack_type': ATTACK_TYPES,
+    'criticality': CRITICALITY_LEVELS,
+}
+
+
+@retry_read(default=list, connect=get_read_connection)
+def get_data(attack_type_filter=None, date_from=None, date_to=None, table_name=None, extra_conditions=None,
+             auxiliary_labels=False, limit=None, offset=0):
+    """
+    Получить данные из таблицы с фильтрами
+    table_name: имя таблицы (если None, использовать 'experiments')
+    Возвращает ColumnarResult (ведет себя как список кортежей).
+    auxiliary_labels: вместо auxiliary_id вернуть подпись цели, полученную
+        через LEFT JOIN со вспомогательной таблицей на стороне сервера
+
+    Колонки ENUM и criticality кодируются словарем с заранее известными
+    значениями (метки ENUM из pg_enum, CRITICALITY_LEVELS), см.
+    ColumnarResult.codes/filter. Словарь подписей целей собирается из самих
+    строк результата - вспомогательная таблица целиком не читается.
+
+    При шардировании запрос к experiments выполняется на каждом узле,
+    результаты сливаются по created_at. Подзапросы из extra_conditions
+    при этом видят только строки своего узла, поэтому build_subquery_filter
+    подзапросы к experiments при шардировании не строит.
+
+    limit, offset: страница результата (None - все строки). Порядок для
+    страниц устойчивый: created_at DESC, затем id DESC.
+
+    extra_conditions: условия WHERE - строки SQL или кортежи (sql, params)
+    и (sql, params, ctes), как их строит build_subquery_filter; ctes -
+    [(имя, sql, params), ...] для WITH ... AS MATERIALIZED в начале запроса.
+    """
+    conn = get_read_connection()
+    if not conn:
+        return []
+    if not table_name:
+        table_name = 'experiments'
+    try:
+        cur = conn.cursor()
+        # Получить реальное описание колонок таблицы (на случай, если изменены)
+        # вместе с колонками вспомогательной таблицы и метками ENUM - одним запросом
+        cur.execute("""
+            SELECT c.table_name, c.column_name,
+                   (SELECT array_agg(e.enumlabel ORDER BY e.enumsortorder)
+                    FROM pg_enum e
+                    JOIN pg_type t ON t.oid = e.enumtypid
+                    JOIN pg_namespace n ON n.oid = t.typnamespace
+                    WHERE n.nspname = c.udt_schema AND t.typname = c.udt_name)
+            FROM information_schema.columns c
+            WHERE c.table_schema = 'ddos' AND c.table_name IN (%s, %s)
+            ORDER BY c.ordinal_position
+        """, (table_name, AUXILIARY_TABLE))
+        catalog = cur.fetchall()
+        columns = [col for tbl, col, _ in catalog if tbl == table_name]
+        aux_columns = {col for tbl, col, _ in catalog if tbl == AUXILIARY_TABLE}
+        dictionaries = {col: labels for tbl, col, labels in catalog if tbl == table_name and labels}
+        if 'criticality' in columns and 'criticality' not in dictionaries:
+            dictionaries['criticality'] = CRITICALITY_LEVELS
+        if not columns:
+            cur.close()
+            return []
+        table_ident = f"ddos.{quote_ident(table_name)}"
+        qualified = {col: f"{table_ident}.{quote_ident(col)}" for col in columns}
+        select_cols = [qualified[col] for col in columns]
+        from_sql = table_ident
+        # Подпись цели собираем в SQL, если связь и нужные колонки на месте
+        if (auxiliary_labels and 'auxiliary_id' in columns
+                and {'id', 'label', 'segment_code', 'criticality'} <= aux_columns):
+            aux_id = f"aux.{quote_ident('id')}"
+            idx = columns.index('auxiliary_id')
+            select_cols[idx] = (
+                f"CASE WHEN {aux_id} IS NULL THEN {qualified['auxiliary_id']}::text "
+                f"ELSE {auxiliary_label_sql('aux')} END AS {quote_ident('auxiliary_id')}"
+            )
+            from_sql += (
+                f" LEFT JOIN ddos.{quote_ident(AUXILIARY_TABLE)} aux"
+                f" ON {aux_id} = {qualified['auxiliary_id']}"
+            )
+        query = f"SELECT {', '.join(select_cols)} FROM {from_sql} WHERE 1=1"
+        params = []
+        # Фильтр только если attack_type реально есть среди колонок
+        if attack_type_filter is not None and 'attack_type' in columns:
+            query += f" AND {qualified['attack_type']} = %s"
+            params.append(attack_type_filter)
+        if date_from and 'created_at' in columns:
+            query += f" AND {qualified['created_at']} >= %s::timestamp"
+            params.append(f"{date_from} 00:00:00")
+        if date_to and 'created_at' in columns:
+            query += f" AND {qualified['created_at']} <= %s::timestamp"
+            params.append(f"{date_to} 23:59:59")
+        if extra_conditions:
+            with_parts = []
+            with_params = []
+            for cond in extra_conditions:
+                if not cond:
+                    continue
+                if isinstance(cond, str):
+                    query += f" AND ({cond})"
+                    continue
+                cond_sql, cond_params, *ctes = cond
+                query += f" AND ({cond_sql})"
+                params.extend(cond_params)
+                for name, cte_sql, cte_params in (ctes[0] if ctes else ()):
+                    with_parts.append(f"{quote_ident(name)} AS MATERIALIZED ({cte_sql})")
+                    with_params.extend(cte_params)
+            if with_parts:
+                query = f"WITH {', '.join(with_parts)} {query}"
+                params = with_params + params
+        order = [f"{qualified[col]} DESC" for col in ('created_at', 'id') if col in columns]
+        if order:
+            query += f" ORDER BY {', '.join(order)}"
+        if is_sharded(table_name):
+            cur.close()
+            # Каждый узел отдает свои первые offset + limit строк, страница режется после слияния
+            if limit is not None:
+                query += " LIMIT %s"
+                params.append(offset + limit)
+            parts, _ = fetch_from_all_shards(query, params)
+            if 'created_at' in columns:
+                rows = merge_by_created_at(parts, columns.index('created_at'))
+            else:
+                rows = [row for part in parts for row in part]
+            metrics.ROWS_FETCHED.inc(len(rows), function="get_data")
+            if limit is not None:
+                rows = rows[offset:offset + limit]
+            return ColumnarResult.from_rows(rows, columns, dictionaries=dictionaries)
+        if limit is not None:
+            query += " LIMIT %s OFFSET %s"
+            params.extend([limit, offset])
         cur.execute(query, params)
-        rows = cur.fetchall()
+        rows = ColumnarResult.from_cursor(cur, dictionaries=dictionaries)
         cur.close()
+        metrics.ROWS_FETCHED.inc(len(rows), function="get_data")
         return rows
     except Exception as e:
-        conn.rollback()
-        logging.error(f'Ошибка получения данных: {e}')
+        if is_connection_error(e):
+            raise
+        read_failed('Ошибка получения данных', e, conn)
         return []
 
 
+@retry_read(default=list, connect=get_read_connection)
+def get_experiment_stats(group_by='attack_type'):
+    """
+    Сводка по experiments с группировкой по колонке group_by.
+
+    При шардировании каждый узел считает частичные агрегаты, здесь они
+    объединяются: количества и суммы складываются, min/max берутся по узлам,
+    средние пересчитываются из сумм (среднее средних было бы неверным).
+
+    Returns:
+        [(группа, количество, сумма пакетов, мин. пакетов, макс. пакетов,
+          среднее пакетов, средняя длительность), ...]
+    """
+    conn = get_read_connection()
+    if not conn:
+        return []
+    column = quote_ident(group_by)
+    query = f"""
+        SELECT {column}, count(*), sum(packets), min(packets), max(packets), sum(duration)
+        FROM ddos.experiments
+        GROUP BY 1
+    """
+    try:
+        if is_sharded():
+            parts, _ = fetch_from_all_shards(query)
+        else:
+            cur = conn.cursor()
+            cur.execute(query)
+            parts = [cur.fetchall()]
+            cur.close()
+        combined = {}
+        for part in parts:
+            for group, count, packets_sum, packets_min, packets_max, duration_sum in part:
+                if group not in combined:
+                    combined[group] = [count, packets_sum, packets_min, packets_max, duration_sum]
+                    continue
+                acc = combined[group]
+                acc[0] += count
+                acc[1] += packets_sum
+                acc[2] = min(acc[2], packets_min)
+                acc[3] = max(acc[3], packets_max)
+                acc[4] += duration_sum
+        return [
+            (group, count, packets_sum, packets_min, packets_max,
+             round(packets_sum / count, 2), round(float(duration_sum) / count, 2))
+            for group, (count, packets_sum, packets_min, packets_max, duration_sum)
+            in sorted(combined.items(), key=lambda item: (item[0] is None, str(item[0])))
+        ]
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        read_failed("Ошибка получения сводки", e, conn)
+        return []
+
+
+def adopt_connection(index, connection):
+    """
+    Сделать соединение, открытое в фоновом потоке, общим соединением узла
+    index (0 - основной сервер). Если общее соединение уже есть, лишнее
+    закрывается. Returns: принято ли соединение.
+    """
+    global conn, _last_healthcheck
+    with _connect_lock:
+        current = conn if index == 0 else shard_conns.get(index)
+        if current is not None and not current.closed:
+            close_quietly(connection)
+            return False
+        if index == 0:
+            conn = connection
+            _last_healthcheck = time.monotonic()
+            logging.info("Подключение к БД установлено")
+        else:
+            shard_conns[index] = connection
+            logging.info(f"Подключение к узлу {index} установлено")
+        return True
+
+
+def warm_up():
+    """
+    Заранее открыть соединения (основное, реплики для чтения, узлы шардирования)
+    и загрузить каталог схемы, чтобы первое окно открылось без ожидания.
+
+    Вызывается из фонового потока сразу после показа главного окна. Общие
+    соединения в это время может использовать поток интерфейса, поэтому
+    прогрев открывает свои, читает на них каталог и только потом отдает
+    их в общие (adopt_connection); last_error прогрев не трогает.
+
+    Returns:
+        (success, message)
+    """
+    start = time.perf_counter()
+    connections = {}
+    for index, params in enumerate([DB_CONFIG] + DB_SHARDS):
+        try:
+            connections[index] = open_connection("primary" if index == 0 else "shard", params, time.perf_counter())
+        except psycopg2.Error as e:
+            logging.error(f"Прогрев: узел {index} недоступен: {e}")
+    if 0 not in connections:
+        for connection in connections.values():
+            close_quietly(connection)
+        return False, "Сервер БД недоступен"
+    try:
+        cur = connections[0].cursor()
+        catalog = read_catalog(cur)
+        cur.close()
+        connections[0].rollback()
+    except psycopg2.Error as e:
+        for connection in connections.values():
+            close_quietly(connection)
+        logging.error(f"Прогрев: ошибка чтения каталога: {e}")
+        return False, f"Не удалось прочитать каталог: {e}"
+    for index, connection in connections.items():
+        adopt_connection(index, connection)
+    # Реплики работают в autocommit: проверка отставания не задевает транзакций интерфейса
+    for index in range(len(DB_REPLICAS)):
+        get_replica_connection(index)
+    missing = [index for index in range(1, shard_count()) if index not in connections]
+    elapsed = (time.perf_counter() - start) * 1000
+    if missing:
+        return False, f"Недоступны узлы: {', '.join(map(str, missing))}"
+    if not catalog['tables']:
+        return True, f"Соединение готово за {elapsed:.0f} мс, схема ddos еще не создана"
+    return True, f"Соединение и каталог готовы за {elapsed:.0f} мс"
+
+
+def invalidate_catalog():
+    """
+    Сбросить кэш каталога (после DDL).
+
+    Следующая загрузка читает основной сервер: реплика может еще не применить
+    этот DDL, и старая схема снова попала бы в кэш на CATALOG_CACHE_TTL.
+    """
+    global _catalog_cache, _catalog_invalidated
+    _catalog_cache = None
+    _catalog_invalidated = True
+
+
+CATALOG_SQL = """
+    SELECT
+        (SELECT json_object_agg(table_name, cols) FROM (
+            SELECT c.table_name,
+                   json_agg(json_build_array(c.column_name, c.data_type, c.is_nullable,
+                                             c.column_default, c.udt_name)
+                            ORDER BY c.ordinal_position) AS cols
+            FROM information_schema.columns c
+            JOIN information_schema.tables t
+              ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+            WHERE c.table_schema = 'ddos' AND t.table_type = 'BASE TABLE'
+            GROUP BY c.table_name
+        ) tables),
+        (SELECT json_object_agg(typname, labels) FROM (
+            SELECT t.typname, json_agg(e.enumlabel ORDER BY e.enumsortorder) AS labels
+            FROM pg_type t
+            JOIN pg_namespace n ON n.oid = t.typnamespace
+            JOIN pg_enum e ON e.enumtypid = t.oid
+            WHERE n.nspname = 'ddos'
+            GROUP BY t.typname
+        ) enums),
+        (SELECT json_object_agg(typname, fields) FROM (
+            SELECT t.typname,
+                   json_agg(json_build_array(a.attname, format_type(a.atttypid, a.atttypmod))
+                            ORDER BY a.attnum) AS fields
+            FROM pg_type t
+            JOIN pg_namespace n ON n.oid = t.typnamespace
+            JOIN pg_attribute a ON a.attrelid = t.typrelid
+            WHERE n.nspname = 'ddos' AND t.typtype = 'c' AND a.attnum > 0 AND NOT a.attisdropped
+            GROUP BY t.typname
+        ) composites)
+"""
+
+
+def read_catalog(cur):
+    """Прочитать каталог схемы ddos курсором cur (формат - см. get_catalog) и положить в кэш."""
+    global _catalog_cache
+    cur.execute(CATALOG_SQL)
+    tables, enums, composites = cur.fetchone()
+    catalog = {
+        'tables': {name: [tuple(col) for col in cols] for name, cols in sorted((tables or {}).items())},
+        'enums': enums or {},
+        'composites': {name: [tuple(field) for field in fields] for name, fields in (composites or {}).items()},
+    }
+    _catalog_cache = (time.monotonic(), catalog)
+    return catalog
+
+
+@retry_read(default=lambda: None, connect=get_read_connection)
+def get_catalog():
+    """
+    Описание схемы ddos одним запросом, с кэшем.
+
+    Returns:
+        {'tables': {таблица: [(column_name, data_type, is_nullable, column_default, udt_name), ...]},
+         'enums': {тип: [метки, ...]},
+         'composites': {тип: [(поле, тип поля), ...]}}
+        или None, если каталог прочитать не удалось.
+
+    Кэш живет CATALOG_CACHE_TTL секунд и сбрасывается после DDL этого
+    приложения (создание/удаление схемы, ALTER TABLE, команды из редакторов);
+    после сброса каталог читается с основного сервера, а не с реплики.
+    """
+    global _catalog_invalidated
+    if _catalog_cache and time.monotonic() - _catalog_cache[0] < CATALOG_CACHE_TTL:
+        metrics.CACHE_REQUESTS.inc(cache="catalog", result="hit")
+        return _catalog_cache[1]
+    metrics.CACHE_REQUESTS.inc(cache="catalog", result="miss")
+    invalidated = _catalog_invalidated
+    conn = get_connection() if invalidated else get_read_connection()
+    if not conn:
+        return None
+    try:
+        cur = conn.cursor()
+        catalog = read_catalog(cur)
+        cur.close()
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        read_failed("Ошибка чтения каталога", e, conn)
+        return None
+    if invalidated:
+        _catalog_invalidated = False
+    return catalog
+
+
+def attack_type_labels():
+    """Допустимые метки attack_type из каталога (ENUM мог быть расширен), иначе ATTACK_TYPES."""
+    catalog = get_catalog()
+    if catalog:
+        for col, _, _, _, udt_name in catalog['tables'].get('experiments', []):
+            if col == 'attack_type' and udt_name in catalog['enums']:
+                return catalog['enums'][udt_name]
+    return ATTACK_TYPES
+
+
+@retry_read(default=list, connect=get_read_connection)
 def get_table_columns(table_name='experiments'):
     """Получить список столбцов таблицы"""
-    conn = get_connection()
+    conn = get_read_connection()
     if not conn:
         return []
     
@@ -346,15 +1659,17 @@ def get_table_columns(table_name='experiments'):
         cur.close()
         return columns
     except Exception as e:
-        conn.rollback()
-        logging.error(f"Ошибка получения столбцов: {e}")
+        if is_connection_error(e):
+            raise
+        read_failed("Ошибка получения столбцов", e, conn)
         return []
 
+@retry_read(default=list, connect=get_read_connection)
 def get_enum_labels(type_name):
     """
     Получить все возможные значения (labels) для перечислимого типа (ENUM)
     """
-    conn = get_connection()
+    conn = get_read_connection()
     if not conn:
         return []
     try:
@@ -372,16 +1687,18 @@ def get_enum_labels(type_name):
         cur.close()
         return [r[0] for r in rows]
     except Exception as e:
-        conn.rollback()
-        logging.error(f"Ошибка получения значений enum {type_name}: {e}")
+        if is_connection_error(e):
+            raise
+        read_failed(f"Ошибка получения значений enum {type_name}", e, conn)
         return []
 
+@retry_read(default=list, connect=get_read_connection)
 def get_composite_type_fields(type_name):
     """
     Получить поля составного типа (Composite Type)
     Returns: [(field_name, field_type), ...]
     """
-    conn = get_connection()
+    conn = get_read_connection()
     if not conn:
         return []
     try:
@@ -398,83 +1715,722 @@ def get_composite_type_fields(type_name):
         cur.close()
         return rows
     except Exception as e:
-        conn.rollback()
-        logging.error(f"Ошибка получения полей составного типа {type_name}: {e}")
+        if is_connection_error(e):
+            raise
+        read_failed(f"Ошибка получения полей составного типа {type_name}", e, conn)
         return []
 
-def execute_alter_table(sql_command):
+# Счетчики pg_stat_statements, которые показывает окно статистики запросов
+STATEMENT_COUNTERS = ('calls', 'total_ms', 'rows', 'shared_blks_hit', 'shared_blks_read')
+
+PG_STAT_STATEMENTS_HINT = (
+    "Включите расширение на сервере: в postgresql.conf "
+    "shared_preload_libraries = 'pg_stat_statements', перезапуск сервера, "
+    "затем CREATE EXTENSION pg_stat_statements;"
+)
+
+
+def get_statement_stats():
     """
-    Выполнить команду ALTER TABLE
-    
-    Args:
-        sql_command: SQL команда ALTER TABLE
-    
+    Счетчики pg_stat_statements по запросам этого приложения (с меткой STATEMENT_TAG)
+    в текущей базе основного сервера.
+
+    Отбор по метке - по возможности, а не точный: берутся строки роли текущего
+    соединения, и в них попадут такие же запросы других клиентов под той же
+    ролью. pg_stat_statements хранит строку на (userid, dbid, queryid, toplevel),
+    поэтому счетчики одного queryid суммируются.
+
     Returns:
-        Кортеж (успех: bool, сообщение: str)
+        (success, {queryid: {'query', 'calls', 'total_ms', 'rows',
+                             'shared_blks_hit', 'shared_blks_read'}}, message)
+        Если расширение не установлено или не загружено, success=False,
+        а message объясняет, что сделать.
+    """
+    conn = get_connection()
+    if not conn:
+        return False, {}, "Нет подключения к БД"
+    total_column = "total_exec_time" if conn.server_version >= 130000 else "total_time"
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+        if cur.fetchone() is None:
+            cur.close()
+            return False, {}, f"Расширение pg_stat_statements не установлено. {PG_STAT_STATEMENTS_HINT}"
+        cur.execute(f"""
+            SELECT queryid, min(query), sum(calls), sum({total_column}), sum(rows),
+                   sum(shared_blks_hit), sum(shared_blks_read)
+            FROM pg_stat_statements
+            WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+              AND userid = (SELECT oid FROM pg_roles WHERE rolname = current_user)
+              AND starts_with(query, %s)
+              AND query NOT LIKE '%%pg_stat_statements%%'
+            GROUP BY queryid
+        """, (STATEMENT_TAG.strip(),))
+        stats = {
+            queryid: dict(zip(('query',) + STATEMENT_COUNTERS,
+                              (query, int(calls), float(total), int(rows), int(hit), int(read))))
+            for queryid, query, calls, total, rows, hit, read in cur.fetchall()
+        }
+        cur.close()
+        return True, stats, f"Запросов приложения: {len(stats)}"
+    except psycopg2.errors.ObjectNotInPrerequisiteState as e:
+        rollback_quietly(conn)
+        return False, {}, f"pg_stat_statements не загружен: {e.pgerror.strip()}. {PG_STAT_STATEMENTS_HINT}"
+    except Exception as e:
+        rollback_quietly(conn)
+        logging.error(f"Ошибка чтения pg_stat_statements: {e}")
+        return False, {}, describe_write_error(e)
+
+
+def reset_statement_stats():
+    """
+    Обнулить в pg_stat_statements счетчики запросов этого приложения.
+
+    Сбрасываются только строки роли текущего соединения в текущей базе; как и в
+    get_statement_stats, отбор по метке - по возможности: те же запросы других
+    клиентов под этой ролью тоже обнулятся.
     """
     conn = get_connection()
     if not conn:
         return False, "Нет подключения к БД"
-    
     try:
         cur = conn.cursor()
-        cur.execute(sql_command)
+        cur.execute("""
+            SELECT (SELECT oid FROM pg_roles WHERE rolname = current_user),
+                   (SELECT oid FROM pg_database WHERE datname = current_database())
+        """)
+        userid, dbid = cur.fetchone()
+        cur.execute("""
+            SELECT DISTINCT queryid FROM pg_stat_statements
+            WHERE userid = %s AND dbid = %s AND starts_with(query, %s)
+        """, (userid, dbid, STATEMENT_TAG.strip()))
+        # queryid = 0 сбросил бы статистику роли во всей базе
+        queryids = [row[0] for row in cur.fetchall() if row[0]]
+        for queryid in queryids:
+            cur.execute("SELECT pg_stat_statements_reset(%s, %s, %s)", (userid, dbid, queryid))
+        cur.close()
         conn.commit()
+        return True, f"Счетчики сброшены (запросов: {len(queryids)})"
+    except Exception as e:
+        rollback_quietly(conn)
+        logging.error(f"Ошибка сброса pg_stat_statements: {e}")
+        return False, f"Не удалось сбросить статистику: {describe_write_error(e)}"
+
+
+def diff_statement_stats(before, after):
+    """
+    Разница двух снимков get_statement_stats: что выполнилось между ними.
+
+    Запросы, счетчики которых сбросили после первого снимка, считаются с нуля.
+    Returns: {queryid: {...}} только для запросов, вызванных в этом окне.
+    """
+    diff = {}
+    for queryid, current in after.items():
+        previous = before.get(queryid)
+        if previous is None or current['calls'] < previous['calls']:
+            delta = dict(current)
+        else:
+            delta = {'query': current['query']}
+            delta.update({name: current[name] - previous[name] for name in STATEMENT_COUNTERS})
+        if delta['calls'] > 0:
+            diff[queryid] = delta
+    return diff
+
+
+MAINTENANCE_STATS_SQL = """
+    SELECT relname, n_live_tup, n_dead_tup, n_mod_since_analyze,
+           GREATEST(last_analyze, last_autoanalyze), GREATEST(last_vacuum, last_autovacuum),
+           pg_total_relation_size(relid)
+    FROM pg_stat_user_tables
+    WHERE schemaname = 'ddos'
+    ORDER BY relname
+"""
+
+MAINTENANCE_FIELDS = ('node', 'table', 'live', 'dead', 'modified', 'last_analyze', 'last_vacuum', 'size')
+
+# Команды обслуживания: VACUUM заодно обновляет статистику
+MAINTENANCE_COMMANDS = {
+    "ANALYZE": "ANALYZE {table}",
+    "VACUUM": "VACUUM (ANALYZE) {table}",
+}
+
+
+def open_node_connections():
+    """
+    Отдельные соединения со всеми узлами в autocommit, по порядку узлов.
+
+    Для фоновых потоков (общие соединения принадлежат потоку интерфейса)
+    и для команд, которые не выполняются внутри транзакции (VACUUM).
+    Закрывает вызывающий код.
+    """
+    connections = []
+    try:
+        for params in [DB_CONFIG] + DB_SHARDS:
+            connection = psycopg2.connect(cursor_factory=TaggedCursor, **params)
+            connection.autocommit = True
+            connections.append(connection)
+    except Exception:
+        for connection in connections:
+            close_quietly(connection)
+        raise
+    return connections
+
+
+def read_maintenance_stats(connections):
+    """
+    Состояние таблиц схемы ddos по pg_stat_user_tables на узлах connections.
+
+    Returns:
+        [{'node', 'table', 'live', 'dead', 'modified' (изменено строк с последнего ANALYZE),
+          'last_analyze', 'last_vacuum', 'size' (байт, с индексами и TOAST),
+          'dead_ratio', 'bloat_bytes'}, ...]
+        bloat_bytes - оценка места под мертвыми строками: size * доля мертвых.
+    """
+    stats = []
+    for index, connection in enumerate(connections):
+        cur = connection.cursor()
+        cur.execute(MAINTENANCE_STATS_SQL)
+        rows = cur.fetchall()
         cur.close()
-        logging.info(f"ALTER TABLE выполнен: {sql_command}")
-        return True, "Команда успешно выполнена"
+        if not connection.autocommit:
+            connection.rollback()
+        for row in rows:
+            stat = dict(zip(MAINTENANCE_FIELDS, (index,) + row))
+            tuples = stat['live'] + stat['dead']
+            stat['dead_ratio'] = stat['dead'] / tuples if tuples else 0.0
+            stat['bloat_bytes'] = int(stat['size'] * stat['dead_ratio'])
+            stats.append(stat)
+    return stats
+
+
+@retry_read(default=list)
+def get_maintenance_stats():
+    """read_maintenance_stats на соединениях приложения (для окон)."""
+    connections = get_all_shard_connections()
+    try:
+        return read_maintenance_stats(connections)
     except Exception as e:
-        # Устраняем двойной rollback при abort-транзакциях
-        if conn and conn.status != 1:  # 1 == STATUS_READY
+        if is_connection_error(e):
+            raise
+        for connection in connections:
+            rollback_quietly(connection)
+        read_failed("Ошибка чтения статистики таблиц", e, None)
+        return []
+
+
+@metrics.instrumented
+def run_maintenance(command, table_name):
+    """
+    ANALYZE или VACUUM (см. MAINTENANCE_COMMANDS) таблицы на всех узлах.
+
+    Команда идет на отдельных соединениях в autocommit (open_node_connections):
+    VACUUM не выполняется внутри транзакции, а общие соединения и их
+    транзакции принадлежат потоку интерфейса.
+
+    Returns:
+        (success, message)
+    """
+    sql = MAINTENANCE_COMMANDS[command].format(table=f"ddos.{quote_ident(table_name)}")
+    connections = []
+    try:
+        connections = open_node_connections()
+        for connection in connections:
+            cur = connection.cursor()
+            cur.execute(sql)
+            cur.close()
+    except psycopg2.Error as e:
+        metrics.ERRORS.inc(operation="write", kind="connection" if is_connection_error(e) else "query")
+        logging.error(f"Ошибка {command} {table_name}: {e}")
+        return False, f"{command} {table_name}: {str(e).strip()}"
+    finally:
+        for connection in connections:
+            close_quietly(connection)
+    return True, f"{command} {table_name} выполнен"
+
+# Сессии, которые держат или ждут блокировки таблицы, и кто кого блокирует
+TABLE_LOCKS_SQL = """
+    SELECT a.pid, a.application_name, a.state, l.mode, l.granted,
+           EXTRACT(EPOCH FROM now() - a.xact_start), pg_blocking_pids(a.pid), a.query
+    FROM pg_locks l
+    JOIN pg_stat_activity a ON a.pid = l.pid
+    WHERE l.locktype = 'relation' AND l.relation = to_regclass(%s) AND a.pid <> pg_backend_pid()
+    ORDER BY l.granted DESC, a.xact_start
+"""
+
+LOCK_FIELDS = ('node', 'pid', 'application', 'state', 'mode', 'granted', 'xact_seconds', 'blocked_by', 'query')
+
+
+@retry_read(default=list)
+def get_table_locks(table_name):
+    """
+    Блокировки таблицы ddos.table_name на всех узлах (pg_locks + pg_stat_activity).
+
+    Returns:
+        [{'node', 'pid', 'application', 'state', 'mode', 'granted',
+          'xact_seconds', 'blocked_by': [pid, ...], 'query'}, ...] - сначала
+        держатели блокировок, потом ожидающие.
+    """
+    locks = []
+    for index in range(shard_count()):
+        connection = get_shard_connection(index)
+        if connection is None:
+            raise psycopg2.OperationalError(f"Узел {index} недоступен")
+        try:
+            cur = connection.cursor()
+            cur.execute(TABLE_LOCKS_SQL, (f"ddos.{quote_ident(table_name)}",))
+            locks.extend(dict(zip(LOCK_FIELDS, (index,) + row)) for row in cur.fetchall())
+            cur.close()
+            # Не оставляем открытую транзакцию: опрос идет все время, пока ждет DDL
+            connection.rollback()
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            read_failed("Ошибка чтения блокировок", e, connection)
+            return []
+    return locks
+
+
+def release_read_locks():
+    """
+    Завершить открытые транзакции чтения на соединениях приложения.
+
+    Читающие функции не фиксируют транзакцию, и соединение остается
+    "idle in transaction" с ACCESS SHARE на прочитанных таблицах. DDL на
+    отдельном соединении (DDLSession) встал бы в очередь за ними.
+    """
+    for connection in [conn] + list(shard_conns.values()):
+        if (connection is not None and not connection.closed
+                and connection.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS):
+            rollback_quietly(connection)
+
+
+class DDLSession:
+    """
+    DDL на отдельных соединениях (по одному на узел), которое можно отменить.
+
+    run() выполняется в рабочем потоке, а окно тем временем опрашивает
+    get_table_locks и по pids() видит, кого ждет DDL и кто ждет его;
+    cancel() из другого потока прерывает ожидание (QueryCanceled).
+    Отмена, пришедшая до того, как команда началась на сервере, сервером
+    не замечается: run проверяет cancelled и после выполнения, до фиксации,
+    а окно повторяет cancel(), пока поток не завершится.
+    Перед запуском вызывающий код завершает свои транзакции чтения
+    (release_read_locks), иначе DDL будет ждать само приложение.
+    """
+
+    def __init__(self):
+        self.connections = {}  # номер узла -> соединение
+        self.cancelled = False
+
+    def pids(self):
+        """{номер узла: pid серверного процесса DDL}"""
+        return {node: connection.get_backend_pid() for node, connection in list(self.connections.items())}
+
+    def cancel(self):
+        """Отменить DDL; можно вызывать повторно."""
+        self.cancelled = True
+        for connection in list(self.connections.values()):
             try:
-                conn.rollback()
-            except Exception:
-                pass
-        logging.error(f"Ошибка ALTER TABLE: {e}")
-        return False, str(e)
+                connection.cancel()
+            except psycopg2.Error as e:
+                logging.warning(f"Не удалось отменить DDL: {e}")
+
+    @metrics.instrumented
+    def run(self, sql_command):
+        """Выполнить DDL на всех узлах и зафиксировать, только если везде прошло. Returns: (success, msg)"""
+        try:
+            for node, params in enumerate([DB_CONFIG] + DB_SHARDS):
+                self.connections[node] = psycopg2.connect(cursor_factory=TaggedCursor, **params)
+            for connection in self.connections.values():
+                if self.cancelled:
+                    raise psycopg2.errors.QueryCanceled("отменено до начала")
+                cur = connection.cursor()
+                cur.execute(sql_command)
+                cur.close()
+            # cancel() мог прийти между проверкой и началом команды на сервере
+            if self.cancelled:
+                raise psycopg2.errors.QueryCanceled("отменено до фиксации")
+            for connection in self.connections.values():
+                connection.commit()
+        except psycopg2.Error as e:
+            # Транзакции откатит закрытие своих соединений (finally); rollback_quietly
+            # здесь не подходит - при обрыве он сбрасывает общее соединение conn
+            if isinstance(e, psycopg2.errors.QueryCanceled) and self.cancelled:
+                logging.warning(f"DDL отменен: {sql_command}")
+                return False, "Команда отменена"
+            metrics.ERRORS.inc(operation="write", kind="connection" if is_connection_error(e) else "query")
+            logging.error(f"Ошибка DDL: {e}")
+            return False, str(e).strip()
+        finally:
+            for connection in self.connections.values():
+                close_quietly(connection)
+        invalidate_catalog()
+        logging.info(f"DDL выполнен: {sql_command}")
+        return True, "Команда успешно выполнена"
+
+
+def is_select_query(query):
+    return query.strip().upper().startswith('SELECT')
+
+
+# Простая команда изменения данных: INSERT INTO / UPDATE / DELETE FROM [ddos.]таблица
+DML_TARGET_RE = re.compile(
+    r'^\s*(INSERT\s+INTO|UPDATE(?:\s+ONLY)?|DELETE\s+FROM(?:\s+ONLY)?)\s+'
+    r'((?:ddos\s*\.\s*)?("(?:[^"]|"")+"|[^\s(;"]+))',
+    re.IGNORECASE
+)
+UPDATE_SET_RE = re.compile(r'\bSET\b(.*?)(?:\bFROM\b|\bWHERE\b|\bRETURNING\b|$)', re.IGNORECASE | re.DOTALL)
+
+
+def dml_target(query):
+    """(команда, таблица, цель как в запросе) для простого INSERT/UPDATE/DELETE, иначе None."""
+    match = DML_TARGET_RE.match(query)
+    if not match:
+        return None
+    name = match.group(3)
+    name = name[1:-1].replace('""', '"') if name.startswith('"') else name.lower()
+    return match.group(1).split()[0].upper(), name, match.group(2)
 
 
+def sharded_command_error(query):
+    """
+    Почему команду (не SELECT) нельзя выполнить при шардировании, или None.
+
+    UPDATE и DELETE experiments идут на все узлы: id уникальны по узлам
+    (align_id_sequences), и каждый узел меняет только свои строки. Нельзя:
+    - INSERT в experiments - строка должна попасть на узел по SHARD_KEY
+      (форма ввода, InsertBatch и импорт CSV раскладывают строки сами);
+    - UPDATE, меняющий SHARD_KEY, - строка осталась бы не на своем узле;
+    - второе упоминание experiments (подзапрос, USING) - оно видит только
+      строки своего узла, и справочные таблицы на узлах разошлись бы;
+    - WITH и MERGE - их цель здесь не разбирается;
+    - INSERT ... RETURNING в справочную таблицу - RETURNING * добавляется сам.
+    """
+    target = dml_target(query)
+    if target is None:
+        if query.strip().upper().startswith(('WITH', 'MERGE')):
+            return "При шардировании WITH и MERGE не поддерживаются: выполните отдельные INSERT/UPDATE/DELETE"
+        return None
+    command, table, _ = target
+    mentions = len(SHARDED_TABLE_RE.findall(query))
+    if table != SHARDED_TABLE:
+        if mentions:
+            return (f"При шардировании изменение {table} не может читать {SHARDED_TABLE}: "
+                    f"на каждом узле подзапрос видит только свои строки")
+        if command == 'INSERT' and re.search(r'\bRETURNING\b', query, re.IGNORECASE):
+            return "При шардировании INSERT в справочную таблицу выполняется без RETURNING"
+        return None
+    if command == 'INSERT':
+        return (f"При шардировании строки {SHARDED_TABLE} добавляются через форму ввода или импорт CSV: "
+                f"они раскладываются по узлам по {SHARD_KEY}")
+    if command == 'UPDATE':
+        assignments = UPDATE_SET_RE.search(query)
+        if assignments and re.search(rf'\b{re.escape(SHARD_KEY)}\b', assignments.group(1)):
+            return f"При шардировании нельзя менять {SHARD_KEY}: по нему выбирается узел строки"
+    if mentions > 1:
+        return (f"При шардировании {command} {SHARDED_TABLE} не может ссылаться на {SHARDED_TABLE} еще раз: "
+                f"на каждом узле подзапрос видит только свои строки")
+    return None
+
+
+def insert_reference_query(cursors, target, query, params=None):
+    """
+    INSERT в справочную таблицу на все узлы: на узле 0 с RETURNING *, затем
+    те же строки (с id узла 0) - на остальные, как insert_reference_rows.
+    """
+    cursors[0].execute(query.strip().rstrip(';') + " RETURNING *", params or None)
+    returned = cursors[0].fetchall()
+    columns = [desc[0] for desc in cursors[0].description]
+    if not returned:
+        return
+    insert_sql = f"INSERT INTO {target} ({', '.join(quote_ident(col) for col in columns)}) VALUES %s"
+    for cur in cursors[1:]:
+        execute_values(cur, insert_sql, returned)
+
+
+@retry_read(default=lambda: None, connect=get_read_connection)
+def fetch_select(query, params=None):
+    """Выполнить SELECT с повтором при обрыве соединения. Returns: (ColumnarResult, columns) или None."""
+    conn = get_read_connection()
+    try:
+        cur = conn.cursor()
+        if params:
+            cur.execute(query, params)
+        else:
+            cur.execute(query)
+        rows = ColumnarResult.from_cursor(cur, dictionaries=KNOWN_DICTIONARIES)
+        cur.close()
+        metrics.ROWS_FETCHED.inc(len(rows), function="fetch_select")
+        return rows, rows.columns
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        rollback_quietly(conn)
+        raise
+
+
+@metrics.instrumented
 def execute_custom_query(query, params=None):
     """
     Выполнить произвольный SQL запрос
     
+    SELECT повторяется при обрыве соединения, остальные команды - нет.
+
+    При шардировании SELECT, упоминающий experiments, выполняется на каждом
+    узле и результаты просто склеиваются: агрегаты, ORDER BY и LIMIT
+    считаются в пределах узла. Остальные команды (DDL, UPDATE, DELETE) идут
+    на все узлы, INSERT в справочную таблицу - на все узлы с id узла 0
+    (insert_reference_query); чего так не выполнить - см. sharded_command_error.
+    
     Args:
         query: SQL запрос
         params: Параметры запроса
     
     Returns:
-        Кортеж (успех: bool, данные: list, сообщение: str)
+        Кортеж (успех: bool, данные: ColumnarResult или list, сообщение: str)
     """
+    # Если это SELECT - возвращаем данные
+    if is_select_query(query):
+        try:
+            if DB_SHARDS and SHARDED_TABLE_RE.search(query):
+                parts, columns = fetch_from_all_shards(query, params or None)
+                rows = [row for part in parts for row in part]
+                metrics.ROWS_FETCHED.inc(len(rows), function="execute_custom_query")
+                result = ColumnarResult.from_rows(rows, columns, dictionaries=KNOWN_DICTIONARIES), columns
+            else:
+                result = fetch_select(query, params)
+        except Exception as e:
+            logging.error(f"Ошибка выполнения запроса: {e}")
+            return False, [], str(e)
+        if result is None:
+            return False, [], get_last_error() or "Нет подключения к БД"
+        rows, columns = result
+        return True, rows, columns
+    
     conn = get_connection()
     if not conn:
         return False, [], "Нет подключения к БД"
     
     try:
+        if DB_SHARDS:
+            refusal = sharded_command_error(query)
+            if refusal:
+                return False, [], refusal
+            target = dml_target(query)
+            if target and target[0] == 'INSERT':
+                run_on_node_cursors(lambda cursors: insert_reference_query(cursors, target[2], query, params))
+            else:
+                run_on_all_shards(lambda cur: cur.execute(query, params or None))
+            invalidate_catalog()
+            return True, [], "Команда успешно выполнена"
         cur = conn.cursor()
         if params:
             cur.execute(query, params)
         else:
             cur.execute(query)
-        
-        # Если это SELECT - возвращаем данные
-        if query.strip().upper().startswith('SELECT'):
-            rows = cur.fetchall()
-            columns = [desc[0] for desc in cur.description] if cur.description else []
+        # Для других команд - коммитим
+        conn.commit()
+        cur.close()
+        # Команда могла поменять структуру (CREATE TYPE, ALTER ...)
+        invalidate_catalog()
+        return True, [], "Команда успешно выполнена"
+    except Exception as e:
+        rollback_quietly(conn)
+        logging.error(f"Ошибка выполнения запроса: {e}")
+        return False, [], describe_write_error(e)
+
+def copy_text_value(value):
+    """Значение в текстовом формате COPY (NULL - \\N, спецсимволы экранируются)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        value = value.isoformat(sep=" ")
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+@metrics.instrumented
+def copy_rows(table_name, columns, rows):
+    """
+    Записать строки (кортежи значений columns) одним COPY FROM STDIN на узел.
+
+    Строки experiments при шардировании раскладываются по узлам по SHARD_KEY,
+    транзакции узлов фиксируются, только если COPY прошел везде. Строки
+    справочных таблиц при шардировании вставляются на все узлы с одинаковыми
+    id (insert_reference_data). Ошибки psycopg2 пробрасываются - одна плохая
+    строка отменяет весь COPY (построчно разбирается InsertBatch).
+
+    Returns:
+        {номер узла: число строк}
+    """
+    if DB_SHARDS and not is_sharded(table_name):
+        insert_reference_data(table_name, columns, rows)
+        return {node: len(rows) for node in range(shard_count())}
+    parts = {}
+    if is_sharded(table_name):
+        for row in rows:
+            parts.setdefault(shard_for(dict(zip(columns, row))), []).append(row)
+    else:
+        parts[0] = rows
+    copy_sql = f"COPY ddos.{quote_ident(table_name)} ({', '.join(quote_ident(col) for col in columns)}) FROM STDIN"
+    cursors = {}
+    try:
+        for node, part in sorted(parts.items()):
+            cursors[node] = InsertBatch.cursor(cursors, node)
+            buffer = io.StringIO("".join("\t".join(map(copy_text_value, row)) + "\n" for row in part))
+            cursors[node].copy_expert(copy_sql, buffer)
+        for cur in cursors.values():
+            cur.connection.commit()
             cur.close()
-            return True, rows, columns
-        else:
-            # Для других команд - коммитим
+    except Exception:
+        for cur in cursors.values():
+            rollback_quietly(cur.connection)
+        raise
+    rows_written(table_name, len(rows), "copy")
+    return {node: len(part) for node, part in parts.items()}
+
+
+@metrics.instrumented
+def restore_rows(table_name, columns, rows):
+    """
+    Вернуть в таблицу ранее выгруженные строки (с их id), пропуская уже существующие.
+
+    Как copy_rows, но через временную таблицу: COPY во временную, затем
+    INSERT ... ON CONFLICT DO NOTHING - строка, которая уже есть (по id или
+    имени), не мешает загрузить остальные. Строки experiments при
+    шардировании возвращаются на узел по SHARD_KEY - туда же, откуда ушли.
+
+    Returns:
+        {номер узла: число вставленных строк}
+    """
+    parts = {}
+    if is_sharded(table_name):
+        for row in rows:
+            parts.setdefault(shard_for(dict(zip(columns, row))), []).append(row)
+    else:
+        parts[0] = rows
+    col_sql = ", ".join(quote_ident(col) for col in columns)
+    cursors = {}
+    inserted = {}
+    try:
+        for node, part in sorted(parts.items()):
+            cur = cursors[node] = InsertBatch.cursor(cursors, node)
+            cur.execute(f"CREATE TEMP TABLE restore_rows (LIKE ddos.{quote_ident(table_name)}) ON COMMIT DROP")
+            buffer = io.StringIO("".join("\t".join(map(copy_text_value, row)) + "\n" for row in part))
+            cur.copy_expert(f"COPY restore_rows ({col_sql}) FROM STDIN", buffer)
+            cur.execute(
+                f"INSERT INTO ddos.{quote_ident(table_name)} ({col_sql}) "
+                f"SELECT {col_sql} FROM restore_rows ON CONFLICT DO NOTHING"
+            )
+            inserted[node] = cur.rowcount
+        for cur in cursors.values():
+            cur.connection.commit()
+            cur.close()
+    except Exception:
+        for cur in cursors.values():
+            rollback_quietly(cur.connection)
+        raise
+    rows_written(table_name, sum(inserted.values()), "restore")
+    return inserted
+
+@metrics.instrumented
+def export_csv(out, table_name=None, query=None):
+    """
+    Выгрузить таблицу или результат SELECT в CSV (с заголовком) через COPY TO STDOUT.
+
+    При шардировании запрос к experiments выполняется на каждом узле, строки
+    узлов идут подряд (как в execute_custom_query), заголовок - один раз.
+
+    Args:
+        out: текстовый поток для записи
+        table_name: таблица схемы ddos (если query не задан)
+        query: произвольный SELECT
+
+    Returns:
+        (success, message)
+    """
+    if query is None:
+        source = f"ddos.{quote_ident(table_name)}"
+        sharded = is_sharded(table_name)
+    else:
+        source = f"({query.strip().rstrip(';')})"
+        sharded = bool(DB_SHARDS) and bool(SHARDED_TABLE_RE.search(query))
+    try:
+        connections = get_all_shard_connections() if sharded else [get_read_connection()]
+    except psycopg2.OperationalError as e:
+        return False, str(e)
+    if connections[0] is None:
+        return False, "Нет подключения к БД"
+    total = 0
+    for node, connection in enumerate(connections):
+        header = "true" if node == 0 else "false"
+        try:
+            cur = connection.cursor()
+            cur.copy_expert(f"COPY {source} TO STDOUT WITH (FORMAT csv, HEADER {header})", out)
+            total += max(cur.rowcount, 0)
+            cur.close()
+            connection.commit()
+        except Exception as e:
+            rollback_quietly(connection)
+            logging.error(f"Ошибка выгрузки CSV: {e}")
+            return False, f"Ошибка выгрузки: {describe_write_error(e)}"
+    return True, f"Выгружено строк: {total}"
+
+
+@metrics.instrumented
+def import_csv(source, table_name):
+    """
+    Загрузить CSV с заголовком (имена колонок) в таблицу через COPY FROM STDIN.
+
+    Без DB_SHARDS файл уходит в COPY потоком как есть. При шардировании строки
+    experiments раскладываются по узлам по SHARD_KEY и на каждый узел идет свой
+    COPY; строки справочных таблиц вставляются на все узлы с одинаковыми id
+    (insert_reference_data). Пустое значение без кавычек - NULL, как в COPY.
+
+    Returns:
+        (success, message)
+    """
+    columns = next(csv.reader([source.readline()]), None)
+    if not columns:
+        return False, "Пустой файл: нет строки заголовка"
+    target = f"ddos.{quote_ident(table_name)} ({', '.join(quote_ident(col.strip()) for col in columns)})"
+    copy_sql = f"COPY {target} FROM STDIN WITH (FORMAT csv)"
+
+    if not DB_SHARDS:
+        conn = get_connection()
+        if not conn:
+            return False, "Нет подключения к БД"
+        try:
+            cur = conn.cursor()
+            cur.copy_expert(copy_sql, source)
+            total = cur.rowcount
             conn.commit()
+            rows_written(table_name, total, "copy")
             cur.close()
-            return True, [], "Команда успешно выполнена"
+            return True, f"Загружено строк: {total}"
+        except Exception as e:
+            rollback_quietly(conn)
+            logging.error(f"Ошибка загрузки CSV: {e}")
+            return False, f"Ошибка загрузки: {describe_write_error(e)}"
+
+    columns = [col.strip() for col in columns]
+    rows = [[value if value != "" else None for value in row] for row in csv.reader(source)]
+    try:
+        by_node = copy_rows(table_name, columns, rows)
     except Exception as e:
-        conn.rollback()
-        logging.error(f"Ошибка выполнения запроса: {e}")
-        return False, [], str(e)
+        logging.error(f"Ошибка загрузки CSV: {e}")
+        return False, f"Ошибка загрузки: {describe_write_error(e)}"
+    if not is_sharded(table_name):
+        return True, f"Загружено строк: {len(rows)} (на каждый из {shard_count()} узлов)"
+    nodes = ", ".join(f"узел {node}: {count}" for node, count in sorted(by_node.items()))
+    return True, f"Загружено строк: {len(rows)} ({nodes})"
 
-def generate_test_data():
+
+@metrics.instrumented
+def generate_test_data(count=15):
     """
     Генерация тестовых данных для демонстрации функционала.
+
+    count: сколько записей experiments сгенерировать (одной транзакцией)
     """
     conn = get_connection()
     if not conn:
@@ -492,20 +2448,22 @@ def generate_test_data():
         
         # Если целей нет, создаем пару дефолтных
         if not aux_ids:
-            cur.execute("""
-                INSERT INTO ddos."вспомогательная"(segment_code, label, location, purpose, criticality)
-                VALUES
-                    ('TEST-A', 'Тестовый сервер 1', 'Москва', 'Тесты', 'LOW'),
-                    ('PROD-B', 'Продакшн сервер', 'СПб', 'Клиенты', 'HIGH')
-                RETURNING id
-            """)
+            insert_reference_data(
+                AUXILIARY_TABLE,
+                ["segment_code", "label", "location", "purpose", "criticality"],
+                [('TEST-A', 'Тестовый сервер 1', 'Москва', 'Тесты', 'LOW'),
+                 ('PROD-B', 'Продакшн сервер', 'СПб', 'Клиенты', 'HIGH')],
+            )
+            cur.execute('SELECT id FROM ddos."вспомогательная"')
             aux_ids = [row[0] for row in cur.fetchall()]
         
-        # 2. Генерируем 15 случайных экспериментов
+        # 2. Генерируем count случайных экспериментов
         # Проверяем, какие колонки реально существуют
         real_cols = [c[0] for c in get_table_columns('experiments')]
         
-        for i in range(15):
+        # Все строки уходят одним пакетом и одной транзакцией
+        batch = InsertBatch()
+        for i in range(count):
             attack = random.choice(ATTACK_TYPES)
             packets = random.randint(100, 50000)
             duration = round(random.uniform(1.0, 60.0), 2)
@@ -529,9 +2487,14 @@ def generate_test_data():
             if 'created_at' in real_cols: data['created_at'] = date_str
             if 'auxiliary_id' in real_cols: data['auxiliary_id'] = aux_id
             
-            insert_dynamic_data("experiments", data)
+            batch.add("experiments", data)
             
-        return True, "Тестовые данные успешно сгенерированы (15 записей)"
+        success, msg, failed = batch.flush()
+        if not success:
+            return False, f"Ошибка генерации: {msg}"
+        if failed:
+            return True, f"Тестовые данные сгенерированы частично. {msg}"
+        return True, f"Тестовые данные успешно сгенерированы ({count} записей)"
         
     except Exception as e:
         return False, f"Ошибка генерации: {e}"
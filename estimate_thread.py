@@ -0,0 +1,53 @@
+"""
+Фоновый подсчет для окон: точное число строк и оценка уникальных значений
+
+Функции estimates (count_exact, approx_distinct) работают на своих
+соединениях и сообщают их через on_open - поэтому окно, закрываясь,
+может прервать запросы (stop), а не ждать полного прохода по таблице.
+"""
+import time
+
+import psycopg2
+from PySide6.QtCore import QThread, Signal
+
+
+class EstimateThread(QThread):
+    """Вызов func(*args, on_open=...) из estimates в фоне с результатом в сигнале done."""
+    done = Signal(object, str, float)  # результат, ошибка, мс
+
+    # Как часто stop() повторяет отмену, пока поток не завершится, мс
+    STOP_POLL_MS = 100
+
+    def __init__(self, func, *args, parent=None):
+        super().__init__(parent)
+        self.func = func
+        self.args = args
+        self.connections = []
+
+    def opened(self, connections):
+        self.connections = list(connections)
+
+    def run(self):
+        t0 = time.perf_counter()
+        try:
+            result, error = self.func(*self.args, on_open=self.opened), ""
+        except Exception as e:
+            result, error = None, str(e).strip()
+        self.done.emit(result, error, (time.perf_counter() - t0) * 1000)
+
+    def stop(self):
+        """
+        Прервать запросы и дождаться потока; результат уже не нужен, done не придет.
+
+        Отмена, отправленная до начала запроса на сервере, теряется, поэтому
+        она повторяется, пока поток не завершится.
+        """
+        self.done.disconnect()
+        while True:
+            for connection in list(self.connections):
+                try:
+                    connection.cancel()
+                except psycopg2.Error:
+                    pass
+            if self.wait(self.STOP_POLL_MS):
+                return
@@ -0,0 +1,204 @@
+"""
+Быстрые оценки числа строк и уникальных значений
+
+Точный count(*) - это полный проход по таблице. Для подписей в окнах
+достаточно оценок, которые сервер уже знает:
+- число строк таблицы - pg_class.reltuples (обновляется ANALYZE и VACUUM;
+  если таблицу еще не анализировали - n_live_tup из pg_stat_user_tables);
+- число строк запроса - оценка планировщика из EXPLAIN, без выполнения.
+Точный подсчет (count_exact) и число уникальных значений колонки
+(approx_distinct) - по запросу, на своих соединениях, поэтому их можно
+вызывать из фонового потока.
+
+approx_distinct - HyperLogLog: сервер хеширует значения (hashtextextended)
+и возвращает только 2^HLL_PRECISION регистров (максимальный ранг хеша по
+корзине), а не все различные значения. Регистры узлов объединяются
+поэлементным максимумом, так что оценка по шардированной таблице не
+требует пересылать значения между узлами. Погрешность - около
+1.04 / sqrt(2^HLL_PRECISION).
+"""
+import json
+
+import numpy as np
+
+from db import (
+    get_read_connection, get_all_shard_connections, open_node_connections, close_quietly,
+    retry_read, is_connection_error, read_failed, rollback_quietly, is_sharded, quote_ident,
+    SHARDED_TABLE_RE
+)
+from config import DB_SHARDS, HLL_PRECISION
+
+TABLE_ESTIMATES_SQL = """
+    SELECT c.relname,
+           CASE WHEN c.reltuples >= 0 THEN c.reltuples::bigint ELSE s.n_live_tup END
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    WHERE n.nspname = 'ddos' AND c.relkind IN ('r', 'p')
+"""
+
+# Регистр - номер корзины (младшие биты хеша), ранг - позиция первой единицы
+# в остальных битах (нет единиц - число битов + 1)
+HLL_SQL = """
+    SELECT h & {mask}, max(CASE WHEN position(B'1' IN (h >> {precision})::bit({bits})) = 0 THEN {bits} + 1
+                                ELSE position(B'1' IN (h >> {precision})::bit({bits})) END)
+    FROM (SELECT hashtextextended({column}::text, 0) AS h
+          FROM ddos.{table} WHERE {column} IS NOT NULL) AS hashed
+    GROUP BY 1
+"""
+
+
+def touches_shards(query):
+    """Выполняется ли запрос на всех узлах (как в execute_custom_query)."""
+    return bool(DB_SHARDS) and bool(SHARDED_TABLE_RE.search(query))
+
+
+@retry_read(default=dict)
+def get_table_estimates():
+    """
+    Оценка числа строк таблиц схемы ddos без их чтения.
+
+    Returns:
+        {таблица: строк} - для шардированной таблицы сумма по узлам;
+        None у таблицы, о которой сервер еще ничего не знает.
+    """
+    connections = get_all_shard_connections()
+    estimates = {}
+    try:
+        for node, connection in enumerate(connections):
+            cur = connection.cursor()
+            cur.execute(TABLE_ESTIMATES_SQL)
+            for table, rows in cur.fetchall():
+                if node == 0:
+                    estimates[table] = rows
+                elif is_sharded(table) and rows is not None:
+                    estimates[table] = (estimates.get(table) or 0) + rows
+            cur.close()
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        for connection in connections:
+            rollback_quietly(connection)
+        read_failed("Ошибка чтения оценок числа строк", e, None)
+        return {}
+    return estimates
+
+
+@retry_read(default=lambda: None, connect=get_read_connection)
+def estimate_rows(query, params=None):
+    """
+    Оценка планировщика (EXPLAIN, без выполнения): сколько строк вернет SELECT.
+
+    Returns:
+        Число строк (сумма по узлам, если запрос идет на все узлы) или None при ошибке.
+    """
+    connections = get_all_shard_connections() if touches_shards(query) else [get_read_connection()]
+    total = 0
+    for connection in connections:
+        try:
+            cur = connection.cursor()
+            cur.execute(f"EXPLAIN (FORMAT JSON) {query}", params or None)
+            plan = cur.fetchone()[0]
+            cur.close()
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            read_failed("Ошибка оценки числа строк", e, connection)
+            return None
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        total += int(plan[0]['Plan']['Plan Rows'])
+    return total
+
+
+def node_connections(sharded):
+    """Свои соединения для фонового подсчета: все узлы, если данные шардированы, иначе основной сервер."""
+    connections = open_node_connections()
+    if not sharded:
+        for connection in connections[1:]:
+            close_quietly(connection)
+        connections = connections[:1]
+    return connections
+
+
+def count_exact(query, params=None, on_open=None):
+    """
+    Точное число строк SELECT (count(*) по подзапросу) на отдельных соединениях.
+
+    Можно вызывать из фонового потока. Ошибки psycopg2 пробрасываются.
+    on_open(connections) получает открытые соединения - чтобы их можно было
+    прервать из другого потока (connection.cancel(), см. EstimateThread.stop).
+    """
+    connections = node_connections(touches_shards(query))
+    if on_open:
+        on_open(connections)
+    try:
+        total = 0
+        for connection in connections:
+            with connection.cursor() as cur:
+                cur.execute(f"SELECT count(*) FROM ({query}) AS counted", params or None)
+                total += cur.fetchone()[0]
+        return total
+    finally:
+        for connection in connections:
+            close_quietly(connection)
+
+
+def hll_estimate(registers):
+    """Оценка HyperLogLog по массиву регистров (с поправкой линейного счета на малых числах)."""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+def approx_distinct(table_name, column, precision=HLL_PRECISION, on_open=None):
+    """
+    Приблизительное число различных непустых значений колонки (HyperLogLog).
+
+    Можно вызывать из фонового потока. Ошибки psycopg2 пробрасываются.
+    on_open - как у count_exact.
+
+    Returns:
+        (оценка, относительная стандартная погрешность)
+    """
+    m = 1 << precision
+    sql = HLL_SQL.format(mask=m - 1, precision=precision, bits=64 - precision,
+                         column=quote_ident(column), table=quote_ident(table_name))
+    registers = np.zeros(m, dtype=np.int16)
+    connections = node_connections(is_sharded(table_name))
+    if on_open:
+        on_open(connections)
+    try:
+        for connection in connections:
+            with connection.cursor() as cur:
+                cur.execute(sql)
+                rows = cur.fetchall()
+            if rows:
+                index, rank = np.array(rows, dtype=np.int64).T
+                np.maximum.at(registers, index, rank.astype(np.int16))
+    finally:
+        for connection in connections:
+            close_quietly(connection)
+    return hll_estimate(registers), float(1.04 / np.sqrt(m))
+
+
+def format_count(count, approximate=True):
+    """Число строк для подписи: '~97,7 тыс.' для оценки, '97 707' для точного."""
+    if count is None:
+        return "?"
+    if not approximate:
+        return f"{count:,}".replace(",", " ")
+    if count < 10 ** 4:
+        return f"~{count}"
+    # Единица выбирается по уже округленному значению: 999 999 - '~1,0 млн', а не '~1000,0 тыс.'
+    units = ((1000, "тыс."), (10 ** 6, "млн"), (10 ** 9, "млрд"))
+    divisor, unit = units[0]
+    for next_divisor, next_unit in units[1:]:
+        if round(count / divisor, 1) < 1000:
+            break
+        divisor, unit = next_divisor, next_unit
+    return f"~{count / divisor:.1f} {unit}".replace(".", ",", 1)
@@ -0,0 +1,375 @@
+"""
+HTTP/JSON сервис приема результатов экспериментов (без Qt)
+
+Генераторы трафика отправляют пачки записей POST-запросом, сервис копит их
+в ограниченной очереди и записывает в ddos.experiments одним COPY
+(db.copy_rows) раз в INGEST_FLUSH_INTERVAL секунд или как только набралось
+INGEST_FLUSH_ROWS строк. Если очередь заполнена, POST получает 503 с
+Retry-After - отправитель должен повторить позже (обратное давление).
+Если COPY упал из-за плохой строки, пачка дописывается через InsertBatch
+построчно, плохие строки попадают в счетчик failed и в лог.
+
+Все обращения к БД идут через один рабочий поток, так что соединения db.py
+не используются одновременно из разных потоков.
+
+Эндпоинты:
+    POST /experiments   - [{"name", "attack_type", "packets", "duration",
+                            "created_at"?, "auxiliary_id"?}, ...] -> 202
+    GET  /experiments   - как get_data: attack_type, date_from, date_to,
+                          auxiliary_labels, limit (по умолчанию 100), offset
+    GET  /stats         - счетчики сервиса
+    GET  /health        - жив ли сервис
+
+Запуск:
+    python ingest_service.py [--host 127.0.0.1] [--port 8085] [--metrics-port 9108]
+Нагрузочный тест: python bench_ingest.py --spawn
+"""
+import sys
+import json
+import time
+import signal
+import asyncio
+import logging
+import argparse
+from collections import deque
+from decimal import Decimal
+from datetime import date, datetime
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import metrics
+from maintenance import scheduler
+from config import (
+    ATTACK_TYPES, INGEST_HOST, INGEST_PORT, INGEST_QUEUE_MAX, INGEST_FLUSH_ROWS,
+    INGEST_FLUSH_INTERVAL, INGEST_MAX_BODY, METRICS_PORT
+)
+
+# Колонки, которые принимает POST, в порядке COPY
+INGEST_COLUMNS = ("name", "attack_type", "packets", "duration", "created_at", "auxiliary_id")
+
+# Границы типов и CHECK таблицы experiments: запись вне них отклоняется
+# сразу (400), а не ломает COPY всей пачки в фоновой записи
+NAME_MAX_LENGTH = 255               # VARCHAR(255)
+INTEGER_MAX = 2 ** 31 - 1           # INTEGER: packets, auxiliary_id
+DURATION_LIMIT = 10 ** 8            # DECIMAL(10,2): до 8 цифр до запятой
+
+READ_PAGE_DEFAULT = 100
+READ_PAGE_MAX = 1000
+
+# Пауза перед повтором записи, если БД недоступна, с
+RETRY_DELAY = 1.0
+
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+def parse_record(record, attack_types):
+    """Проверить запись из POST и вернуть кортеж значений INGEST_COLUMNS (ValueError, если неверна)."""
+    if not isinstance(record, dict):
+        raise ValueError("запись должна быть объектом")
+    unknown = set(record) - set(INGEST_COLUMNS)
+    if unknown:
+        raise ValueError(f"неизвестные поля: {', '.join(sorted(unknown))}")
+    name = record.get("name")
+    if not isinstance(name, str) or not name.strip() or len(name) > NAME_MAX_LENGTH:
+        raise ValueError(f"name - непустая строка до {NAME_MAX_LENGTH} символов")
+    if "\x00" in name:
+        # PostgreSQL не хранит NUL в тексте: такая строка сломала бы и COPY, и вставку
+        raise ValueError("name не может содержать символ NUL")
+    if record.get("attack_type") not in attack_types:
+        raise ValueError(f"attack_type - одно из {', '.join(attack_types)}")
+    packets = record.get("packets")
+    if not isinstance(packets, int) or isinstance(packets, bool) or not 0 < packets <= INTEGER_MAX:
+        raise ValueError(f"packets - целое от 1 до {INTEGER_MAX}")
+    duration = record.get("duration")
+    if isinstance(duration, (int, float)) and not isinstance(duration, bool):
+        duration = round(duration, 2)
+    else:
+        duration = None
+    # round: 0.004 хранится как 0.00 и нарушил бы CHECK (duration > 0); NaN не проходит сравнение
+    if duration is None or not 0 < duration < DURATION_LIMIT:
+        raise ValueError(f"duration - число больше 0 (после округления до 0.01) и меньше {DURATION_LIMIT}")
+    created_at = record.get("created_at")
+    if created_at is None:
+        created_at = datetime.now()
+    elif isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    else:
+        raise ValueError("created_at - дата в ISO 8601")
+    auxiliary_id = record.get("auxiliary_id")
+    if auxiliary_id is not None and (not isinstance(auxiliary_id, int) or isinstance(auxiliary_id, bool)
+                                     or not -INTEGER_MAX - 1 <= auxiliary_id <= INTEGER_MAX):
+        raise ValueError("auxiliary_id - целое (INTEGER) или null")
+    return (name, record["attack_type"], packets, duration, created_at, auxiliary_id)
+
+
+def write_rows(rows):
+    """
+    Записать пачку: одним COPY, а при ошибке в данных - построчно через InsertBatch.
+
+    Выполняется в рабочем потоке БД. Если БД недоступна - ConnectionError
+    (строки остаются в очереди сервиса). Если пакет не записан по другой
+    причине, все его строки считаются ошибочными и не повторяются.
+
+    Returns:
+        (записано строк, [(номер строки в пачке, текст ошибки), ...])
+    """
+    try:
+        db.copy_rows("experiments", INGEST_COLUMNS, rows)
+        return len(rows), []
+    except Exception as e:
+        if db.is_connection_error(e):
+            db.drop_broken_connections()
+            raise ConnectionError(str(e).strip())
+        reason = getattr(e, "pgerror", None) or e
+        logging.warning(f"COPY пачки из {len(rows)} строк не прошел ({reason}), пишем построчно")
+    batch = db.InsertBatch()
+    for row in rows:
+        batch.add("experiments", dict(zip(INGEST_COLUMNS, row)))
+    success, msg, failed = batch.flush()
+    if not success and not failed:
+        if batch.error is None or db.is_connection_error(batch.error):
+            db.drop_broken_connections()
+            raise ConnectionError(msg)
+        # Повтор не поможет: иначе пачка возвращалась бы в очередь бесконечно
+        return 0, [(index, msg) for index in range(len(rows))]
+    return len(rows) - len(failed), [(index, error) for index, _, error in failed]
+
+
+def json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Не сериализуется в JSON: {type(value).__name__}")
+
+
+class IngestService:
+    """Очередь приема, фоновая запись и HTTP-обработчики"""
+
+    def __init__(self):
+        self.pending = deque()      # проверенные строки, ждущие записи
+        self.in_flight = 0          # строки, которые сейчас пишутся
+        self.wakeup = asyncio.Event()
+        self.stopping = False
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-db")
+        self.attack_types = ATTACK_TYPES
+        self.stats = {
+            "accepted": 0, "rejected_busy": 0, "rejected_invalid": 0,
+            "written": 0, "failed": 0, "flushes": 0, "last_flush_rows": 0,
+            "last_flush_ms": 0.0, "db_errors": 0,
+        }
+
+    async def in_db_thread(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    def queued(self):
+        return len(self.pending) + self.in_flight
+
+    # --- запись ---
+
+    async def flush_loop(self):
+        """Писать очередь пачками до остановки; при остановке дописать остаток."""
+        self.attack_types = await self.in_db_thread(db.attack_type_labels)
+        while not (self.stopping and not self.pending):
+            if not self.stopping:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), INGEST_FLUSH_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            self.wakeup.clear()
+            if not self.pending:
+                continue
+            rows = [self.pending.popleft() for _ in range(min(len(self.pending), INGEST_FLUSH_ROWS))]
+            self.in_flight = len(rows)
+            t0 = time.perf_counter()
+            try:
+                written, failed = await self.in_db_thread(write_rows, rows)
+            except ConnectionError as e:
+                self.stats["db_errors"] += 1
+                self.in_flight = 0
+                if self.stopping:
+                    logging.error(f"БД недоступна при остановке, не записано строк: {len(rows) + len(self.pending)}")
+                    return
+                logging.error(f"Запись пачки отложена, БД недоступна: {e}")
+                self.pending.extendleft(reversed(rows))
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            self.in_flight = 0
+            for index, error in failed[:10]:
+                logging.warning(f"Строка {rows[index][0]!r} не записана: {error}")
+            self.stats["written"] += written
+            self.stats["failed"] += len(failed)
+            self.stats["flushes"] += 1
+            self.stats["last_flush_rows"] = len(rows)
+            self.stats["last_flush_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            self.attack_types = await self.in_db_thread(db.attack_type_labels)
+
+    def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+
+    # --- HTTP ---
+
+    async def post_experiments(self, query, body):
+        try:
+            payload = json.loads(body or b"null")
+        except ValueError as e:
+            return 400, {"error": f"Неверный JSON: {e}"}, {}
+        records = payload.get("records") if isinstance(payload, dict) else payload
+        if not isinstance(records, list) or not records:
+            return 400, {"error": "Ожидается непустой список записей или {\"records\": [...]}"}, {}
+        rows = []
+        for index, record in enumerate(records):
+            try:
+                rows.append(parse_record(record, self.attack_types))
+            except ValueError as e:
+                self.stats["rejected_invalid"] += len(records)
+                return 400, {"error": str(e), "index": index}, {}
+        if self.stopping or self.queued() + len(rows) > INGEST_QUEUE_MAX:
+            self.stats["rejected_busy"] += len(rows)
+            retry_after = max(1, round(INGEST_FLUSH_INTERVAL))
+            return 503, {"error": "Очередь заполнена", "queued": self.queued()}, {"Retry-After": str(retry_after)}
+        self.pending.extend(rows)
+        self.stats["accepted"] += len(rows)
+        if len(self.pending) >= INGEST_FLUSH_ROWS:
+            self.wakeup.set()
+        return 202, {"accepted": len(rows), "queued": self.queued()}, {}
+
+    async def get_experiments(self, query, body):
+        first = lambda name: query.get(name, [None])[0]
+        try:
+            limit = min(int(first("limit") or READ_PAGE_DEFAULT), READ_PAGE_MAX)
+            offset = int(first("offset") or 0)
+            if limit < 1 or offset < 0:
+                raise ValueError
+        except ValueError:
+            return 400, {"error": f"limit - целое от 1 до {READ_PAGE_MAX}, offset - неотрицательное целое"}, {}
+        try:
+            # get_data дополняет даты временем начала и конца дня - сюда приходят только даты
+            date_from, date_to = (first(name) and date.fromisoformat(first(name)).isoformat()
+                                  for name in ("date_from", "date_to"))
+        except ValueError:
+            return 400, {"error": "date_from, date_to - даты в формате ГГГГ-ММ-ДД"}, {}
+
+        def read_page():
+            rows = db.get_data(
+                attack_type_filter=first("attack_type"), date_from=date_from, date_to=date_to,
+                auxiliary_labels=first("auxiliary_labels") in ("1", "true"), limit=limit, offset=offset,
+            )
+            return rows, db.get_last_error()
+
+        rows, error = await self.in_db_thread(read_page)
+        if error:
+            return 503, {"error": error}, {}
+        return 200, {
+            "columns": list(getattr(rows, "columns", [])),
+            "rows": [list(row) for row in rows],
+            "limit": limit,
+            "offset": offset,
+            "next_offset": offset + len(rows) if len(rows) == limit else None,
+        }, {}
+
+    async def get_stats(self, query, body):
+        return 200, {**self.stats, "queued": self.queued(), "queue_max": INGEST_QUEUE_MAX}, {}
+
+    async def get_health(self, query, body):
+        return 200, {"status": "stopping" if self.stopping else "ok", "queued": self.queued()}, {}
+
+    async def dispatch(self, method, target, body):
+        routes = {
+            "/experiments": {"POST": self.post_experiments, "GET": self.get_experiments},
+            "/stats": {"GET": self.get_stats},
+            "/health": {"GET": self.get_health},
+        }
+        url = urlsplit(target)
+        if url.path not in routes:
+            return 404, {"error": "Нет такого пути"}, {}
+        handler = routes[url.path].get(method)
+        if handler is None:
+            return 405, {"error": "Метод не поддерживается"}, {"Allow": ", ".join(routes[url.path])}
+        return await handler(parse_qs(url.query), body)
+
+    async def handle_connection(self, reader, writer):
+        """Одно TCP-соединение: запросы HTTP/1.1 подряд (keep-alive)."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > INGEST_MAX_BODY:
+                    await self.respond(writer, 413, {"error": f"Тело больше {INGEST_MAX_BODY} байт"}, {}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, payload, extra = await self.dispatch(method, target, body)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self.respond(writer, status, payload, extra, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer, status, payload, extra_headers, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False, default=json_value).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json; charset=utf-8",
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **extra_headers,
+        }
+        head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        head += "".join(f"{key}: {value}\r\n" for key, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+
+async def serve(host, port):
+    service = IngestService()
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, service.stop)
+    logging.info(f"Сервис приема слушает http://{host}:{port}")
+    # После пачек COPY статистику обновляет maintenance (ANALYZE по числу записанных строк)
+    scheduler.start_periodic()
+    flusher = asyncio.create_task(service.flush_loop())
+    await flusher  # завершается после stop(), когда очередь дописана
+    server.close()
+    await server.wait_closed()
+    service.executor.shutdown()
+    logging.info(f"Сервис остановлен: {service.stats}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/JSON сервис приема результатов экспериментов")
+    parser.add_argument("--host", default=INGEST_HOST)
+    parser.add_argument("--port", type=int, default=INGEST_PORT)
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="Порт для /metrics в формате Prometheus (по умолчанию из config)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        stream=sys.stderr,
+    )
+    if args.metrics_port:
+        metrics.start_http_server(args.metrics_port)
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
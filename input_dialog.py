@@ -0,0 +1,419 @@
+"""
+Окно ввода данных: форма строится по каталогу схемы
+"""
+import csv
+from PySide6.QtWidgets import (
+    QDialog, QWidget, QVBoxLayout, QHBoxLayout, QFormLayout, QPushButton, QLineEdit,
+    QComboBox, QMessageBox, QDateEdit, QGroupBox, QSpinBox, QDoubleSpinBox,
+    QCheckBox, QLabel, QStackedWidget
+)
+from PySide6.QtCore import QDate
+from db import get_auxiliary_items, insert_dynamic_data, InsertBatch, get_catalog
+from config import ATTACK_TYPES, CRITICALITY_LEVELS, COLUMN_LABELS
+
+# Шаблоны форм ввода по таблицам; пересчитываются, когда меняется каталог
+_form_templates = {'catalog': None, 'forms': {}}
+
+
+def form_template(catalog, table_name):
+    """
+    Описание полей формы ввода для таблицы по каталогу схемы (get_catalog).
+
+    Returns:
+        [{'column', 'label', 'type', 'kind', ...}, ...], где kind - 'choice'
+        (options), 'composite' (fields), 'auxiliary', 'int', 'float', 'date',
+        'bool' или 'text'
+    """
+    if not catalog:
+        return []
+    if _form_templates['catalog'] is not catalog:
+        _form_templates['catalog'] = catalog
+        _form_templates['forms'] = {}
+    forms = _form_templates['forms']
+    if table_name in forms:
+        return forms[table_name]
+    
+    specs = []
+    for col_name, data_type, is_nullable, default, udt_name in catalog['tables'].get(table_name, []):
+        # Пропускаем ID, так как он автоинкремент (SERIAL)
+        if col_name == 'id':
+            continue
+        spec = {'column': col_name, 'label': COLUMN_LABELS.get(col_name, col_name), 'type': udt_name}
+        
+        # 1. ENUM или COMPOSITE (Пользовательские типы)
+        if data_type == 'USER-DEFINED':
+            if udt_name in catalog['enums']:
+                spec.update(kind='choice', options=catalog['enums'][udt_name])
+            elif udt_name in catalog['composites']:
+                spec.update(kind='composite', fields=catalog['composites'][udt_name])
+            elif col_name == 'attack_type':
+                # Тип не нашелся в каталоге - хардкод для attack_type на всякий случай
+                spec.update(kind='choice', options=ATTACK_TYPES)
+            else:
+                spec['kind'] = 'text'
+        # 1.1 Специальное поле Criticality (хоть оно и varchar, но там CHECK constraint)
+        elif col_name == 'criticality':
+            spec.update(kind='choice', options=CRITICALITY_LEVELS)
+        # 2. Foreign Key (Связь с целью)
+        elif col_name == 'auxiliary_id':
+            spec['kind'] = 'auxiliary'
+        elif data_type in ('integer', 'smallint', 'bigint'):
+            spec['kind'] = 'int'
+        elif data_type in ('numeric', 'decimal', 'real', 'double precision'):
+            spec['kind'] = 'float'
+        elif 'timestamp' in data_type or 'date' in data_type:
+            spec['kind'] = 'date'
+        elif data_type == 'boolean':
+            spec['kind'] = 'bool'
+        else:
+            spec['kind'] = 'text'
+        specs.append(spec)
+    forms[table_name] = specs
+    return specs
+
+
+class InputDialog(QDialog):
+    """
+    Модальное окно для ввода данных эксперимента
+    
+    Теперь оно ДИНАМИЧЕСКОЕ: само смотрит какие есть колонки в базе
+    и создает для них поля ввода. Описание колонок и типов берется из
+    get_catalog() одним запросом, форма каждой таблицы строится один раз.
+    
+    Режим очереди: кнопка "В очередь" копит записи (в том числе для разных
+    таблиц), "Отправить очередь" записывает их одной транзакцией.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Добавить данные")
+        self.setModal(True)
+        self.setMinimumWidth(400)
+        
+        main_layout = QVBoxLayout()
+        
+        # Описание схемы - один запрос (с кэшем), цели - при первой надобности
+        self.catalog = get_catalog()
+        self.aux_items = None
+        
+        # Выбор таблицы
+        table_layout = QHBoxLayout()
+        table_layout.addWidget(QLabel("Таблица:"))
+        self.table_combo = QComboBox()
+        self.populate_tables()
+        self.table_combo.currentTextChanged.connect(self.build_form)
+        table_layout.addWidget(self.table_combo)
+        main_layout.addLayout(table_layout)
+        
+        # Формы для полей: по странице на таблицу, переключаются без перестройки
+        self.forms = QStackedWidget()
+        self.pages = {}  # {table_name: страница формы}
+        self.widgets = {} # Виджеты текущей формы {col_name: widget}
+        main_layout.addWidget(self.forms)
+        
+        # Очередь записей для пакетной отправки
+        self.batch = InsertBatch()
+        self.editing = None  # номер записи очереди, открытой в форме для исправления
+        
+        # Кнопки
+        btn_layout = QHBoxLayout()
+        btn_save = QPushButton("Сохранить")
+        btn_save.clicked.connect(self.save)
+        self.btn_queue = QPushButton()
+        self.btn_queue.clicked.connect(self.enqueue)
+        self.btn_submit = QPushButton()
+        self.btn_submit.clicked.connect(self.submit_queue)
+        btn_cancel = QPushButton("Отмена")
+        btn_cancel.clicked.connect(self.reject)
+        btn_layout.addWidget(btn_save)
+        btn_layout.addWidget(self.btn_queue)
+        btn_layout.addWidget(self.btn_submit)
+        btn_layout.addWidget(btn_cancel)
+        self.update_queue_button()
+        
+        main_layout.addLayout(btn_layout)
+        self.setLayout(main_layout)
+        
+        # Строим форму для первой таблицы
+        self.build_form()
+    
+    def populate_tables(self):
+        tables = list(self.catalog['tables']) if self.catalog else []
+        if not tables:
+            tables = ["experiments"] # Fallback
+        self.table_combo.addItems(tables)
+
+    def auxiliary_items(self):
+        """Цели для списков auxiliary_id: один запрос на окно, общий для всех форм"""
+        if self.aux_items is None:
+            self.aux_items = get_auxiliary_items()
+        return self.aux_items
+        
+    def build_form(self):
+        """Показать форму выбранной таблицы
+
+        Страница формы строится при первом выборе таблицы и дальше только
+        переключается (введенные значения при этом сохраняются).
+        """
+        table_name = self.table_combo.currentText()
+        if not table_name:
+            self.widgets = {}
+            return
+        page = self.pages.get(table_name)
+        if page is None:
+            page = self.create_page(table_name)
+            self.pages[table_name] = page
+            self.forms.addWidget(page)
+        self.forms.setCurrentWidget(page)
+        self.widgets = page.widgets
+
+    def create_page(self, table_name):
+        """Построить страницу формы по шаблону таблицы"""
+        page = QWidget()
+        form = QFormLayout()
+        form.setContentsMargins(0, 0, 0, 0)
+        page.setLayout(form)
+        page.widgets = {}
+        for spec in form_template(self.catalog, table_name):
+            widget = self.create_widget(spec)
+            page.widgets[spec['column']] = widget
+            form.addRow(f"{spec['label']}:", widget)
+        return page
+
+    def create_widget(self, spec):
+        """Создать виджет ввода по описанию поля из form_template"""
+        col_name = spec['column']
+        kind = spec['kind']
+        
+        # 1. ENUM, CHECK-список (criticality)
+        if kind == 'choice':
+            widget = QComboBox()
+            widget.addItems(spec['options'])
+        
+        # 1.1 Составной тип: под-форма из полей
+        elif kind == 'composite':
+            group = QGroupBox(f"{spec['label']} ({spec['type']})")
+            group_layout = QFormLayout()
+            sub_widgets = {}
+            for field_name, field_type in spec['fields']:
+                sub_widget = QLineEdit()
+                sub_widget.setPlaceholderText(field_type)
+                group_layout.addRow(f"{field_name}:", sub_widget)
+                sub_widgets[field_name] = sub_widget
+            group.setLayout(group_layout)
+            # Сохраняем не сам виджет, а словарь виджетов, чтобы потом собрать
+            widget = group
+            widget.sub_widgets = sub_widgets # Прикрепляем ссылки
+            widget.is_composite = True
+        
+        # 2. Foreign Key (Связь с целью)
+        elif kind == 'auxiliary':
+            widget = QComboBox()
+            widget.addItem("Не выбрано", None)
+            for item in self.auxiliary_items():
+                display = f"{item['label']} · {item['segment_code']} ({item['criticality']})"
+                widget.addItem(display, item["id"])
+        
+        # 3. Числа (Integer)
+        elif kind == 'int':
+            widget = QSpinBox()
+            widget.setRange(0, 2147483647)
+            # Если это packets, ставим дефолт
+            if col_name == 'packets':
+                widget.setValue(1000)
+                widget.setRange(1, 2147483647) # CHECK packets > 0
+        
+        # 4. Дробные (Decimal, Real)
+        elif kind == 'float':
+            widget = QDoubleSpinBox()
+            widget.setRange(0.0, 99999999.99)
+            widget.setDecimals(2)
+            # Если duration
+            if col_name == 'duration':
+                widget.setValue(10.0)
+        
+        # 5. Дата/Время
+        elif kind == 'date':
+            widget = QDateEdit()
+            widget.setDate(QDate.currentDate())
+            widget.setCalendarPopup(True)
+        
+        # 6. Булево
+        elif kind == 'bool':
+            widget = QCheckBox("Да/Нет")
+        
+        # 7. Текст (все остальное)
+        else:
+            widget = QLineEdit()
+            if col_name == 'name':
+                widget.setPlaceholderText("Например: Тест-1")
+        return widget
+    
+    def collect_data(self):
+        """Собрать данные из виджетов. Возвращает (таблица, данные) или None при ошибке ввода."""
+        table_name = self.table_combo.currentText()
+        if not table_name:
+            return None
+
+        data = {}
+        errors = []
+        
+        for col_name, widget in self.widgets.items():
+            val = None
+            
+            # Обработка составного типа
+            if getattr(widget, 'is_composite', False):
+                # Собираем значения полей в строку (val1, val2)
+                # Важно: если значение содержит запятые или скобки, его надо экранировать в кавычки
+                parts = []
+                all_empty = True
+                for s_name, s_widget in widget.sub_widgets.items():
+                    s_val = s_widget.text().strip()
+                    if s_val:
+                        all_empty = False
+                    # Экранирование для композитного типа
+                    if ',' in s_val or '(' in s_val or ')' in s_val or '"' in s_val or '\\' in s_val or ' ' in s_val:
+                         s_val = '"' + s_val.replace('"', '""') + '"'
+                    parts.append(s_val)
+                
+                if all_empty:
+                    val = None
+                else:
+                    # Формат PostgreSQL: (val1,val2,...)
+                    val = "(" + ",".join(parts) + ")"
+            
+            elif isinstance(widget, QLineEdit):
+                text = widget.text().strip()
+                if not text:
+                    val = None
+                else:
+                    val = text
+            
+            elif isinstance(widget, QComboBox):
+                if col_name == 'auxiliary_id':
+                    val = widget.currentData()
+                else:
+                    val = widget.currentText()
+            
+            elif isinstance(widget, (QSpinBox, QDoubleSpinBox)):
+                val = widget.value()
+                
+            elif isinstance(widget, QDateEdit):
+                val = widget.date().toString("yyyy-MM-dd")
+                
+            elif isinstance(widget, QCheckBox):
+                val = widget.isChecked()
+            
+            # Проверка обязательных полей (упрощенная)
+            if col_name == 'name' and not val:
+                 errors.append("Поле 'Название' обязательно")
+            
+            data[col_name] = val
+            
+        if errors:
+            QMessageBox.warning(self, "Ошибка", "\n".join(errors))
+            return None
+        return table_name, data
+
+    def save(self):
+        """Собираем данные из виджетов и сохраняем"""
+        collected = self.collect_data()
+        if not collected:
+            return
+        table_name, data = collected
+
+        success, msg = insert_dynamic_data(table_name, data)
+        
+        if success:
+            QMessageBox.information(self, "Успех", msg)
+            self.accept()
+        else:
+            QMessageBox.critical(self, "Ошибка БД", msg)
+
+    def update_queue_button(self):
+        if self.editing is None:
+            self.btn_queue.setText("В очередь")
+        else:
+            self.btn_queue.setText(f"Заменить в очереди (#{self.editing + 1})")
+        self.btn_submit.setText(f"Отправить очередь ({len(self.batch)})")
+        self.btn_submit.setEnabled(len(self.batch) > 0)
+
+    def enqueue(self):
+        """Поставить текущую запись в очередь без обращения к БД (или заменить исправляемую)"""
+        collected = self.collect_data()
+        if not collected:
+            return
+        table_name, data = collected
+        if self.editing is None:
+            self.batch.add(table_name, data)
+        else:
+            self.batch.replace(self.editing, table_name, data)
+            self.editing = None
+        self.update_queue_button()
+
+    def fill_form(self, table_name, data):
+        """Показать запись из очереди в форме (обратное collect_data)"""
+        self.table_combo.setCurrentText(table_name)
+        self.build_form()
+        for col_name, value in data.items():
+            widget = self.widgets.get(col_name)
+            if widget is None:
+                continue
+            if getattr(widget, 'is_composite', False):
+                # Значение вида (a,"b c") - поля в формате CSV внутри скобок
+                fields = next(csv.reader([value[1:-1]])) if value else []
+                for (s_name, s_widget), field in zip(widget.sub_widgets.items(), fields + [""] * len(widget.sub_widgets)):
+                    s_widget.setText(field)
+            elif isinstance(widget, QLineEdit):
+                widget.setText("" if value is None else str(value))
+            elif isinstance(widget, QComboBox):
+                if col_name == 'auxiliary_id':
+                    widget.setCurrentIndex(max(widget.findData(value), 0))
+                else:
+                    widget.setCurrentText(str(value))
+            elif isinstance(widget, (QSpinBox, QDoubleSpinBox)):
+                widget.setValue(value)
+            elif isinstance(widget, QDateEdit):
+                widget.setDate(QDate.fromString(value, "yyyy-MM-dd"))
+            elif isinstance(widget, QCheckBox):
+                widget.setChecked(bool(value))
+
+    def submit_queue(self):
+        """Записать всю очередь одной транзакцией"""
+        # После записи номера строк очереди меняются: неисправленная запись просто остается в ней
+        self.editing = None
+        success, msg, failed = self.batch.flush()
+        self.update_queue_button()
+        if failed:
+            # Записанные строки убраны из очереди, ошибочные остались в ней
+            details = "\n".join(f"#{index + 1} ({table}): {error}" for index, table, error in failed[:10])
+            reply = QMessageBox.question(
+                self, "Часть записей не сохранена",
+                f"{msg}\n\n{details}\n\nЗаписи с ошибками остались в очереди ({len(self.batch)}). "
+                "Открыть первую из них в форме для исправления?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes
+            )
+            if reply == QMessageBox.Yes:
+                # Запись остается в очереди, пока ее не заменит исправленная ("Заменить в очереди"):
+                # если закрыть окно, reject предупредит о ней
+                self.fill_form(*self.batch.rows[0])
+                self.editing = 0
+                self.update_queue_button()
+        elif success:
+            QMessageBox.information(self, "Успех", msg)
+            self.accept()
+        else:
+            QMessageBox.critical(self, "Ошибка БД", msg)
+
+    def reject(self):
+        """Перед закрытием предупредить о неотправленной очереди"""
+        if len(self.batch):
+            reply = QMessageBox.question(
+                self,
+                "Подтверждение",
+                f"В очереди {len(self.batch)} неотправленных записей. Закрыть без сохранения?",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+        super().reject()
@@ -1,7 +1,25 @@
+"""
+Точка входа приложения
+
+Замер холодного запуска:
+    python main.py --startup-profile     - отчет о запуске и выход после первой отрисовки
+    DDOS_STARTUP_PROFILE=1 python main.py - тот же отчет в лог, приложение работает дальше
+В отчете - время импорта модулей (включительно, с вложенными), создания
+QApplication и MainWindow и момент первой отрисовки главного окна.
+Полное дерево импортов интерпретатора: python -X importtime main.py
+
+Профиль медленных действий в окнах (см. profiler.py):
+    python main.py --profile      - с самого старта; Ctrl+Shift+P включает и выключает запись
+    DDOS_PROFILE=1 python main.py
+"""
+import os
 import sys
+import time
+import builtins
 import logging
-from PySide6.QtWidgets import QApplication
-from gui import MainWindow
+import threading
+
+STARTED = time.perf_counter()
 
 logging.basicConfig(
     level=logging.INFO,
@@ -11,15 +29,162 @@ logging.basicConfig(
         logging.StreamHandler()
     ]
 )
+
+# Сколько самых долгих импортов показывать в отчете
+PROFILE_TOP_IMPORTS = 15
+
+
+class ImportTimer:
+    """Замеряет время первых импортов модулей через подмену builtins.__import__"""
+
+    def __init__(self):
+        self.records = []  # (модуль, мс включительно, глубина вложенности)
+        self.depth = 0
+        self.original = None
+
+    def install(self):
+        self.original = builtins.__import__
+        builtins.__import__ = self.timed_import
+
+    def uninstall(self):
+        if self.original is not None:
+            builtins.__import__ = self.original
+            self.original = None
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Уже загруженные модули, относительные импорты и импорты фонового
+        # прогрева (WarmUpThread) в отчет не попадают
+        if level or name in sys.modules or threading.current_thread() is not threading.main_thread():
+            return self.original(name, globals, locals, fromlist, level)
+        self.depth += 1
+        t0 = time.perf_counter()
+        try:
+            return self.original(name, globals, locals, fromlist, level)
+        finally:
+            self.depth -= 1
+            self.records.append((name, (time.perf_counter() - t0) * 1000, self.depth))
+
+
+class StartupProfile:
+    """Отметки времени запуска и отчет по ним"""
+
+    def __init__(self, exit_after_paint):
+        self.exit_after_paint = exit_after_paint
+        self.imports = ImportTimer()
+        self.marks = []  # (событие, мс от старта процесса)
+        self.loaded_at_paint = []
+
+    def mark(self, event):
+        self.marks.append((event, (time.perf_counter() - STARTED) * 1000))
+
+    def watch_first_paint(self, app, window):
+        """Поставить фильтр событий на окно и отчитаться после первой отрисовки"""
+        from PySide6.QtCore import QObject, QEvent, QTimer
+        profile = self
+
+        class FirstPaintFilter(QObject):
+            def eventFilter(self, obj, event):
+                if event.type() == QEvent.Paint:
+                    obj.removeEventFilter(self)
+                    profile.mark("первая отрисовка MainWindow")
+                    profile.loaded_at_paint = [name for name in ('db', 'psycopg2', 'numpy') if name in sys.modules]
+                    # Отчет - после того как кадр дорисован
+                    QTimer.singleShot(0, profile.finish)
+                return False
+
+        self.paint_filter = FirstPaintFilter(window)
+        window.installEventFilter(self.paint_filter)
+        self.app = app
+
+    def report(self):
+        lines = ["Профиль запуска (мс от старта main.py):"]
+        for event, ms in self.marks:
+            lines.append(f"  {ms:9.1f}  {event}")
+        top = [r for r in self.imports.records if r[2] == 0]
+        lines.append(f"Импорты верхнего уровня: {sum(r[1] for r in top):.1f} мс")
+        records = sorted(self.imports.records, key=lambda r: r[1], reverse=True)
+        lines.append(f"Самые долгие импорты (включительно), из {len(records)}:")
+        for name, ms, depth in records[:PROFILE_TOP_IMPORTS]:
+            lines.append(f"  {ms:9.1f}  {'  ' * depth}{name}")
+        loaded = self.loaded_at_paint
+        lines.append("Загружены до первой отрисовки: " + (", ".join(loaded) if loaded else "ни db, ни psycopg2, ни numpy"))
+        return "\n".join(lines)
+
+    def finish(self):
+        self.imports.uninstall()
+        text = self.report()
+        if self.exit_after_paint:
+            print(text, file=sys.stderr)
+            self.app.quit()
+        else:
+            logging.info(text)
+
+
+def startup_profile_from_args(argv):
+    """Включить профиль запуска по флагу --startup-profile или DDOS_STARTUP_PROFILE"""
+    if '--startup-profile' in argv:
+        argv.remove('--startup-profile')
+        return StartupProfile(exit_after_paint=True)
+    if os.environ.get('DDOS_STARTUP_PROFILE'):
+        return StartupProfile(exit_after_paint=False)
+    return None
+
+
+def profiling_from_args(argv):
+    """Включить профиль медленных действий по флагу --profile или DDOS_PROFILE"""
+    if '--profile' in argv:
+        argv.remove('--profile')
+        return True
+    return bool(os.environ.get('DDOS_PROFILE'))
+
 #sldhflkdsflkdsjflk
 def main():
-    app = QApplication(sys.argv)
-    
+    profile = startup_profile_from_args(sys.argv)
+    if profile:
+        profile.imports.install()
+    profiling = profiling_from_args(sys.argv)
+
+    # Импорты здесь, а не в начале модуля, - чтобы профиль запуска их видел.
+    # gui не тянет ни db/psycopg2, ни модули диалогов: они грузятся при первом нажатии кнопки
+    from PySide6.QtWidgets import QApplication
+    from gui import MainWindow
+    if profile:
+        profile.mark("импорт PySide6 и gui")
+
+    if profiling:
+        from profiler import ProfilingApplication
+        app = ProfilingApplication(sys.argv)
+    else:
+        app = QApplication(sys.argv)
+    if profile:
+        profile.mark("QApplication создан")
+
     # Создаем главное окно
     window = MainWindow()
+    if profile:
+        profile.mark("MainWindow создан")
+        profile.watch_first_paint(app, window)
+    if profiling:
+        from PySide6.QtGui import QShortcut, QKeySequence
+        from PySide6.QtCore import Qt
+        shortcut = QShortcut(QKeySequence("Ctrl+Shift+P"), window)
+        shortcut.setContext(Qt.ApplicationShortcut)
+        shortcut.activated.connect(lambda: window.statusBar().showMessage(app.toggle(), 10000))
     window.show()
 
-    sys.exit(app.exec())
+    # Метрики Prometheus - только если порт задан в config (по умолчанию выключены)
+    from config import METRICS_PORT
+    if METRICS_PORT:
+        import metrics
+        metrics.start_http_server(METRICS_PORT)
+
+    code = app.exec()
+    if window.watchdog is not None:
+        window.watchdog.stop()
+    # Прогрев ограничен connect_timeout; даем ему закончиться, чтобы поток не убивался на ходу
+    if window.warm_up_thread is not None:
+        window.warm_up_thread.wait()
+    sys.exit(code)
 
 
 if __name__ == '__main__':
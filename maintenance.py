@@ -0,0 +1,174 @@
+"""
+Обслуживание таблиц схемы ddos: ANALYZE после больших записей и VACUUM раздутых таблиц
+
+После generate_test_data, импорта CSV или пачек сервиса приема статистика
+планировщика по experiments устаревает, и следующий get_data строит план по
+старым оценкам. Автоочистка PostgreSQL догонит, но с задержкой, поэтому:
+- db сообщает о каждой записи (rows_written -> note_write); как только в
+  таблицу с последнего нашего ANALYZE записано больше
+  max(MAINTENANCE_ANALYZE_ROWS, MAINTENANCE_ANALYZE_FRACTION * строк таблицы),
+  ANALYZE ставится в очередь - тот же порог, что у check(), иначе большая
+  таблица анализировалась бы каждые MAINTENANCE_ANALYZE_ROWS строк;
+- при запуске и раз в MAINTENANCE_CHECK_INTERVAL секунд check() смотрит
+  pg_stat_user_tables, запоминает размеры таблиц для note_write и ставит
+  в очередь ANALYZE (много изменений с прошлой статистики, в том числе
+  чужими клиентами) и VACUUM (много мертвых строк).
+Очередь разбирает один фоновый поток, команды на таблицу не дублируются.
+Qt не нужен: планировщик работает и в окнах, и в сервисе приема, и в cli.
+"""
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+import db
+from config import (
+    MAINTENANCE_ANALYZE_ROWS, MAINTENANCE_ANALYZE_FRACTION, MAINTENANCE_VACUUM_MIN_DEAD,
+    MAINTENANCE_VACUUM_DEAD_FRACTION, MAINTENANCE_CHECK_INTERVAL
+)
+
+# Сколько последних выполненных команд помнить (для окна обслуживания)
+HISTORY_SIZE = 50
+
+
+def advice(stat):
+    """
+    Что стоит сделать с таблицей по ее статистике (запись get_maintenance_stats).
+
+    Returns:
+        Список команд: "VACUUM" (он же обновит статистику) или "ANALYZE", либо пустой.
+    """
+    tuples = stat['live'] + stat['dead']
+    if stat['dead'] >= MAINTENANCE_VACUUM_MIN_DEAD and stat['dead_ratio'] >= MAINTENANCE_VACUUM_DEAD_FRACTION:
+        return ["VACUUM"]
+    if stat['modified'] >= max(MAINTENANCE_ANALYZE_ROWS, MAINTENANCE_ANALYZE_FRACTION * tuples):
+        return ["ANALYZE"]
+    return []
+
+
+def jobs_for(stats):
+    """Рекомендации по всем узлам без повторов: [(команда, таблица), ...]"""
+    jobs = []
+    for stat in stats:
+        for command in advice(stat):
+            if (command, stat['table']) not in jobs:
+                jobs.append((command, stat['table']))
+    return jobs
+
+
+class MaintenanceScheduler:
+    """Очередь ANALYZE/VACUUM с одним фоновым исполнителем."""
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.queue = []        # [(команда, таблица)] в порядке постановки
+        self.running = None    # (команда, таблица), которая выполняется сейчас
+        self.written = {}      # таблица -> строк записано с последнего ANALYZE по записям
+        self.sizes = {}        # таблица -> строк по последнему check() (сумма по узлам) плюс записанные
+        self.history = deque(maxlen=HISTORY_SIZE)  # (время, команда, таблица, успех, сообщение, мс)
+        self.worker = None
+        self.checker = None
+        self.stopped = threading.Event()
+
+    def analyze_threshold(self, table_name):
+        """Сколько строк записать до ANALYZE; размер таблицы неизвестен до первого check() - MAINTENANCE_ANALYZE_ROWS."""
+        return max(MAINTENANCE_ANALYZE_ROWS, MAINTENANCE_ANALYZE_FRACTION * self.sizes.get(table_name, 0))
+
+    def note_write(self, table_name, rows):
+        """Учесть запись; после analyze_threshold строк - ANALYZE в фоне."""
+        with self.lock:
+            total = self.written.get(table_name, 0) + rows
+            due = total >= self.analyze_threshold(table_name)
+            self.written[table_name] = 0 if due else total
+            if table_name in self.sizes:
+                self.sizes[table_name] += rows
+        if due:
+            logging.info(f"В {table_name} записано {total} строк, статистика будет обновлена")
+            self.schedule("ANALYZE", table_name)
+
+    def schedule(self, command, table_name):
+        """Поставить команду в очередь (если такая же уже ждет или выполняется - не дублировать)."""
+        with self.lock:
+            job = (command, table_name)
+            # VACUUM (ANALYZE) делает и ANALYZE: если он уже ждет, отдельный ANALYZE не нужен
+            if job in self.queue or job == self.running or (command == "ANALYZE" and ("VACUUM", table_name) in self.queue):
+                return
+            self.queue.append(job)
+            self.lock.notify_all()
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.work, name="maintenance", daemon=True)
+                self.worker.start()
+
+    def pending(self):
+        """Команды в очереди и выполняющаяся: [(команда, таблица), ...]"""
+        with self.lock:
+            return ([self.running] if self.running else []) + list(self.queue)
+
+    def work(self):
+        while True:
+            with self.lock:
+                while not self.queue:
+                    self.lock.wait()
+                self.running = command, table_name = self.queue.pop(0)
+            t0 = time.perf_counter()
+            try:
+                success, msg = db.run_maintenance(command, table_name)
+            except Exception as e:
+                success, msg = False, f"{command} {table_name}: {e}"
+            ms = (time.perf_counter() - t0) * 1000
+            if success:
+                logging.info(f"{msg} за {ms:.0f} мс")
+            with self.lock:
+                self.history.appendleft((datetime.now(), command, table_name, success, msg, ms))
+                if success:
+                    self.written.pop(table_name, None)
+                self.running = None
+                self.lock.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """Дождаться, пока очередь опустеет. Returns: True, если дождались."""
+        with self.lock:
+            return self.lock.wait_for(lambda: not self.queue and self.running is None, timeout)
+
+    def check(self):
+        """Просмотреть статистику таблиц и поставить в очередь нужное. Returns: [(команда, таблица), ...]"""
+        # Проверка идет в фоновом потоке - на своих соединениях, не на общих
+        connections = db.open_node_connections()
+        try:
+            stats = db.read_maintenance_stats(connections)
+        finally:
+            for connection in connections:
+                db.close_quietly(connection)
+        sizes = {}
+        for stat in stats:
+            sizes[stat['table']] = sizes.get(stat['table'], 0) + stat['live'] + stat['dead']
+        with self.lock:
+            self.sizes = sizes
+        jobs = jobs_for(stats)
+        for command, table_name in jobs:
+            self.schedule(command, table_name)
+        return jobs
+
+    def start_periodic(self):
+        """Запустить периодическую проверку (если включена в config и еще не запущена)."""
+        if not MAINTENANCE_CHECK_INTERVAL or self.checker is not None:
+            return
+        self.checker = threading.Thread(target=self.check_loop, name="maintenance-check", daemon=True)
+        self.checker.start()
+
+    def check_loop(self):
+        # Первая проверка сразу: до нее note_write не знает размеров таблиц
+        while not self.stopped.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                logging.warning(f"Проверка обслуживания таблиц не удалась: {e}")
+            self.stopped.wait(MAINTENANCE_CHECK_INTERVAL)
+
+    def stop(self):
+        self.stopped.set()
+
+
+# Один планировщик на процесс
+scheduler = MaintenanceScheduler()
@@ -0,0 +1,150 @@
+"""
+Окно обслуживания таблиц: мертвые строки, раздувание, ANALYZE и VACUUM
+"""
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QTableWidget,
+    QTableWidgetItem, QHeaderView, QAbstractItemView, QMessageBox
+)
+from PySide6.QtCore import Qt, QTimer
+from db import get_maintenance_stats, get_last_error
+from maintenance import scheduler, advice, jobs_for
+
+HEADERS = [
+    "Узел", "Таблица", "Живых", "Мертвых", "Мертвых, %", "Изменено после ANALYZE",
+    "Размер", "Раздувание (оценка)", "Последний ANALYZE", "Последний VACUUM", "Рекомендация"
+]
+
+# Как часто обновлять очередь и журнал, пока окно открыто
+REFRESH_INTERVAL_MS = 2000
+
+
+def format_size(size):
+    for unit in ("байт", "КБ", "МБ", "ГБ"):
+        if size < 1024 or unit == "ГБ":
+            return f"{size:.0f} {unit}" if unit == "байт" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_time(moment):
+    return moment.strftime("%d.%m %H:%M:%S") if moment else "никогда"
+
+
+class MaintenanceDialog(QDialog):
+    """
+    Состояние таблиц схемы ddos по pg_stat_user_tables и фоновое обслуживание.
+
+    Раздувание оценивается по доле мертвых строк (размер * мертвые / все),
+    без pgstattuple. Команды уходят в очередь maintenance.scheduler и
+    выполняются в фоне; в журнале внизу - последние выполненные, в том числе
+    автоматические после больших записей.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Обслуживание таблиц")
+        self.setModal(True)
+        self.setMinimumSize(1000, 500)
+
+        layout = QVBoxLayout()
+        self.status_label = QLabel()
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(HEADERS))
+        self.table.setHorizontalHeaderLabels(HEADERS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        btn_refresh = QPushButton("Обновить")
+        btn_refresh.clicked.connect(self.refresh)
+        buttons.addWidget(btn_refresh)
+        btn_analyze = QPushButton("ANALYZE выбранной")
+        btn_analyze.clicked.connect(lambda: self.schedule_selected("ANALYZE"))
+        buttons.addWidget(btn_analyze)
+        btn_vacuum = QPushButton("VACUUM выбранной")
+        btn_vacuum.clicked.connect(lambda: self.schedule_selected("VACUUM"))
+        buttons.addWidget(btn_vacuum)
+        btn_advice = QPushButton("Выполнить рекомендации")
+        btn_advice.clicked.connect(self.schedule_advice)
+        buttons.addWidget(btn_advice)
+        layout.addLayout(buttons)
+
+        layout.addWidget(QLabel("Очередь и журнал обслуживания:"))
+        self.history_label = QLabel()
+        self.history_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.history_label.setAlignment(Qt.AlignTop | Qt.AlignLeft)
+        layout.addWidget(self.history_label)
+
+        btn_close = QPushButton("Закрыть")
+        btn_close.clicked.connect(self.accept)
+        layout.addWidget(btn_close)
+        self.setLayout(layout)
+
+        self.stats = []
+        self.history_timer = QTimer(self)
+        self.history_timer.setInterval(REFRESH_INTERVAL_MS)
+        self.history_timer.timeout.connect(self.render_history)
+        self.history_timer.start()
+        self.refresh()
+
+    def refresh(self):
+        self.stats = get_maintenance_stats()
+        error = get_last_error()
+        if error:
+            self.status_label.setText(f"Статистика не прочитана: {error}")
+        else:
+            self.status_label.setText(f"Таблиц: {len({s['table'] for s in self.stats})}. "
+                                      "Счетчики pg_stat обновляются сервером с задержкой до секунды.")
+        self.render()
+        self.render_history()
+
+    def render(self):
+        self.table.setRowCount(len(self.stats))
+        for row, stat in enumerate(self.stats):
+            values = [
+                str(stat['node']),
+                stat['table'],
+                str(stat['live']),
+                str(stat['dead']),
+                f"{100 * stat['dead_ratio']:.1f}",
+                str(stat['modified']),
+                format_size(stat['size']),
+                format_size(stat['bloat_bytes']),
+                format_time(stat['last_analyze']),
+                format_time(stat['last_vacuum']),
+                ", ".join(advice(stat)) or "—",
+            ]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col in (0, 2, 3, 4, 5, 6, 7):
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, col, item)
+
+    def render_history(self):
+        lines = [f"в работе/в очереди: {command} {table}" for command, table in scheduler.pending()]
+        for moment, command, table, success, msg, ms in list(scheduler.history)[:10]:
+            mark = "" if success else "ОШИБКА: "
+            lines.append(f"{moment:%H:%M:%S}  {mark}{msg} ({ms:.0f} мс)")
+        self.history_label.setText("\n".join(lines) or "Пока ничего не выполнялось")
+
+    def schedule_selected(self, command):
+        rows = {index.row() for index in self.table.selectionModel().selectedRows()}
+        tables = sorted({self.stats[row]['table'] for row in rows})
+        if not tables:
+            QMessageBox.warning(self, "Ошибка", "Выберите таблицу")
+            return
+        for table in tables:
+            scheduler.schedule(command, table)
+        self.render_history()
+
+    def schedule_advice(self):
+        jobs = jobs_for(self.stats)
+        if not jobs:
+            QMessageBox.information(self, "Обслуживание", "Все таблицы в порядке")
+            return
+        for command, table in jobs:
+            scheduler.schedule(command, table)
+        self.render_history()
@@ -0,0 +1,251 @@
+"""
+Метрики приложения в текстовом формате Prometheus
+
+Небольшой реестр без внешних зависимостей: счетчики, датчики и гистограммы
+с метками, безопасные для вызова из нескольких потоков. db.py обновляет их
+при каждом обращении к БД; отдавать их наружу необязательно - HTTP-точка
+/metrics поднимается, только если задан METRICS_PORT (config) или вызван
+start_http_server явно.
+
+Пример настройки Prometheus:
+    scrape_configs:
+      - job_name: ddos_experiments
+        static_configs:
+          - targets: ['127.0.0.1:9108']
+"""
+import time
+import logging
+import threading
+import functools
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from config import METRICS_HOST, METRICS_PORT
+
+# Все созданные метрики в порядке объявления (порядок вывода /metrics)
+REGISTRY = []
+
+# Границы гистограмм длительности по умолчанию, с
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_server = None
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Общая часть: имя, описание, имена меток и значения по наборам меток."""
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}  # кортеж значений меток -> значение
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name}: ожидаются метки {self.label_names}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self):
+        """[(суффикс имени, значения меток, доп. метка или None, значение), ...]"""
+        with self.lock:
+            return [("", key, None, value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(self.label_names, key, extra)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик (имя должно оканчиваться на _total)."""
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+
+class Gauge(Metric):
+    """
+    Текущее значение. callback (если задан) вызывается при каждом чтении
+    /metrics и возвращает {кортеж значений меток: значение}.
+    """
+    type = "gauge"
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        try:
+            values = self.callback()
+        except Exception as e:
+            logging.warning(f"Метрика {self.name} не посчитана: {e}")
+            return []
+        return [("", tuple(str(v) for v in key), None, value) for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам (накопительно, как принято в Prometheus)."""
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        """Контекстный менеджер: замерить длительность блока."""
+        return _Timer(self, labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append(("_bucket", key, ("le", format_value(bound)), count))
+                samples.append(("_sum", key, None, total))
+                samples.append(("_count", key, None, counts[-1]))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def render():
+    """Все метрики реестра в текстовом формате Prometheus."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- метрики слоя данных (обновляет db.py) ---
+
+QUERY_SECONDS = Histogram(
+    "ddos_db_call_duration_seconds", "Длительность функций db.py, включая повторы", ("function",))
+CALL_ERRORS = Counter(
+    "ddos_db_call_exceptions_total", "Исключения, вышедшие из функций db.py", ("function",))
+ROWS_FETCHED = Counter(
+    "ddos_db_rows_fetched_total", "Строк прочитано из БД", ("function",))
+ROWS_INSERTED = Counter(
+    "ddos_db_rows_inserted_total", "Строк записано в БД", ("table", "method"))
+ERRORS = Counter(
+    "ddos_db_errors_total", "Ошибки обращения к БД", ("operation", "kind"))
+CONNECT_WAIT_SECONDS = Histogram(
+    "ddos_db_connect_wait_seconds", "Ожидание соединения: замок и установка подключения", ("target",))
+CONNECTS = Counter(
+    "ddos_db_connects_total", "Попытки открыть соединение", ("target", "result"))
+CACHE_REQUESTS = Counter(
+    "ddos_cache_requests_total", "Обращения к кэшам (каталог схемы, данные окна просмотра)", ("cache", "result"))
+
+
+def instrumented(func):
+    """Декоратор: длительность вызова и вышедшие исключения в метрики по имени функции."""
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            CALL_ERRORS.inc(function=name)
+            raise
+        finally:
+            QUERY_SECONDS.observe(time.perf_counter() - start, function=name)
+    return wrapper
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Опросы Prometheus каждые несколько секунд не засоряют лог
+        pass
+
+
+def start_http_server(port=None, host=None):
+    """
+    Поднять /metrics в фоновом потоке. Без аргументов берет METRICS_HOST/METRICS_PORT;
+    если порт не задан - ничего не делает. Returns: адрес (host, port) или None.
+    """
+    global _server
+    port = METRICS_PORT if port is None else port
+    if not port or _server is not None:
+        return _server.server_address if _server else None
+    _server = ThreadingHTTPServer((host or METRICS_HOST, port), MetricsHandler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Метрики Prometheus: http://{_server.server_address[0]}:{_server.server_address[1]}/metrics")
+    return _server.server_address
@@ -0,0 +1,248 @@
+"""
+Выборочный профилировщик медленных действий в интерфейсе
+
+ProfilingApplication - QApplication, у которой notify (через него проходит
+каждое событие, а значит и каждый слот, вызванный нажатием, таймером или
+сигналом из потока) замеряет время обработки. Пока событие обрабатывается,
+фоновый поток раз в PROFILE_INTERVAL_MS снимает стек главного потока.
+Если обработка заняла больше PROFILE_THRESHOLD_MS, снятые стеки остаются
+в профиле под именем действия, иначе отбрасываются.
+
+Время действия считается без простоя вложенных циклов событий (модальные
+окна) и без вложенных событий - они учитываются как отдельные действия.
+
+Запуск:
+    python main.py --profile     - профилирование с самого старта
+    DDOS_PROFILE=1 python main.py
+Ctrl+Shift+P включает и выключает запись; при выключении и при выходе
+в PROFILE_DIR пишутся:
+    profile-<время>.folded - свернутые стеки для flamegraph.pl / speedscope
+    profile-<время>.txt    - сводка по действиям: сколько раз, сколько мс, на что ушло время
+"""
+import os
+import sys
+import time
+import logging
+import threading
+from datetime import datetime
+from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QAbstractEventDispatcher
+
+from config import PROFILE_THRESHOLD_MS, PROFILE_INTERVAL_MS, PROFILE_DIR
+
+# Куда ушло время: по файлу самого глубокого Python-кадра выборки.
+# Кадр в модуле окна значит, что поток стоял в вызове Qt (или встроенной функции) из этого окна
+CATEGORIES = (
+    ("SQL и psycopg2", ("db.py", "psycopg2")),
+    ("Разбор результата (resultset, numpy)", ("resultset.py", "numpy")),
+    ("Qt и код окон", ("gui.py", "_dialog.py", "PySide6")),
+)
+OTHER_CATEGORY = "Прочее"
+
+# Сколько самых частых функций показывать по каждому действию
+TOP_FUNCTIONS = 5
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def category(filename):
+    for name, markers in CATEGORIES:
+        if any(marker in filename for marker in markers):
+            return name
+    return OTHER_CATEGORY
+
+
+def describe_event(receiver, event):
+    """Имя действия: окно, виджет (с текстом кнопки, если есть) и тип события."""
+    parts = []
+    window = receiver.window() if hasattr(receiver, "window") else None
+    if window is not None and window is not receiver:
+        parts.append(window.windowTitle() or type(window).__name__)
+    name = type(receiver).__name__
+    text = receiver.text() if hasattr(receiver, "text") and callable(receiver.text) else ""
+    if isinstance(text, str) and text:
+        name += f" '{text}'"
+    elif receiver.objectName():
+        name += f" '{receiver.objectName()}'"
+    parts.append(name)
+    return f"{' / '.join(parts)} ({event.type().name})"
+
+
+class Invocation:
+    """Одна обработка события: время, простой, вложенные обработки, выборки стека."""
+    __slots__ = ("name", "started", "idle", "child_busy", "samples")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.idle = 0.0
+        self.child_busy = 0.0
+        self.samples = []  # кортежи меток кадров от корня к листу
+
+
+class ActionStats:
+    """Накопленное по одному действию: медленные вызовы и выборки их стеков."""
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.stacks = {}      # кортеж кадров -> число выборок
+        self.categories = {}  # категория -> число выборок
+        self.functions = {}   # лист стека -> число выборок
+
+
+class ProfilingApplication(QApplication):
+    """
+    QApplication с замером обработки событий.
+
+    Переопределенный notify стоит вызова Python на каждое событие, поэтому
+    этот класс используется только при --profile / DDOS_PROFILE.
+    """
+
+    def __init__(self, argv, enabled=True):
+        super().__init__(argv)
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.stack = []        # активные Invocation, внешняя первой
+        self.idle_since = None
+        self.actions = {}      # имя действия -> ActionStats
+        self.main_thread_id = threading.get_ident()
+        self.notify_code = ProfilingApplication.notify.__code__
+        self.sampling = threading.Event()
+        self.sampler = threading.Thread(target=self.sample_loop, name="ui-profiler", daemon=True)
+        self.sampler.start()
+        dispatcher = QAbstractEventDispatcher.instance()
+        dispatcher.aboutToBlock.connect(self.on_about_to_block)
+        dispatcher.awake.connect(self.on_awake)
+        self.aboutToQuit.connect(self.save)
+
+    # --- замер ---
+
+    def notify(self, receiver, event):
+        if not self.enabled:
+            return super().notify(receiver, event)
+        # Диспетчер glib доставляет события таймеров раньше сигнала awake
+        self.on_awake()
+        invocation = Invocation(describe_event(receiver, event))
+        with self.lock:
+            self.stack.append(invocation)
+        self.sampling.set()
+        try:
+            return super().notify(receiver, event)
+        finally:
+            self.finish(invocation)
+
+    def finish(self, invocation):
+        busy = time.perf_counter() - invocation.started - invocation.idle
+        own_ms = (busy - invocation.child_busy) * 1000
+        with self.lock:
+            self.stack.pop()
+            if self.stack:
+                self.stack[-1].child_busy += busy
+            else:
+                self.sampling.clear()
+        if own_ms >= PROFILE_THRESHOLD_MS:
+            self.record(invocation, own_ms)
+
+    def on_about_to_block(self):
+        # Цикл событий (в том числе модального окна) уснул до следующего события
+        self.idle_since = time.perf_counter()
+        self.sampling.clear()
+
+    def on_awake(self):
+        if self.idle_since is None:
+            return
+        idle = time.perf_counter() - self.idle_since
+        self.idle_since = None
+        with self.lock:
+            for invocation in self.stack:
+                invocation.idle += idle
+            if self.stack:
+                self.sampling.set()
+
+    def sample_loop(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while True:
+            self.sampling.wait()
+            time.sleep(interval)
+            frame = sys._current_frames().get(self.main_thread_id)
+            if frame is None:
+                continue
+            stack = self.walk(frame)
+            with self.lock:
+                if self.stack and self.idle_since is None:
+                    self.stack[-1].samples.append(stack)
+
+    def walk(self, frame):
+        """Кадры от внутреннего notify (не включая) до листа, от корня к листу."""
+        labels = []
+        while frame is not None and frame.f_code is not self.notify_code:
+            labels.append((frame_label(frame), frame.f_code.co_filename))
+            frame = frame.f_back
+        labels.reverse()
+        return tuple(labels)
+
+    def record(self, invocation, own_ms):
+        stats = self.actions.setdefault(invocation.name, ActionStats())
+        stats.calls += 1
+        stats.total_ms += own_ms
+        stats.max_ms = max(stats.max_ms, own_ms)
+        for sample in invocation.samples:
+            key = tuple(label for label, _ in sample)
+            stats.stacks[key] = stats.stacks.get(key, 0) + 1
+            leaf_label, leaf_file = sample[-1] if sample else ("(код Qt)", "PySide6")
+            group = category(leaf_file)
+            stats.categories[group] = stats.categories.get(group, 0) + 1
+            stats.functions[leaf_label] = stats.functions.get(leaf_label, 0) + 1
+        logging.info(f"Медленное действие {own_ms:.0f} мс: {invocation.name}")
+
+    # --- управление и отчет ---
+
+    def toggle(self):
+        """Включить/выключить запись. При выключении профиль сохраняется. Returns: сообщение."""
+        if self.enabled:
+            self.enabled = False
+            path = self.save()
+            return f"Профилирование выключено. {'Профиль: ' + path if path else 'Медленных действий не было'}"
+        self.enabled = True
+        return f"Профилирование включено (порог {PROFILE_THRESHOLD_MS} мс)"
+
+    def summary(self):
+        lines = [f"Медленные действия (дольше {PROFILE_THRESHOLD_MS} мс, выборка раз в {PROFILE_INTERVAL_MS} мс)"]
+        for name, stats in sorted(self.actions.items(), key=lambda item: item[1].total_ms, reverse=True):
+            lines.append("")
+            lines.append(name)
+            lines.append(f"  вызовов: {stats.calls}, всего: {stats.total_ms:.0f} мс, "
+                         f"среднее: {stats.total_ms / stats.calls:.0f} мс, максимум: {stats.max_ms:.0f} мс")
+            samples = sum(stats.categories.values())
+            if not samples:
+                lines.append("  выборок нет (действие короче интервала выборки)")
+                continue
+            for group, count in sorted(stats.categories.items(), key=lambda item: item[1], reverse=True):
+                lines.append(f"  {100 * count / samples:5.1f}%  {group}")
+            lines.append("  чаще всего на вершине стека:")
+            for label, count in sorted(stats.functions.items(), key=lambda item: item[1], reverse=True)[:TOP_FUNCTIONS]:
+                lines.append(f"  {100 * count / samples:5.1f}%  {label}")
+        return "\n".join(lines)
+
+    def save(self):
+        """Записать .folded и .txt в PROFILE_DIR и начать накопление заново. Returns: путь к .txt или None."""
+        if not self.actions:
+            return None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"profile-{datetime.now():%Y%m%d-%H%M%S}")
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            for name, stats in self.actions.items():
+                action = name.replace(";", ",")
+                for stack, count in stats.stacks.items():
+                    f.write(";".join((action,) + stack) + f" {count}\n")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(self.summary() + "\n")
+        self.actions = {}
+        logging.info(f"Профиль действий сохранен: {base}.folded, {base}.txt")
+        return base + ".txt"
+
@@ -0,0 +1,634 @@
+"""
+Колоночный результат запроса
+
+ColumnarResult хранит выборку не списком кортежей psycopg2 (отдельный
+Python-объект на каждую ячейку), а по колонкам в массивах NumPy:
+- целые и логические - int64 / bool;
+- float - float64;
+- numeric с одинаковым числом знаков после запятой - масштабированный int64;
+- timestamp без часового пояса и date - datetime64[us] / datetime64[D];
+- строки и ENUM - словарное кодирование (коды int32 + список значений).
+NULL хранится отдельной маской. Колонки, которые не укладываются ни в один
+тип (jsonb, массивы, timestamptz, смешанные значения), остаются списком.
+
+Снаружи результат ведет себя как список кортежей: len(), индексация,
+срезы и итерация отдают обычные строки, собираемые по требованию.
+
+save/load записывают те же массивы в сжатый .npz (архив старых строк,
+см. retention.py) и читают их обратно без пересборки из кортежей.
+"""
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+
+# Сколько строк забирать из курсора за раз при построении результата
+FETCH_BATCH = 5000
+
+# Словарь строковой колонки упаковывается в буфер, если в нем больше
+# стольких значений и они составляют больше половины строк
+PACK_DICTIONARY_MIN = 1024
+
+INT64_MIN = -(1 << 63)
+INT64_MAX = (1 << 63) - 1
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_DATE = date(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+NAT = INT64_MIN  # представление NaT в datetime64
+
+# Тип массива для каждого вида колонки
+COLUMN_DTYPES = {
+    "int": np.int64,
+    "bool": bool,
+    "float": np.float64,
+    "decimal": np.int64,
+    "timestamp": "datetime64[us]",
+    "date": "datetime64[D]",
+    "string": np.int32,
+}
+
+# Допустимые типы Python для каждого вида колонки
+KIND_TYPES = {
+    "int": {int},
+    "bool": {bool},
+    "float": {float},
+    "decimal": {Decimal},
+    "timestamp": {datetime},
+    "date": {date},
+    "string": {str},
+}
+
+
+def detect_kind(value):
+    """Вид колонки по первому непустому значению."""
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, Decimal):
+        return "decimal" if value.is_finite() else "object"
+    if isinstance(value, datetime):
+        return "timestamp" if value.tzinfo is None else "object"
+    if isinstance(value, date):
+        return "date"
+    if isinstance(value, str):
+        return "string"
+    return "object"
+
+
+class IncompatibleChunk(Exception):
+    """Очередная порция значений не укладывается в выбранный тип колонки."""
+
+
+class Column:
+    """
+    Одна колонка результата.
+
+    Значения добавляются порциями (append), после чего finish() склеивает
+    порции в итоговые массивы. Если порция не подходит под тип колонки,
+    колонка переходит в вид 'object' (обычный список).
+
+    dictionary: заранее известные значения строковой колонки (метки ENUM,
+        уровни критичности, подписи целей). Если колонка действительно
+        строковая, они получают коды 0..n-1 в этом порядке: коды совпадают
+        между разными результатами, а одинаковые значения всех строк
+        указывают на один объект str.
+    """
+
+    def __init__(self, kind=None, dictionary=None):
+        self.kind = kind
+        self.chunks = []
+        self.masks = []
+        self.objects = None
+        self.data = None
+        self.mask = None
+        self.scale = None       # для decimal: число знаков после запятой
+        self.index = {}         # для string: значение -> код
+        self.dictionary = []    # для string: код -> значение
+        self.packed = None      # для string с большим словарем: (UTF-8 буфер, смещения)
+        self.seed = dictionary
+
+    def append(self, values):
+        if self.kind is None:
+            first = next((v for v in values if v is not None), None)
+            if first is None:
+                # Пока одни NULL - тип определим по следующим порциям
+                self.masks.append(np.ones(len(values), dtype=bool))
+                self.chunks.append(None)
+                return
+            self.kind = detect_kind(first)
+            if self.kind == "string" and self.seed:
+                self.dictionary = list(self.seed)
+                self.index = {value: code for code, value in enumerate(self.dictionary)}
+            if self.kind == "object":
+                self.to_objects()
+        if self.kind != "object":
+            try:
+                self.chunks.append(self.encode(values))
+                self.masks.append(np.fromiter((v is None for v in values), dtype=bool, count=len(values)))
+                return
+            except (IncompatibleChunk, TypeError, ValueError, OverflowError):
+                self.to_objects()
+        self.objects.extend(values)
+
+    def encode(self, values):
+        """Закодировать порцию значений в массив вида self.kind."""
+        count = len(values)
+        kind = self.kind
+        # Проверка типов по множеству type(v), а не detect_kind на каждое значение
+        types = set(map(type, values))
+        types.discard(type(None))
+        if not types <= KIND_TYPES[kind]:
+            raise IncompatibleChunk()
+        if kind == "timestamp" and any(v is not None and v.tzinfo is not None for v in values):
+            raise IncompatibleChunk()
+        if kind == "int":
+            return np.fromiter((0 if v is None else v for v in values), dtype=np.int64, count=count)
+        if kind == "bool":
+            return np.fromiter((bool(v) for v in values), dtype=bool, count=count)
+        if kind == "float":
+            return np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=count)
+        if kind == "decimal":
+            return self.encode_decimal(values)
+        # Даты переводим арифметикой: np.array(..., dtype="datetime64") в разы медленнее
+        if kind == "timestamp":
+            return np.fromiter(
+                (NAT if v is None else (v - EPOCH) // MICROSECOND for v in values), dtype=np.int64, count=count
+            ).view("datetime64[us]")
+        if kind == "date":
+            return np.fromiter(
+                (NAT if v is None else (v - EPOCH_DATE).days for v in values), dtype=np.int64, count=count
+            ).view("datetime64[D]")
+        if kind == "string":
+            index = self.index
+            dictionary = self.dictionary
+            codes = np.empty(count, dtype=np.int32)
+            for i, v in enumerate(values):
+                if v is None:
+                    codes[i] = -1
+                    continue
+                code = index.get(v)
+                if code is None:
+                    code = index[v] = len(dictionary)
+                    dictionary.append(v)
+                codes[i] = code
+            return codes
+        raise IncompatibleChunk()
+
+    def encode_decimal(self, values):
+        scaled = np.zeros(len(values), dtype=np.int64)
+        for i, v in enumerate(values):
+            if v is None:
+                continue
+            exponent = v.as_tuple().exponent
+            if self.scale is None:
+                self.scale = -exponent
+            elif -exponent != self.scale:
+                raise IncompatibleChunk()
+            number = int(v.scaleb(self.scale))
+            if not INT64_MIN <= number <= INT64_MAX:
+                raise IncompatibleChunk()
+            scaled[i] = number
+        return scaled
+
+    def to_objects(self):
+        """Перевести уже накопленные порции в обычный список."""
+        objects = []
+        for chunk, mask in zip(self.chunks, self.masks):
+            if chunk is None:
+                objects.extend([None] * len(mask))
+            else:
+                self.data, self.mask = chunk, mask
+                objects.extend(self.decode(0, len(mask)))
+        self.kind = "object"
+        self.chunks, self.masks = [], []
+        self.data = self.mask = None
+        self.index, self.dictionary = {}, []
+        self.objects = objects
+
+    def finish(self):
+        """Склеить порции в итоговые массивы."""
+        if self.kind == "object":
+            self.chunks = self.masks = None
+            return
+        if self.kind is None:
+            # Колонка целиком из NULL
+            self.kind = "object"
+            self.objects = [None] * sum(len(mask) for mask in self.masks)
+            self.chunks = self.masks = None
+            return
+        dtype = COLUMN_DTYPES[self.kind]
+        if self.kind in ("timestamp", "date"):
+            fill = np.datetime64("NaT")
+        else:
+            fill = -1 if self.kind == "string" else 0
+        # Порции из одних NULL (до того, как стал известен тип) заполняем пустышками
+        parts = [
+            chunk if chunk is not None else np.full(len(mask), fill, dtype=dtype)
+            for chunk, mask in zip(self.chunks, self.masks)
+        ]
+        self.data = np.concatenate(parts) if parts else np.array([], dtype=dtype)
+        self.mask = np.concatenate(self.masks) if self.masks else np.array([], dtype=bool)
+        self.chunks = self.masks = None
+        self.index = None  # словарь значений больше не пополняется
+        if self.kind == "string" and len(self.dictionary) > PACK_DICTIONARY_MIN and \
+                len(self.dictionary) * 2 > len(self.data):
+            self.pack_dictionary()
+        self.shrink()
+
+    def shrink(self):
+        """Сузить тип массива до минимально достаточного и убрать пустую маску NULL."""
+        if self.kind in ("int", "decimal", "string") and len(self.data):
+            low, high = int(self.data.min()), int(self.data.max())
+            for dtype in (np.int8, np.int16, np.int32):
+                info = np.iinfo(dtype)
+                if info.min <= low and high <= info.max:
+                    self.data = self.data.astype(dtype)
+                    break
+        if not self.mask.any():
+            self.mask = None
+
+    def pack_dictionary(self):
+        """
+        Уложить словарь почти уникальных строк (имена, описания) в один буфер UTF-8.
+
+        Для таких колонок список str стоит почти столько же, сколько сами
+        строки в кортежах; буфер со смещениями в разы компактнее.
+        """
+        encoded = [value.encode("utf-8") for value in self.dictionary]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        self.packed = (b"".join(encoded), offsets)
+        self.dictionary = None
+
+    def __len__(self):
+        return len(self.objects) if self.kind == "object" else len(self.data)
+
+    def decode(self, start, stop):
+        """Значения строк [start, stop) как обычные Python-объекты."""
+        if self.kind == "object":
+            return self.objects[start:stop]
+        data = self.data[start:stop]
+        if self.kind == "string" and not self.packed:
+            dictionary = self.dictionary
+            return [dictionary[c] if c >= 0 else None for c in data.tolist()]
+        if self.kind == "string":
+            values = self.decode_packed(np.where(data >= 0, data, 0).astype(np.int64))
+        elif self.kind == "decimal":
+            scale = self.scale
+            values = [Decimal(v).scaleb(-scale) for v in data.tolist()]
+        else:
+            # datetime64[us]/[D] .tolist() сразу дает datetime/date (NaT -> None)
+            values = data.tolist()
+        if self.mask is not None:
+            mask = self.mask[start:stop]
+            if mask.any():
+                values = [None if m else v for v, m in zip(values, mask.tolist())]
+        return values
+
+    def value(self, i):
+        return self.decode(i, i + 1)[0]
+
+    def categories(self):
+        """Значения словаря строковой колонки в порядке кодов."""
+        if self.packed:
+            return self.decode_packed(np.arange(len(self.packed[1]) - 1))
+        return list(self.dictionary)
+
+    def decode_packed(self, codes):
+        buffer, offsets = self.packed
+        starts = offsets[codes].tolist()
+        ends = offsets[codes + 1].tolist()
+        return [buffer[a:b].decode("utf-8") for a, b in zip(starts, ends)]
+
+    def code_of(self, value):
+        """Код значения строковой колонки (-1 - NULL или значения нет в словаре)."""
+        if value is None:
+            return -1
+        if self.packed:
+            return next((code for code, item in enumerate(self.categories()) if item == value), -1)
+        if self.index is None:
+            self.index = {item: code for code, item in enumerate(self.dictionary)}
+        return self.index.get(value, -1)
+
+    def take(self, indices):
+        """Новая колонка из строк indices (массив номеров) с тем же словарем."""
+        column = Column(self.kind)
+        if self.kind == "object":
+            column.objects = [self.objects[i] for i in indices.tolist()]
+            return column
+        column.data = self.data[indices]
+        column.mask = self.mask[indices] if self.mask is not None else None
+        column.scale = self.scale
+        column.dictionary = self.dictionary
+        column.packed = self.packed
+        column.index = None
+        return column
+
+    def to_arrays(self, prefix):
+        """
+        Описание колонки (для JSON) и ее массивы для np.savez.
+
+        Колонка вида 'object' сохраняется текстом (str значений, jsonb - JSON):
+        она нужна архиву только для обратной загрузки через COPY, который разберет текст.
+        """
+        meta = {"kind": self.kind, "scale": self.scale, "packed": bool(self.packed)}
+        if self.kind == "object":
+            meta["kind"] = "text"
+            meta["values"] = [None if v is None else json.dumps(v, ensure_ascii=False) if isinstance(v, dict) else str(v)
+                              for v in self.objects]
+            return meta, {}
+        arrays = {prefix: self.data}
+        if self.mask is not None:
+            arrays[prefix + "_mask"] = self.mask
+        if self.packed:
+            arrays[prefix + "_buffer"] = np.frombuffer(self.packed[0], dtype=np.uint8)
+            arrays[prefix + "_offsets"] = self.packed[1]
+        elif self.kind == "string":
+            meta["dictionary"] = self.dictionary
+        return meta, arrays
+
+    @classmethod
+    def from_arrays(cls, meta, arrays, prefix):
+        """Колонка из описания и массивов, сохраненных to_arrays."""
+        if meta["kind"] == "text":
+            column = cls("object")
+            column.objects = meta["values"]
+            return column
+        column = cls(meta["kind"])
+        column.data = arrays[prefix]
+        column.mask = arrays[prefix + "_mask"] if prefix + "_mask" in arrays else None
+        column.scale = meta["scale"]
+        column.index = None
+        if meta["packed"]:
+            column.packed = (arrays[prefix + "_buffer"].tobytes(), arrays[prefix + "_offsets"])
+            column.dictionary = None
+        elif column.kind == "string":
+            column.dictionary = meta["dictionary"]
+        return column
+
+    @property
+    def nbytes(self):
+        if self.kind == "object":
+            return 8 * len(self.objects)
+        return self.data.nbytes + (self.mask.nbytes if self.mask is not None else 0)
+
+
+class ColumnarResult:
+    """
+    Результат запроса по колонкам (см. описание модуля).
+
+    columns: имена колонок; len(result), result[i], result[a:b] и итерация
+    работают как со списком кортежей.
+    """
+
+    def __init__(self, columns, data_columns):
+        self.columns = list(columns)
+        self.data_columns = data_columns
+        self.row_count = len(data_columns[0]) if data_columns else 0
+
+    @classmethod
+    def from_batches(cls, columns, batches, dictionaries=None):
+        """
+        Построить результат из последовательности порций строк.
+
+        dictionaries: {имя колонки: известные значения} для словарного
+            кодирования с заранее заданными кодами (см. Column)
+        """
+        dictionaries = dictionaries or {}
+        data_columns = [Column(dictionary=dictionaries.get(name)) for name in columns]
+        for batch in batches:
+            if not batch:
+                continue
+            for column, values in zip(data_columns, zip(*batch)):
+                column.append(values)
+        for column in data_columns:
+            column.finish()
+        return cls(columns, data_columns)
+
+    @classmethod
+    def from_cursor(cls, cur, batch_size=FETCH_BATCH, dictionaries=None):
+        """
+        Забрать результат курсора порциями fetchmany.
+
+        Одновременно в памяти живут кортежи только одной порции,
+        остальное уже лежит в массивах.
+        """
+        columns = [desc[0] for desc in cur.description] if cur.description else []
+
+        def batches():
+            while True:
+                batch = cur.fetchmany(batch_size)
+                if not batch:
+                    return
+                yield batch
+
+        return cls.from_batches(columns, batches(), dictionaries)
+
+    @classmethod
+    def from_rows(cls, rows, columns, batch_size=FETCH_BATCH, dictionaries=None):
+        """Построить результат из готового списка строк (например, слитого с нескольких узлов)."""
+        batches = (rows[i:i + batch_size] for i in range(0, len(rows), batch_size))
+        return cls.from_batches(columns, batches, dictionaries)
+
+    def __len__(self):
+        return self.row_count
+
+    def __bool__(self):
+        return self.row_count > 0
+
+    def rows(self, start=0, stop=None):
+        """Строки [start, stop) списком кортежей."""
+        stop = self.row_count if stop is None else min(stop, self.row_count)
+        if start >= stop:
+            return []
+        return list(zip(*(column.decode(start, stop) for column in self.data_columns)))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.row_count)
+            if step == 1:
+                return self.rows(start, stop)
+            return [self[i] for i in range(start, stop, step)]
+        if key < 0:
+            key += self.row_count
+        if not 0 <= key < self.row_count:
+            raise IndexError("Номер строки вне результата")
+        return tuple(column.value(key) for column in self.data_columns)
+
+    def __iter__(self):
+        for start in range(0, self.row_count, FETCH_BATCH):
+            yield from self.rows(start, start + FETCH_BATCH)
+
+    def column(self, name):
+        """Значения одной колонки списком."""
+        return self.data_columns[self.columns.index(name)].decode(0, self.row_count)
+
+    def string_column(self, name):
+        column = self.data_columns[self.columns.index(name)]
+        if column.kind != "string":
+            raise ValueError(f"Колонка {name} не закодирована словарем")
+        return column
+
+    def codes(self, name):
+        """Коды словарной колонки (int, -1 - NULL)."""
+        return self.string_column(name).data
+
+    def categories(self, name):
+        """Значения словарной колонки в порядке кодов."""
+        return self.string_column(name).categories()
+
+    def take(self, indices):
+        """Новый результат из строк с номерами indices."""
+        indices = np.asarray(indices, dtype=np.int64)
+        return ColumnarResult(self.columns, [column.take(indices) for column in self.data_columns])
+
+    def filter(self, name, values):
+        """
+        Строки, где колонка name принимает одно из значений values.
+
+        Для словарной колонки значения переводятся в коды один раз,
+        дальше сравниваются только целые числа (np.isin по кодам).
+        """
+        column = self.data_columns[self.columns.index(name)]
+        if column.kind == "string":
+            wanted = [column.code_of(value) for value in values]
+            return self.take(np.flatnonzero(np.isin(column.data, wanted)))
+        wanted = set(values)
+        return self.take([i for i, value in enumerate(self.column(name)) if value in wanted])
+
+    def filter_range(self, name, low=None, high=None):
+        """
+        Строки, где low <= значение колонки name <= high (границы включительно,
+        None - без границы). NULL не проходит. Для чисел и дат - сравнение массивов.
+        """
+        column = self.data_columns[self.columns.index(name)]
+        if column.kind in ("timestamp", "date", "int", "float", "decimal"):
+            data = column.data
+            unit = {"timestamp": "us", "date": "D"}.get(column.kind)
+            keep = np.ones(len(data), dtype=bool)
+            for bound, compare in ((low, np.greater_equal), (high, np.less_equal)):
+                if bound is None:
+                    continue
+                if unit:
+                    bound = np.datetime64(bound, unit)
+                elif column.kind == "decimal":
+                    bound = Decimal(bound).scaleb(column.scale)
+                    bound = float(bound)
+                keep &= compare(data, bound)
+            if column.mask is not None:
+                keep &= ~column.mask
+            return self.take(np.flatnonzero(keep))
+        values = self.column(name)
+        return self.take([
+            i for i, value in enumerate(values)
+            if value is not None and (low is None or value >= low) and (high is None or value <= high)
+        ])
+
+    def sort(self, name, descending=False):
+        """
+        Новый результат, отсортированный по колонке name (устойчиво, NULL в конце).
+
+        Словарная колонка сортируется по рангам значений словаря: строки
+        сравниваются один раз на значение, а не на строку.
+        """
+        column = self.data_columns[self.columns.index(name)]
+        if column.kind == "object":
+            values = column.objects
+            present = sorted((i for i, v in enumerate(values) if v is not None),
+                             key=lambda i: values[i], reverse=descending)
+            return self.take(present + [i for i, v in enumerate(values) if v is None])
+        if column.kind == "string":
+            categories = column.categories()
+            ranks = np.empty(len(categories), dtype=np.int64)
+            ranks[np.argsort(np.array(categories, dtype=object), kind="stable")] = np.arange(len(categories))
+            codes = column.data.astype(np.int64)
+            keys = np.where(codes >= 0, ranks[np.maximum(codes, 0)], 0)
+            nulls = codes < 0
+        else:
+            keys = column.data
+            nulls = column.mask if column.mask is not None else np.zeros(len(keys), dtype=bool)
+            if column.kind in ("timestamp", "date"):
+                keys = keys.view(np.int64)
+        keys = keys.astype(np.float64) if keys.dtype == bool else keys
+        if descending:
+            # Устойчивая сортировка по убыванию: сортируем развернутый порядок и разворачиваем обратно
+            order = np.argsort(keys[::-1], kind="stable")[::-1]
+            order = len(keys) - 1 - order
+        else:
+            order = np.argsort(keys, kind="stable")
+        return self.take(np.concatenate([order[~nulls[order]], order[nulls[order]]]))
+
+    def group_counts(self, name):
+        """Количество строк по значениям словарной колонки: {значение: count}, NULL под ключом None."""
+        column = self.string_column(name)
+        counts = np.bincount(column.data.astype(np.int64) + 1, minlength=len(column.categories()) + 1)
+        result = {value: int(count) for value, count in zip(column.categories(), counts[1:]) if count}
+        if counts[0]:
+            result[None] = int(counts[0])
+        return result
+
+    def group_indices(self, name):
+        """Номера строк по значениям словарной колонки: {значение: массив номеров}."""
+        column = self.string_column(name)
+        codes = column.data.astype(np.int64)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.flatnonzero(np.diff(codes[order])) + 1
+        categories = column.categories()
+        groups = {}
+        for part in np.split(order, bounds):
+            if len(part):
+                code = codes[part[0]]
+                groups[categories[code] if code >= 0 else None] = part
+        return groups
+
+    @property
+    def nbytes(self):
+        """Приблизительный объем данных в памяти, байт."""
+        total = 0
+        for column in self.data_columns:
+            total += column.nbytes
+            if column.packed:
+                total += len(column.packed[0]) + column.packed[1].nbytes
+            elif column.dictionary:
+                total += sum(len(v) for v in column.dictionary)
+        return total
+
+    def save(self, file, **info):
+        """
+        Записать результат в сжатый .npz (np.savez_compressed).
+
+        info - произвольные сведения (JSON), которые вернет load вместе с результатом.
+        """
+        metas, arrays = [], {}
+        for i, column in enumerate(self.data_columns):
+            meta, column_arrays = column.to_arrays(f"c{i}")
+            metas.append(meta)
+            arrays.update(column_arrays)
+        header = {"columns": self.columns, "rows": self.row_count, "data": metas, "info": info}
+        arrays["header"] = np.array(json.dumps(header, ensure_ascii=False, default=str))
+        np.savez_compressed(file, **arrays)
+
+    @staticmethod
+    def read_info(file):
+        """Сведения info из .npz без чтения массивов колонок."""
+        with np.load(file, allow_pickle=False) as arrays:
+            return json.loads(str(arrays["header"]))["info"]
+
+    @classmethod
+    def load(cls, file):
+        """Прочитать .npz, записанный save. Returns: (ColumnarResult, info)"""
+        with np.load(file, allow_pickle=False) as npz:
+            header = json.loads(str(npz["header"]))
+            arrays = {name: npz[name] for name in npz.files if name != "header"}
+        data_columns = [Column.from_arrays(meta, arrays, f"c{i}") for i, meta in enumerate(header["data"])]
+        result = cls(header["columns"], data_columns)
+        result.row_count = header["rows"]
+        return result, header["info"]
+
+    def __repr__(self):
+        return f"<ColumnarResult {self.row_count} строк x {len(self.columns)} колонок>"
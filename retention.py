@@ -0,0 +1,260 @@
+"""
+Хранение experiments: выгрузка старых строк в архив и возврат обратно
+
+Таблица experiments растет без конца, а старые эксперименты нужны редко.
+Политика RETENTION_DAYS (config) задает, сколько дней держать строки каждого
+типа атаки. archive_expired на каждом узле:
+- выбирает просроченные строки пачками по ARCHIVE_FILE_ROWS (по created_at, id);
+- пишет пачку в сжатый колоночный файл ARCHIVE_DIR/*.npz (ColumnarResult.save),
+  сначала во временный файл, с fsync, и только потом переименовывает;
+- лишь после этого удаляет те же id из таблицы пачками по
+  RETENTION_DELETE_BATCH, каждая в своей транзакции - без долгих блокировок.
+Если процесс прервется между записью файла и удалением, строки останутся
+и в таблице, и в архиве; restore такие повторы пропускает.
+
+Архив читается без БД (query_archive) или возвращается в таблицу (restore)
+целыми файлами. file_fdw не используется: архив лежит на диске клиента,
+а сервер PostgreSQL его не видит.
+
+Qt не нужен - команды доступны в cli: archive, archives, archive-query, restore.
+"""
+import os
+import shutil
+import logging
+from datetime import date, datetime, time, timedelta
+
+import psycopg2
+
+import db
+from resultset import ColumnarResult
+from maintenance import scheduler
+from config import RETENTION_DAYS, ARCHIVE_DIR, ARCHIVE_FILE_ROWS, RETENTION_DELETE_BATCH
+
+ARCHIVE_TABLE = "experiments"
+
+# Куда переносятся файлы, строки которых вернули в таблицу
+RESTORED_DIR = "restored"
+
+EXPIRED_SQL = (
+    "SELECT * FROM ddos.experiments WHERE attack_type = %s AND created_at < %s "
+    "ORDER BY created_at, id LIMIT %s"
+)
+EXPIRED_COUNT_SQL = "SELECT count(*) FROM ddos.experiments WHERE attack_type = %s AND created_at < %s"
+DELETE_SQL = "DELETE FROM ddos.experiments WHERE id = ANY(%s)"
+
+
+def cutoffs(policy=None, now=None, attack_types=None):
+    """
+    Границы хранения по политике: {тип атаки: created_at, старше которого строки уходят в архив}.
+    Типы со сроком None (или без срока и без '*') не архивируются.
+    attack_types - метки ENUM; по умолчанию из каталога БД (db.attack_type_labels),
+    чтобы '*' покрывал и типы, добавленные в ENUM после config.ATTACK_TYPES.
+    """
+    policy = RETENTION_DAYS if policy is None else policy
+    now = now or datetime.now()
+    limits = {}
+    for attack_type in db.attack_type_labels() if attack_types is None else attack_types:
+        days = policy.get(attack_type, policy.get('*'))
+        if days is not None:
+            limits[attack_type] = now - timedelta(days=days)
+    return limits
+
+
+def archive_name(rows, node, attack_type):
+    created = rows.column('created_at')
+    return (f"{ARCHIVE_TABLE}_{attack_type}_{min(created):%Y%m%d}-{max(created):%Y%m%d}"
+            f"_n{node}_{datetime.now():%Y%m%d%H%M%S%f}.npz")
+
+
+def write_archive(rows, directory, node, attack_type, cutoff):
+    """Записать пачку в архив надежно (временный файл, fsync, переименование). Returns: путь."""
+    os.makedirs(directory, exist_ok=True)
+    created = rows.column('created_at')
+    path = os.path.join(directory, archive_name(rows, node, attack_type))
+    partial = path + ".part"
+    with open(partial, "wb") as f:
+        rows.save(
+            f, table=ARCHIVE_TABLE, node=node, attack_type=attack_type, rows=len(rows),
+            created_from=min(created).isoformat(), created_to=max(created).isoformat(),
+            cutoff=cutoff.isoformat(), archived_at=datetime.now().isoformat(),
+        )
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+    return path
+
+
+def delete_archived(connection, ids):
+    """Удалить строки по id пачками по RETENTION_DELETE_BATCH (соединение с autocommit). Returns: удалено."""
+    deleted = 0
+    with connection.cursor() as cur:
+        for start in range(0, len(ids), RETENTION_DELETE_BATCH):
+            cur.execute(DELETE_SQL, (ids[start:start + RETENTION_DELETE_BATCH],))
+            deleted += cur.rowcount
+    return deleted
+
+
+def archive_expired(policy=None, directory=ARCHIVE_DIR, dry_run=False, now=None):
+    """
+    Выгрузить в архив и удалить из experiments строки старше срока хранения.
+
+    dry_run - только посчитать, сколько строк ушло бы в архив.
+
+    Returns:
+        (success, msg)
+    """
+    limits = cutoffs(policy, now)
+    if not limits:
+        return True, "Срок хранения не задан ни для одного типа атаки (RETENTION_DAYS)"
+    # Выгрузка долгая: на своих соединениях с autocommit, каждый DELETE фиксируется сразу
+    try:
+        connections = db.open_node_connections()
+    except psycopg2.Error as e:
+        logging.error(f"Архивирование: нет соединения: {e}")
+        return False, f"Нет соединения с БД: {e}"
+    counts = {}    # тип атаки -> строк
+    files = 0
+    deleted = 0
+    try:
+        for node, connection in enumerate(connections):
+            for attack_type, cutoff in limits.items():
+                if dry_run:
+                    with connection.cursor() as cur:
+                        cur.execute(EXPIRED_COUNT_SQL, (attack_type, cutoff))
+                        counts[attack_type] = counts.get(attack_type, 0) + cur.fetchone()[0]
+                    continue
+                while True:
+                    with connection.cursor() as cur:
+                        cur.execute(EXPIRED_SQL, (attack_type, cutoff, ARCHIVE_FILE_ROWS))
+                        rows = ColumnarResult.from_cursor(cur)
+                    if not rows:
+                        break
+                    path = write_archive(rows, directory, node, attack_type, cutoff)
+                    files += 1
+                    deleted += delete_archived(connection, rows.column('id'))
+                    counts[attack_type] = counts.get(attack_type, 0) + len(rows)
+                    logging.info(f"Архив: {len(rows)} строк {attack_type} с узла {node} -> {path}")
+    except (psycopg2.Error, OSError) as e:
+        logging.error(f"Архивирование прервано: {e}")
+        return False, f"Архивирование прервано ({files} файлов, удалено {deleted} строк): {e}"
+    finally:
+        for connection in connections:
+            db.close_quietly(connection)
+
+    details = ", ".join(f"{attack_type}: {count}" for attack_type, count in counts.items() if count)
+    if dry_run:
+        total = sum(counts.values())
+        return True, f"В архив ушло бы {total} строк" + (f" ({details})" if total else "")
+    if deleted:
+        # После массового удаления в таблице много мертвых строк, а статистика устарела
+        scheduler.schedule("VACUUM", ARCHIVE_TABLE)
+    if not files:
+        return True, "Строк старше срока хранения нет"
+    return True, f"В архив выгружено {deleted} строк в {files} файлов ({details}), каталог {directory}"
+
+
+def list_archives(directory=ARCHIVE_DIR):
+    """Файлы архива со сведениями: [(путь, info), ...] по created_from."""
+    if not os.path.isdir(directory):
+        return []
+    archives = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".npz"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            archives.append((path, ColumnarResult.read_info(path)))
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Файл архива {path} не прочитан: {e}")
+    archives.sort(key=lambda item: item[1].get('created_from', ''))
+    return archives
+
+
+def period_end(text):
+    """
+    Конец периода из ISO 8601 (включительно): дата без времени - конец этого
+    дня, иначе строка с датой 30.06 не попала бы в период "по 30.06".
+    """
+    try:
+        return datetime.combine(date.fromisoformat(text), time.max)
+    except ValueError:
+        return datetime.fromisoformat(text)
+
+
+def matching_archives(date_from=None, date_to=None, attack_type=None, directory=ARCHIVE_DIR):
+    """Файлы, чей диапазон created_at пересекается с [date_from, date_to] и тип атаки совпадает."""
+    found = []
+    for path, info in list_archives(directory):
+        if attack_type and info.get('attack_type') != attack_type:
+            continue
+        if date_from and datetime.fromisoformat(info['created_to']) < date_from:
+            continue
+        if date_to and datetime.fromisoformat(info['created_from']) > date_to:
+            continue
+        found.append((path, info))
+    return found
+
+
+def query_archive(date_from=None, date_to=None, attack_type=None, directory=ARCHIVE_DIR):
+    """
+    Строки архива за период (границы включительно) без обращения к БД.
+    Конец периода из даты без времени - см. period_end.
+
+    Файлы разных лет могут отличаться набором колонок (ALTER TABLE между
+    выгрузками) - результат собирается по объединению колонок, недостающие - NULL.
+
+    Returns:
+        ColumnarResult по created_at
+    """
+    columns, parts = [], []
+    for path, info in matching_archives(date_from, date_to, attack_type, directory):
+        result, _ = ColumnarResult.load(path)
+        result = result.filter_range('created_at', date_from, date_to)
+        if attack_type:
+            result = result.filter('attack_type', [attack_type])
+        columns.extend(col for col in result.columns if col not in columns)
+        parts.append(result)
+    rows = []
+    for result in parts:
+        positions = [result.columns.index(col) if col in result.columns else None for col in columns]
+        rows.extend(tuple(None if pos is None else row[pos] for pos in positions) for row in result)
+    return ColumnarResult.from_rows(rows, columns).sort('created_at') if columns else ColumnarResult.from_rows([], [])
+
+
+def restore(date_from=None, date_to=None, attack_type=None, directory=ARCHIVE_DIR):
+    """
+    Вернуть в experiments архивные файлы, пересекающиеся с периодом.
+
+    Возвращаются файлы целиком (а не только строки периода), чтобы архив и
+    таблица не разошлись. Строки, которые уже есть в таблице, пропускаются;
+    колонки, удаленные из таблицы после выгрузки, отбрасываются. Возвращенные
+    файлы переносятся в ARCHIVE_DIR/restored.
+
+    Returns:
+        (success, msg)
+    """
+    archives = matching_archives(date_from, date_to, attack_type, directory)
+    if not archives:
+        return True, "В архиве нет файлов за этот период"
+    current = [col[0] for col in db.get_table_columns(ARCHIVE_TABLE)]
+    if not current:
+        return False, f"Не удалось прочитать колонки {ARCHIVE_TABLE}: {db.get_last_error()}"
+    restored_dir = os.path.join(directory, RESTORED_DIR)
+    total = inserted = 0
+    for path, info in archives:
+        try:
+            result, _ = ColumnarResult.load(path)
+            keep = [i for i, col in enumerate(result.columns) if col in current]
+            columns = [result.columns[i] for i in keep]
+            rows = [tuple(row[i] for i in keep) for row in result]
+            inserted += sum(db.restore_rows(ARCHIVE_TABLE, columns, rows).values())
+            total += len(rows)
+            os.makedirs(restored_dir, exist_ok=True)
+            shutil.move(path, os.path.join(restored_dir, os.path.basename(path)))
+        except (psycopg2.Error, OSError, ValueError) as e:
+            logging.error(f"Ошибка возврата {path}: {e}")
+            error = db.describe_write_error(e) if isinstance(e, psycopg2.Error) else str(e)
+            return False, f"Ошибка возврата {os.path.basename(path)}: {error} (до нее возвращено {inserted} строк)"
+    skipped = total - inserted
+    return True, (f"Возвращено {inserted} строк из {len(archives)} файлов"
+                  + (f", {skipped} уже были в таблице" if skipped else ""))
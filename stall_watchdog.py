@@ -0,0 +1,128 @@
+"""
+Обнаружение зависаний главного потока (цикла событий Qt)
+
+Сторож запускается главным окном после первой отрисовки (см. gui.py);
+выключается в config: WATCHDOG_THRESHOLD_MS = None.
+
+QTimer в главном потоке раз в WATCHDOG_INTERVAL_MS отмечает "пульс".
+Фоновый поток проверяет пульс: если его нет дольше WATCHDOG_THRESHOLD_MS,
+он снимает стек главного потока в этот момент и пишет его в лог. Когда
+пульс возвращается, длительность зависания попадает в гистограмму
+(в лог при выходе и в метрику ddos_ui_stall_seconds, см. metrics.py)
+вместе с местом в коде приложения, где стоял главный поток.
+"""
+import os
+import sys
+import time
+import logging
+import threading
+import traceback
+from PySide6.QtCore import QObject, QTimer
+
+import metrics
+from config import WATCHDOG_THRESHOLD_MS, WATCHDOG_INTERVAL_MS
+
+# Границы корзин гистограммы зависаний, с
+STALL_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Сколько мест с самыми долгими зависаниями показывать в сводке
+TOP_PLACES = 10
+
+STALL_SECONDS = metrics.Histogram(
+    "ddos_ui_stall_seconds", "Зависания главного потока интерфейса", ("place",), buckets=STALL_BUCKETS)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+UNKNOWN_PLACE = "(вне кода приложения)"
+
+
+def app_place(stack):
+    """Самый глубокий кадр из модулей приложения: 'view_dialog.py:load_data'."""
+    for frame in reversed(stack or []):
+        if os.path.dirname(os.path.abspath(frame.filename)) == APP_DIR and frame.name != "<module>":
+            return f"{os.path.basename(frame.filename)}:{frame.name}"
+    return UNKNOWN_PLACE
+
+
+class StallWatchdog(QObject):
+    """
+    Сторож главного потока.
+
+    Стек снимается один раз за зависание - в момент, когда превышен порог;
+    длительность известна, только когда цикл событий снова ожил.
+    """
+
+    def __init__(self, parent=None, threshold_ms=WATCHDOG_THRESHOLD_MS, interval_ms=WATCHDOG_INTERVAL_MS):
+        super().__init__(parent)
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.main_thread_id = threading.get_ident()
+        self.lock = threading.Lock()
+        self.last_beat = time.perf_counter()
+        self.stall_stack = None   # стек текущего зависания (снят потоком-сторожем)
+        self.stalls = []          # (секунды, место)
+        self.stopped = threading.Event()
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.beat)
+        self.thread = threading.Thread(target=self.watch, name="ui-watchdog", daemon=True)
+
+    def start(self):
+        self.last_beat = time.perf_counter()
+        self.timer.start()
+        self.thread.start()
+        logging.info(f"Сторож интерфейса запущен (порог {self.threshold * 1000:.0f} мс)")
+
+    def stop(self):
+        """Остановить сторожа и записать сводку по зависаниям в лог."""
+        self.timer.stop()
+        self.stopped.set()
+        if self.stalls:
+            logging.info(self.summary())
+
+    def beat(self):
+        """Пульс в главном потоке; пропуск больше порога - зависание."""
+        now = time.perf_counter()
+        with self.lock:
+            stall = now - self.last_beat - self.interval
+            self.last_beat = now
+            stack, self.stall_stack = self.stall_stack, None
+        if stall >= self.threshold:
+            self.record(stall, stack)
+
+    def watch(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                silent = time.perf_counter() - self.last_beat - self.interval
+                if self.stall_stack is not None or silent < self.threshold:
+                    continue
+                frame = sys._current_frames().get(self.main_thread_id)
+                self.stall_stack = traceback.extract_stack(frame) if frame is not None else []
+            logging.warning(
+                f"Главный поток не отвечает {silent * 1000:.0f} мс, он сейчас здесь:\n"
+                + "".join(traceback.format_list(self.stall_stack))
+            )
+
+    def record(self, seconds, stack):
+        place = app_place(stack)
+        self.stalls.append((seconds, place))
+        STALL_SECONDS.observe(seconds, place=place)
+        logging.warning(f"Интерфейс завис на {seconds * 1000:.0f} мс: {place}")
+
+    def summary(self):
+        lines = [f"Зависания интерфейса: {len(self.stalls)}, всего {sum(s for s, _ in self.stalls):.1f} с"]
+        lower = self.threshold
+        for bound in STALL_BUCKETS + (float("inf"),):
+            if bound <= lower:
+                continue
+            count = sum(1 for seconds, _ in self.stalls if lower <= seconds < bound)
+            label = f"{lower * 1000:.0f}-{bound * 1000:.0f} мс" if bound != float("inf") else f">= {lower * 1000:.0f} мс"
+            lines.append(f"  {label:<16} {count:>5}  {'#' * min(count, 50)}")
+            lower = bound
+        places = {}
+        for seconds, place in self.stalls:
+            count, total, longest = places.get(place, (0, 0.0, 0.0))
+            places[place] = (count + 1, total + seconds, max(longest, seconds))
+        lines.append("Где стоял главный поток (всего, раз, максимум):")
+        for place, (count, total, longest) in sorted(places.items(), key=lambda item: item[1][1], reverse=True)[:TOP_PLACES]:
+            lines.append(f"  {total * 1000:8.0f} мс {count:>5}  {longest * 1000:8.0f} мс  {place}")
+        return "\n".join(lines)
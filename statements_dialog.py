@@ -0,0 +1,176 @@
+"""
+Окно статистики запросов приложения (pg_stat_statements)
+"""
+import re
+import time
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QPushButton, QComboBox, QLabel,
+    QSpinBox, QCheckBox, QTableWidget, QTableWidgetItem, QMessageBox, QHeaderView
+)
+from PySide6.QtCore import Qt
+from db import get_statement_stats, reset_statement_stats, diff_statement_stats, STATEMENT_TAG
+
+# Порядок сортировки: подпись -> функция ключа по счетчикам запроса
+SORT_KEYS = {
+    "Общее время": lambda s: s['total_ms'],
+    "Среднее время": lambda s: s['total_ms'] / s['calls'] if s['calls'] else 0,
+    "Вызовы": lambda s: s['calls'],
+    "Строки": lambda s: s['rows'],
+    "Промахи буфера": lambda s: s['shared_blks_read'],
+}
+
+HEADERS = ["Запрос", "Вызовов", "Всего, мс", "Среднее, мс", "Строк", "Попадания в буфер, %"]
+
+
+def hit_ratio(stat):
+    """Доля блоков, найденных в shared buffers, в процентах (None - блоков не читали)."""
+    blocks = stat['shared_blks_hit'] + stat['shared_blks_read']
+    return 100.0 * stat['shared_blks_hit'] / blocks if blocks else None
+
+
+def short_query(query):
+    """Текст запроса без метки приложения, в одну строку."""
+    if query.startswith(STATEMENT_TAG.strip()):
+        query = query[len(STATEMENT_TAG.strip()):]
+    return re.sub(r"\s+", " ", query).strip()
+
+
+class StatementsDialog(QDialog):
+    """
+    Топ запросов приложения по pg_stat_statements.
+
+    Показываются только запросы с меткой приложения (STATEMENT_TAG), которую
+    db ставит перед каждым запросом. Снимок запоминает текущие счетчики; с
+    галочкой "Разница со снимком" таблица показывает только то, что
+    выполнилось после него (например, одна генерация тестовых данных).
+    "Сбросить" обнуляет счетчики наших запросов на сервере.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Статистика запросов (pg_stat_statements)")
+        self.setModal(True)
+        self.setMinimumSize(900, 500)
+        self.snapshot = None       # {queryid: счетчики} на момент снимка
+        self.snapshot_at = None
+
+        layout = QVBoxLayout()
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("Сортировка:"))
+        self.sort_combo = QComboBox()
+        self.sort_combo.addItems(list(SORT_KEYS))
+        self.sort_combo.currentIndexChanged.connect(self.refresh)
+        controls.addWidget(self.sort_combo)
+        controls.addWidget(QLabel("Показать:"))
+        self.limit_spin = QSpinBox()
+        self.limit_spin.setRange(5, 500)
+        self.limit_spin.setValue(20)
+        self.limit_spin.valueChanged.connect(self.refresh)
+        controls.addWidget(self.limit_spin)
+        self.diff_check = QCheckBox("Разница со снимком")
+        self.diff_check.setEnabled(False)
+        self.diff_check.toggled.connect(self.refresh)
+        controls.addWidget(self.diff_check)
+        controls.addStretch()
+        layout.addLayout(controls)
+
+        buttons = QHBoxLayout()
+        self.btn_refresh = QPushButton("Обновить")
+        self.btn_refresh.clicked.connect(self.refresh)
+        buttons.addWidget(self.btn_refresh)
+        self.btn_snapshot = QPushButton("Снимок")
+        self.btn_snapshot.clicked.connect(self.take_snapshot)
+        buttons.addWidget(self.btn_snapshot)
+        self.btn_reset = QPushButton("Сбросить счетчики")
+        self.btn_reset.clicked.connect(self.reset)
+        buttons.addWidget(self.btn_reset)
+        layout.addLayout(buttons)
+
+        self.status_label = QLabel()
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(HEADERS))
+        self.table.setHorizontalHeaderLabels(HEADERS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        btn_close = QPushButton("Закрыть")
+        btn_close.clicked.connect(self.accept)
+        layout.addWidget(btn_close)
+        self.setLayout(layout)
+
+        self.refresh()
+
+    def set_available(self, available):
+        for widget in (self.btn_snapshot, self.btn_reset, self.sort_combo, self.limit_spin):
+            widget.setEnabled(available)
+        self.diff_check.setEnabled(available and self.snapshot is not None)
+
+    def refresh(self):
+        success, stats, msg = get_statement_stats()
+        self.set_available(success)
+        if not success:
+            self.table.setRowCount(0)
+            self.status_label.setText(msg)
+            return
+        if self.diff_check.isChecked() and self.snapshot is not None:
+            stats = diff_statement_stats(self.snapshot, stats)
+            window = time.monotonic() - self.snapshot_at
+            msg = f"Запросов после снимка ({window:.0f} с назад): {len(stats)}"
+        self.status_label.setText(msg)
+        self.render(stats)
+
+    def render(self, stats):
+        key = SORT_KEYS[self.sort_combo.currentText()]
+        top = sorted(stats.values(), key=key, reverse=True)[:self.limit_spin.value()]
+        self.table.setRowCount(len(top))
+        for row, stat in enumerate(top):
+            ratio = hit_ratio(stat)
+            mean = stat['total_ms'] / stat['calls'] if stat['calls'] else 0
+            values = [
+                short_query(stat['query']),
+                str(stat['calls']),
+                f"{stat['total_ms']:.1f}",
+                f"{mean:.3f}",
+                str(stat['rows']),
+                f"{ratio:.1f}" if ratio is not None else "—",
+            ]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col == 0:
+                    item.setToolTip(stat['query'])
+                else:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, col, item)
+
+    def take_snapshot(self):
+        success, stats, msg = get_statement_stats()
+        if not success:
+            QMessageBox.critical(self, "Ошибка", msg)
+            return
+        self.snapshot = stats
+        self.snapshot_at = time.monotonic()
+        self.diff_check.setEnabled(True)
+        self.diff_check.setChecked(True)
+        self.refresh()
+
+    def reset(self):
+        reply = QMessageBox.question(
+            self, "Подтверждение",
+            "Обнулить на сервере счетчики pg_stat_statements для запросов приложения?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+        success, msg = reset_statement_stats()
+        if success:
+            # Старый снимок после сброса не с чем сравнивать
+            self.snapshot = None
+            self.diff_check.setChecked(False)
+            self.diff_check.setEnabled(False)
+            self.refresh()
+            self.status_label.setText(msg)
+        else:
+            QMessageBox.critical(self, "Ошибка", msg)
@@ -0,0 +1,166 @@
+"""
+Проверка build_subquery_filter
+
+Переписанные формы (полусоединение, антисоединение, min/max, MATERIALIZED CTE)
+должны отбирать те же строки, что и буквальные EXISTS / ANY / ALL - на
+случайных данных с NULL и пустыми подзапросами.
+
+Нужен PostgreSQL из config.DB_CONFIG со схемой ddos: тест создает в ней
+таблицы test_subquery_* и в конце удаляет. Без сервера или схемы тест
+пропускается.
+
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+import os
+import sys
+import random
+import unittest
+from decimal import Decimal
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+
+import db
+
+SEED = 41
+DATASETS = 10               # наборов данных на каждый тип колонки
+CASES_PER_DATASET = 66      # фильтров на каждый набор: 3 типа * 10 * 66 = 1980 случаев
+
+# Тип колонки -> значения, из которых строятся данные (плюс NULL)
+DOMAINS = {
+    'integer': list(range(-3, 4)),
+    'text': ['a', 'b', 'c', 'd'],
+    'boolean': [True, False],
+}
+MODES = ("EXISTS", "NOT EXISTS", "ANY", "ALL")
+
+
+def outer_table(data_type):
+    return f"test_subquery_outer_{data_type}"
+
+
+def sub_table(data_type):
+    return f"test_subquery_sub_{data_type}"
+
+
+def server_available():
+    try:
+        conn = db.get_connection()
+        return conn is not None and db.schema_exists()
+    except psycopg2.Error:
+        return False
+
+
+@unittest.skipUnless(server_available(), "нет PostgreSQL со схемой ddos (config.DB_CONFIG)")
+class SubqueryFilterEquivalenceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.conn = db.get_connection()
+        cur = cls.conn.cursor()
+        for data_type in DOMAINS:
+            cur.execute(f"DROP TABLE IF EXISTS ddos.{outer_table(data_type)}, ddos.{sub_table(data_type)}")
+            cur.execute(f"CREATE TABLE ddos.{outer_table(data_type)} (id integer PRIMARY KEY, v {data_type})")
+            cur.execute(f"CREATE TABLE ddos.{sub_table(data_type)} (k {data_type}, f integer)")
+        cls.conn.commit()
+        cur.close()
+        db.invalidate_catalog()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.rollback_quietly(cls.conn)
+        cur = cls.conn.cursor()
+        for data_type in DOMAINS:
+            cur.execute(f"DROP TABLE IF EXISTS ddos.{outer_table(data_type)}, ddos.{sub_table(data_type)}")
+        cls.conn.commit()
+        cur.close()
+        db.invalidate_catalog()
+
+    def fill(self, rng, data_type):
+        """Новые случайные строки обеих таблиц (подзапрос бывает пустым)."""
+        domain = DOMAINS[data_type] + [None]
+        cur = self.conn.cursor()
+        cur.execute(f"TRUNCATE ddos.{outer_table(data_type)}, ddos.{sub_table(data_type)}")
+        for i in range(rng.randint(0, 12)):
+            cur.execute(f"INSERT INTO ddos.{outer_table(data_type)} VALUES (%s, %s)", (i, rng.choice(domain)))
+        for _ in range(rng.choice([0, 0, 1, 2, 5, 10])):
+            cur.execute(f"INSERT INTO ddos.{sub_table(data_type)} VALUES (%s, %s)",
+                        (rng.choice(domain), rng.choice([None, 0, 1, 2, 3, 4, 5])))
+        self.conn.commit()
+        cur.close()
+
+    def select_ids(self, data_type, condition):
+        cond_sql, params, ctes = condition
+        with_sql = ""
+        if ctes:
+            with_sql = "WITH " + ", ".join(f'"{name}" AS MATERIALIZED ({sql})' for name, sql, _ in ctes) + " "
+            params = [p for _, _, cte_params in ctes for p in cte_params] + list(params)
+        cur = self.conn.cursor()
+        try:
+            cur.execute(f"{with_sql}SELECT id FROM ddos.{outer_table(data_type)} WHERE {cond_sql}", params)
+            return {row[0] for row in cur.fetchall()}
+        finally:
+            cur.close()
+            self.conn.rollback()
+
+    def literal(self, data_type, mode, operator, filter_operator, filter_value):
+        """Буквальная форма фильтра - эталон."""
+        outer = f"ddos.{outer_table(data_type)}.v"
+        where, params = "", []
+        if filter_value is not None:
+            where, params = f" AND s.f {filter_operator} %s::numeric", [Decimal(filter_value)]
+        source = f"ddos.{sub_table(data_type)} s"
+        if mode in ("EXISTS", "NOT EXISTS"):
+            return f"{mode} (SELECT 1 FROM {source} WHERE s.k = {outer}{where})", params, []
+        return f"{outer} {operator} {mode} (SELECT s.k FROM {source} WHERE TRUE{where})", params, []
+
+    def test_rewrites_match_literal_forms(self):
+        rng = random.Random(SEED)
+        checked = 0
+        for data_type in DOMAINS:
+            for _ in range(DATASETS):
+                self.fill(rng, data_type)
+                for _ in range(CASES_PER_DATASET):
+                    mode = rng.choice(MODES)
+                    operator = rng.choice(db.SUBQUERY_OPERATORS)
+                    filter_operator = rng.choice(db.SUBQUERY_OPERATORS)
+                    # Дробное значение на integer-колонке f проверяет приведение по типу
+                    filter_value = rng.choice([None, "1", "3", "2.5", "0,5"])
+                    # Обе формы полусоединения: прямую и MATERIALIZED CTE
+                    costs = rng.choice([[0, 1], [1, 0]])
+                    with mock.patch.object(db, "explain_filter_cost", side_effect=costs):
+                        rewritten = db.build_subquery_filter(
+                            outer_table(data_type), mode, outer_column="v", sub_table=sub_table(data_type),
+                            sub_column="k", operator=operator, link_column="k", filter_column="f",
+                            filter_operator=filter_operator, filter_value=filter_value,
+                        )
+                    reference = self.literal(data_type, mode, operator, filter_operator,
+                                             filter_value and filter_value.replace(",", "."))
+                    with self.subTest(data_type=data_type, mode=mode, operator=operator,
+                                      filter=(filter_operator, filter_value), sql=rewritten[0]):
+                        self.assertEqual(self.select_ids(data_type, rewritten), self.select_ids(data_type, reference))
+                    checked += 1
+        self.assertEqual(checked, len(DOMAINS) * DATASETS * CASES_PER_DATASET)
+
+    def test_filter_value_bound_by_column_type(self):
+        table = sub_table('integer')
+        self.assertEqual(db.bind_filter_value(table, "f", "2"), ("%s", 2))
+        self.assertEqual(db.bind_filter_value(table, "f", "1.5"), ("%s::numeric", Decimal("1.5")))
+        self.assertEqual(db.bind_filter_value(sub_table('text'), "k", "1.5"), ("%s", "1.5"))
+        with self.assertRaises(ValueError):
+            db.bind_filter_value(table, "f", "abc")
+
+
+class SubqueryFilterShardingTest(unittest.TestCase):
+
+    def test_subquery_on_sharded_table_is_refused(self):
+        with mock.patch.object(db, "DB_SHARDS", [dict(db.DB_CONFIG)]):
+            with self.assertRaises(ValueError):
+                db.build_subquery_filter("вспомогательная", "EXISTS", "id", db.SHARDED_TABLE, link_column="auxiliary_id")
+
+
+if __name__ == "__main__":
+    unittest.main()
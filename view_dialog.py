@@ -0,0 +1,560 @@
+"""
+Окно просмотра данных с фильтрами
+"""
+import time
+from datetime import datetime, time as day_time
+from PySide6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QPushButton, QLineEdit,
+    QComboBox, QTableWidget, QTableWidgetItem, QMessageBox, QDateEdit,
+    QGroupBox, QLabel
+)
+from PySide6.QtCore import QDate, Qt
+import metrics
+from db import get_data, get_table_columns, get_last_error, get_read_connection, build_subquery_filter, quote_ident
+from estimates import get_table_estimates, count_exact, approx_distinct, format_count
+from estimate_thread import EstimateThread
+from config import ATTACK_TYPES, VIEW_CACHE_TTL, COLUMN_LABELS
+
+# Колонки, для которых по умолчанию предлагается оценка числа уникальных значений
+DISTINCT_COLUMNS = ("name", "auxiliary_id")
+
+
+class ViewDialog(QDialog):
+    """
+    Окно для просмотра данных с фильтрами
+    
+    Модальное окно для отображения таблицы с данными
+
+    Последний результат с сервера (ColumnarResult) хранится вместе с фильтрами,
+    по которым он получен. Если новые фильтры только сужают выборку (та же
+    таблица и подзапрос, тип атаки уточняется, период внутри загруженного),
+    а данные не старше VIEW_CACHE_TTL, фильтрация идет локально по массивам,
+    без запроса к БД. Сортировка по клику на заголовок тоже локальная.
+
+    Размер таблиц показывается по оценке сервера (estimates); точный count(*)
+    и оценка числа уникальных значений колонки - по кнопкам, в фоне.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.cache = None           # {'predicate', 'result', 'columns', 'loaded_at'}
+        self.shown = None           # отфильтрованный результат на экране (до сортировки)
+        self.current_table = None
+        self.current_columns = []
+        self.sort_column = None
+        self.sort_descending = False
+        self.table_estimates = get_table_estimates()
+        self.estimate_thread = None
+        self.setWindowTitle("Просмотр данных")
+        self.setModal(True)  # Блокируем родительское окно
+        self.setMinimumSize(800, 500)
+        
+        layout = QVBoxLayout()
+        
+        # Выбор таблицы
+        self.table_selector = QComboBox()
+        self.populate_tables()
+        self.table_selector.currentIndexChanged.connect(self.load_data)
+        layout.addWidget(self.table_selector)
+        
+        # Размер таблицы: оценка сразу, точный подсчет и уникальные значения - в фоне
+        count_layout = QHBoxLayout()
+        self.count_label = QLabel()
+        count_layout.addWidget(self.count_label, 1)
+        self.btn_count = QPushButton("Точное число строк")
+        self.btn_count.clicked.connect(self.count_rows)
+        count_layout.addWidget(self.btn_count)
+        self.distinct_column = QComboBox()
+        count_layout.addWidget(self.distinct_column)
+        self.btn_distinct = QPushButton("Уникальных значений (оценка)")
+        self.btn_distinct.clicked.connect(self.count_distinct)
+        count_layout.addWidget(self.btn_distinct)
+        layout.addLayout(count_layout)
+        self.distinct_label = QLabel()
+        layout.addWidget(self.distinct_label)
+        
+        # Секция фильтров
+        filter_layout = QFormLayout()
+        
+        # Фильтр по типу атаки
+        # Используем те же типы что и в БД
+        self.attack_filter = QComboBox()
+        self.attack_filter.addItem("Все", None)
+        for attack in ATTACK_TYPES:
+            self.attack_filter.addItem(attack, attack)
+        filter_layout.addRow("Тип атаки:", self.attack_filter)
+        
+        # Фильтр по дате начала
+        self.date_from = QDateEdit()
+        self.date_from.setDate(QDate.currentDate().addDays(-30))  # По умолчанию -30 дней
+        self.date_from.setCalendarPopup(True)  # Показываем календарь
+        filter_layout.addRow("Дата от:", self.date_from)
+        
+        # Фильтр по дате окончания
+        self.date_to = QDateEdit()
+        self.date_to.setDate(QDate.currentDate())  # По умолчанию сегодня
+        self.date_to.setCalendarPopup(True)
+        filter_layout.addRow("Дата до:", self.date_to)
+        
+        # Кнопка применения фильтров
+        btn_apply = QPushButton("Применить")
+        btn_apply.clicked.connect(self.load_data)
+        
+        # Кнопка сброса фильтров
+        btn_reset = QPushButton("Сбросить фильтры")
+        btn_reset.clicked.connect(self.reset_filters)
+        
+        # Принудительная загрузка с сервера (мимо кэша)
+        btn_refresh = QPushButton("Обновить с сервера")
+        btn_refresh.clicked.connect(self.refresh_data)
+        
+        btn_layout = QHBoxLayout()
+        btn_layout.addWidget(btn_apply)
+        btn_layout.addWidget(btn_reset)
+        btn_layout.addWidget(btn_refresh)
+        
+        layout.addLayout(filter_layout)
+        layout.addLayout(btn_layout)
+        
+        # Блок подзапросов
+        self.setup_subquery_group(layout)
+        
+        # Таблица для отображения данных
+        self.table = QTableWidget()
+        header = self.table.horizontalHeader()
+        header.setSectionsClickable(True)
+        header.sectionClicked.connect(self.sort_by_column)
+        layout.addWidget(self.table)
+        
+        # Откуда взяты данные: сервер или локальный фильтр
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        
+        # Кнопка закрытия
+        btn_close = QPushButton("Закрыть")
+        btn_close.clicked.connect(self.accept)
+        layout.addWidget(btn_close)
+        
+        self.setLayout(layout)
+        
+        # Загружаем данные при открытии окна
+        self.load_data()
+
+    def reset_filters(self):
+        """Сбросить все фильтры и перезагрузить данные."""
+        self.attack_filter.setCurrentIndex(0)
+        self.date_from.setDate(QDate.currentDate().addDays(-30))
+        self.date_to.setDate(QDate.currentDate())
+        self.subquery_type.setCurrentIndex(0)
+        self.load_data()
+
+    def populate_tables(self):
+        """Заполнить список таблиц для отображения и вернуть первый элемент."""
+        self.table_selector.clear()
+        conn = get_read_connection()
+        tables = []
+        if conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT table_name
+                FROM information_schema.tables
+                WHERE table_schema='ddos' AND table_type='BASE TABLE'
+                ORDER BY table_name
+            """)
+            tables = [row[0] for row in cur.fetchall()]
+            cur.close()
+        if tables:
+            for table in tables:
+                self.table_selector.addItem(self.table_label(table), table)
+            self.table_selector.setCurrentIndex(0)
+            return tables[0]
+        else:
+            self.table_selector.addItem("experiments", "experiments")
+            return "experiments"
+
+    def table_label(self, table):
+        """Имя таблицы в списке с оценкой числа строк."""
+        estimate = self.table_estimates.get(table)
+        return f"{table} ({format_count(estimate)} строк)" if estimate is not None else table
+
+    def show_table_estimate(self, table):
+        estimate = self.table_estimates.get(table)
+        if estimate is None:
+            self.count_label.setText(f"В таблице {table}: оценки нет (таблицу еще не анализировали)")
+        else:
+            self.count_label.setText(f"В таблице {table}: {format_count(estimate)} строк (оценка pg_class)")
+        self.distinct_label.clear()
+
+    def update_distinct_columns(self, columns):
+        self.distinct_column.clear()
+        for col in columns:
+            self.distinct_column.addItem(COLUMN_LABELS.get(col, col), col)
+        for col in DISTINCT_COLUMNS:
+            if col in columns:
+                self.distinct_column.setCurrentIndex(columns.index(col))
+                break
+
+    def start_estimate(self, on_done, func, *args):
+        self.btn_count.setEnabled(False)
+        self.btn_distinct.setEnabled(False)
+        self.estimate_thread = EstimateThread(func, *args, parent=self)
+        self.estimate_thread.done.connect(on_done)
+        self.estimate_thread.start()
+
+    def finish_estimate(self):
+        self.estimate_thread.wait()
+        self.estimate_thread = None
+        self.btn_count.setEnabled(True)
+        self.btn_distinct.setEnabled(True)
+
+    def done(self, result):
+        # Подсчет идет на своих соединениях и мог бы пережить окно - прерываем его
+        if self.estimate_thread is not None:
+            self.estimate_thread.stop()
+            self.estimate_thread = None
+        super().done(result)
+
+    def count_rows(self):
+        """Точный count(*) по всей таблице в фоне."""
+        table = self.table_selector.currentData()
+        self.count_label.setText(f"В таблице {table}: считаем...")
+        self.start_estimate(
+            lambda count, error, ms: self.on_counted(table, count, error, ms),
+            count_exact, f"SELECT * FROM ddos.{quote_ident(table)}"
+        )
+
+    def on_counted(self, table, count, error, ms):
+        self.finish_estimate()
+        if error:
+            self.show_table_estimate(self.current_table)
+            QMessageBox.critical(self, "Ошибка БД", f"Не удалось посчитать строки:\n{error}")
+            return
+        self.table_estimates[table] = count
+        self.table_selector.setItemText(self.table_selector.findData(table), self.table_label(table))
+        if table != self.current_table:
+            return  # пока считали, выбрали другую таблицу
+        self.count_label.setText(f"В таблице {table}: {format_count(count, approximate=False)} строк "
+                                 f"(точно, count(*) за {ms:.0f} мс)")
+
+    def count_distinct(self):
+        """Оценка числа различных значений выбранной колонки (HyperLogLog) в фоне."""
+        table = self.table_selector.currentData()
+        column = self.distinct_column.currentData()
+        if not column:
+            return
+        self.distinct_label.setText(f"{column}: считаем...")
+        self.start_estimate(
+            lambda result, error, ms: self.on_distinct(table, column, result, error, ms),
+            approx_distinct, table, column
+        )
+
+    def on_distinct(self, table, column, result, error, ms):
+        self.finish_estimate()
+        if table != self.current_table:
+            return
+        if error:
+            self.distinct_label.clear()
+            QMessageBox.critical(self, "Ошибка БД", f"Не удалось оценить число значений:\n{error}")
+            return
+        estimate, relative_error = result
+        percent = f"{100 * relative_error:.1f}".replace(".", ",")
+        self.distinct_label.setText(
+            f"{COLUMN_LABELS.get(column, column)}: {format_count(estimate)} различных значений "
+            f"(HyperLogLog, погрешность ±{percent}%, {ms:.0f} мс)"
+        )
+
+    def setup_subquery_group(self, layout):
+        group = QGroupBox("Фильтр с подзапросом")
+        form = QFormLayout()
+        
+        from PySide6.QtWidgets import QHBoxLayout
+        
+        self.subquery_type = QComboBox()
+        self.subquery_type.addItem("Не использовать", None)
+        self.subquery_type.addItem("EXISTS (Существует)", "EXISTS")
+        self.subquery_type.addItem("NOT EXISTS (Не существует)", "NOT EXISTS")
+        self.subquery_type.addItem("ANY (Любой из...)", "ANY")
+        self.subquery_type.addItem("ALL (Каждый из...)", "ALL")
+        form.addRow("Тип фильтра:", self.subquery_type)
+        
+        self.outer_column_combo = QComboBox()
+        form.addRow("Искать по полю:", self.outer_column_combo)
+        
+        self.subquery_operator = QComboBox()
+        self.subquery_operator.addItems(["=", "<>", ">", ">=", "<", "<="])
+        form.addRow("Оператор сравнения:", self.subquery_operator)
+        
+        self.subquery_table_combo = QComboBox()
+        self.subquery_table_combo.currentIndexChanged.connect(self.populate_subquery_columns)
+        form.addRow("Где искать (Таблица):", self.subquery_table_combo)
+        
+        self.subquery_column_combo = QComboBox()
+        form.addRow("Поле подзапроса:", self.subquery_column_combo)
+        
+        self.subquery_link_column_combo = QComboBox()
+        form.addRow("Связующее поле (ID):", self.subquery_link_column_combo)
+        
+        self.subquery_filter_column_combo = QComboBox()
+        form.addRow("Условие (Поле):", self.subquery_filter_column_combo)
+        
+        self.subquery_filter_operator = QComboBox()
+        self.subquery_filter_operator.addItems(["=", "<>", ">", ">=", "<", "<="])
+        form.addRow("Условие (Оператор):", self.subquery_filter_operator)
+        
+        self.subquery_filter_value = QLineEdit()
+        form.addRow("Условие (Значение):", self.subquery_filter_value)
+        
+        group.setLayout(form)
+        layout.addWidget(group)
+        
+        self.populate_subquery_tables()
+        self.subquery_type.currentIndexChanged.connect(self.update_subquery_controls)
+        self.update_subquery_controls()
+
+    def get_schema_tables(self):
+        conn = get_read_connection()
+        if not conn:
+            return []
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT table_name
+                FROM information_schema.tables
+                WHERE table_schema='ddos' AND table_type='BASE TABLE'
+                ORDER BY table_name
+            """)
+            tables = [row[0] for row in cur.fetchall()]
+            cur.close()
+            return tables
+        except Exception:
+            return []
+
+    def populate_subquery_tables(self):
+        tables = self.get_schema_tables()
+        if not tables:
+            tables = ["experiments"]
+        self.subquery_table_combo.blockSignals(True)
+        self.subquery_table_combo.clear()
+        for table in tables:
+            self.subquery_table_combo.addItem(table, table)
+        self.subquery_table_combo.blockSignals(False)
+        self.populate_subquery_columns()
+
+    def populate_subquery_columns(self):
+        table = self.subquery_table_combo.currentData()
+        columns = [col[0] for col in get_table_columns(table)] if table else []
+        combos = [
+            self.subquery_column_combo,
+            self.subquery_link_column_combo,
+            self.subquery_filter_column_combo,
+        ]
+        for combo in combos:
+            combo.clear()
+            for col in columns:
+                combo.addItem(col, col)
+
+    def update_subquery_controls(self):
+        mode = self.subquery_type.currentData()
+        has_filter = mode is not None
+        compare_mode = mode in ("ANY", "ALL")
+        exists_mode = mode in ("EXISTS", "NOT EXISTS")
+        
+        # Общая видимость блока (кроме селектора типа)
+        self.outer_column_combo.setVisible(has_filter and compare_mode)
+        self.subquery_table_combo.setVisible(has_filter)
+        self.subquery_column_combo.setVisible(has_filter and compare_mode)
+        self.subquery_filter_column_combo.setVisible(has_filter)
+        self.subquery_filter_operator.setVisible(has_filter)
+        self.subquery_filter_value.setVisible(has_filter)
+        
+        self.subquery_operator.setVisible(compare_mode)
+        self.subquery_link_column_combo.setVisible(exists_mode)
+        
+        # Обновление лейблов (скрываем строки формы по индексам добавления)
+        layout = self.subquery_type.parent().layout()
+        if layout:
+            # 0: Type (всегда виден)
+            # 1: Outer Column (Искать по полю) -> ANY/ALL
+            # 2: Operator (Оператор сравнения) -> ANY/ALL
+            # 3: Table (Где искать) -> ВСЕГДА при наличии типа
+            # 4: Sub Column (Поле подзапроса) -> ANY/ALL
+            # 5: Link Column (Связующее поле) -> EXISTS
+            # 6: Filter Column (Условие Поле) -> ВСЕГДА при наличии типа
+            # 7: Filter Op (Условие Оператор) -> ВСЕГДА при наличии типа
+            # 8: Filter Val (Условие Значение) -> ВСЕГДА при наличии типа
+            
+            # Сначала скрываем всё кроме типа (0)
+            for i in range(1, layout.rowCount()):
+                layout.setRowVisible(i, False)
+            
+            if has_filter:
+                layout.setRowVisible(3, True) # Table
+                layout.setRowVisible(6, True) # Filter Col
+                layout.setRowVisible(7, True) # Filter Op
+                layout.setRowVisible(8, True) # Filter Val
+                
+                if compare_mode:
+                    layout.setRowVisible(1, True) # Outer Col
+                    layout.setRowVisible(2, True) # Op
+                    layout.setRowVisible(4, True) # Sub Col
+                
+                if exists_mode:
+                    layout.setRowVisible(1, True) # Outer Col (нужен для связи)
+                    layout.setRowVisible(5, True) # Link Col
+
+    def update_outer_columns(self, columns):
+        self.outer_column_combo.clear()
+        for col in columns:
+            self.outer_column_combo.addItem(COLUMN_LABELS.get(col, col), col)
+
+    def subquery_settings(self):
+        """
+        Настройки блока "Фильтр с подзапросом" - аргументы build_subquery_filter
+        (без таблицы) или None. По ним сравнивается кэш: SQL условия строится
+        только при загрузке с сервера.
+        """
+        sub_type = self.subquery_type.currentData()
+        if not sub_type:
+            return None
+        return {
+            'mode': sub_type,
+            'outer_column': self.outer_column_combo.currentData(),
+            'sub_table': self.subquery_table_combo.currentData(),
+            'sub_column': self.subquery_column_combo.currentData(),
+            'operator': self.subquery_operator.currentText(),
+            'link_column': self.subquery_link_column_combo.currentData(),
+            'filter_column': self.subquery_filter_column_combo.currentData(),
+            'filter_operator': self.subquery_filter_operator.currentText(),
+            'filter_value': self.subquery_filter_value.text().strip(),
+        }
+
+    def current_predicate(self):
+        """Текущие фильтры окна в виде словаря (для сравнения с кэшем)."""
+        table = self.table_selector.currentData()
+        if not table:
+            table = self.populate_tables()
+        return {
+            'table': table,
+            'attack_type': self.attack_filter.currentData(),
+            'date_from': self.date_from.date().toPython(),
+            'date_to': self.date_to.date().toPython(),
+            'extra': self.subquery_settings(),
+        }
+
+    @staticmethod
+    def covers(loaded, wanted):
+        """Содержит ли выборка с фильтрами loaded все строки выборки wanted."""
+        return (
+            loaded['table'] == wanted['table']
+            and loaded['extra'] == wanted['extra']
+            and loaded['attack_type'] in (None, wanted['attack_type'])
+            and loaded['date_from'] <= wanted['date_from']
+            and wanted['date_to'] <= loaded['date_to']
+        )
+
+    @staticmethod
+    def apply_local(result, predicate):
+        """Применить к загруженному результату те же фильтры, что get_data на сервере."""
+        if predicate['attack_type'] is not None and 'attack_type' in result.columns:
+            result = result.filter('attack_type', [predicate['attack_type']])
+        if 'created_at' in result.columns:
+            # Границы как в SQL: с 00:00:00 первого дня по 23:59:59 последнего
+            result = result.filter_range(
+                'created_at',
+                datetime.combine(predicate['date_from'], day_time(0, 0, 0)),
+                datetime.combine(predicate['date_to'], day_time(23, 59, 59)),
+            )
+        return result
+
+    def refresh_data(self):
+        """Сбросить кэш и загрузить данные с сервера."""
+        self.cache = None
+        self.load_data()
+
+    def load_data(self):
+        """Загрузить данные из БД с применением фильтров и всегда актуальной структурой столбцов"""
+        predicate = self.current_predicate()
+        cache = self.cache
+        if (cache and time.monotonic() - cache['loaded_at'] < VIEW_CACHE_TTL
+                and self.covers(cache['predicate'], predicate)):
+            metrics.CACHE_REQUESTS.inc(cache="view", result="hit")
+            self.shown = self.apply_local(cache['result'], predicate)
+            self.render(cache['columns'])
+            self.status_label.setText(
+                f"Строк: {len(self.shown)} (отфильтровано локально из {len(cache['result'])} загруженных)"
+            )
+            if not self.shown:
+                QMessageBox.information(self, "Информация", "Данные не найдены. Попробуйте изменить фильтры.")
+            return
+
+        metrics.CACHE_REQUESTS.inc(cache="view", result="miss")
+        table = predicate['table']
+        extra_conditions = None
+        if predicate['extra']:
+            try:
+                condition = build_subquery_filter(table, **predicate['extra'])
+            except ValueError as e:
+                QMessageBox.warning(self, "Фильтр с подзапросом", str(e))
+                return
+            extra_conditions = [condition] if condition else None
+        table_changed = table != self.current_table
+        if table_changed:
+            self.sort_column = None  # сортировка относилась к колонкам другой таблицы
+            self.current_table = table
+        # Подпись цели для auxiliary_id приходит готовой из LEFT JOIN на сервере
+        data = get_data(predicate['attack_type'], predicate['date_from'].isoformat(),
+                        predicate['date_to'].isoformat(), table_name=table,
+                        extra_conditions=extra_conditions, auxiliary_labels=True)
+        # Пустой результат из-за ошибки БД не выдаем за "ничего не найдено"
+        load_error = get_last_error()
+        colinfo = get_table_columns(table)
+        sql_columns = [col[0] for col in colinfo]
+        self.update_outer_columns(sql_columns)
+        if table_changed:
+            self.update_distinct_columns(sql_columns)
+            self.show_table_estimate(table)
+        # Ошибочный результат не кэшируем; список (а не ColumnarResult) - тоже
+        if load_error or not hasattr(data, 'filter'):
+            self.cache = None
+        else:
+            self.cache = {'predicate': predicate, 'result': data, 'columns': sql_columns,
+                          'loaded_at': time.monotonic()}
+        self.shown = data
+        self.render(sql_columns)
+        self.status_label.setText(f"Строк: {len(data) if data else 0} (загружено с сервера)")
+        if load_error:
+            QMessageBox.critical(self, "Ошибка БД", f"Не удалось загрузить данные:\n{load_error}")
+        elif not data:
+            QMessageBox.information(self, "Информация", "Данные не найдены. Попробуйте изменить фильтры.")
+
+    def sort_by_column(self, index):
+        """Клик по заголовку: сортировка на клиенте, повторный клик меняет направление."""
+        if self.shown is None or not hasattr(self.shown, 'sort'):
+            return
+        if self.sort_column == index:
+            self.sort_descending = not self.sort_descending
+        else:
+            self.sort_column = index
+            self.sort_descending = False
+        self.render(self.current_columns)
+
+    def render(self, sql_columns):
+        """Показать self.shown в таблице с учетом выбранной сортировки."""
+        self.current_columns = sql_columns
+        data = self.shown
+        header = self.table.horizontalHeader()
+        if self.sort_column is not None and data and self.sort_column < len(data.columns):
+            data = data.sort(data.columns[self.sort_column], self.sort_descending)
+            header.setSortIndicatorShown(True)
+            header.setSortIndicator(self.sort_column,
+                                    Qt.DescendingOrder if self.sort_descending else Qt.AscendingOrder)
+        else:
+            header.setSortIndicatorShown(False)
+        headers = [COLUMN_LABELS.get(col, col) for col in sql_columns]
+        self.table.setColumnCount(len(sql_columns))
+        self.table.setHorizontalHeaderLabels(headers)
+        self.table.setRowCount(len(data) if data else 0)
+        for row, record in enumerate(data or []):
+            for col, value in enumerate(record):
+                display_value = str(value) if value is not None else ""
+                self.table.setItem(row, col, QTableWidgetItem(display_value))
+        self.table.resizeColumnsToContents()